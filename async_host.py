@@ -0,0 +1,295 @@
+# ==============================================================================
+# HOST ASYNCIO: LỆNH CÓ THỂ await, LUỒNG MẪU / SỰ KIỆN DẠNG async for
+# ==============================================================================
+# Dùng lại toàn bộ phần xử lý của BiomechanicsHost (FrameParser, _handle_bytes,
+# bảng điều phối frame, gom lô DATA, ghi file, capture) nhưng không có luồng đọc riêng:
+# cổng được mở non-blocking và đăng ký loop.add_reader(fd) -> 1 event loop phục vụ
+# nhiều cổng cùng lúc. Cổng không có fileno (Windows, replay) thì đọc bằng task
+# polling nhẹ trên chính event loop.
+#
+#   async with AsyncBiomechanicsHost('/dev/ttyUSB0') as host:
+#       ack = await host.command(CMD_START_MEASURE)
+#       async for block in host.samples():
+#           ...
+import asyncio
+import sys
+import time
+
+import serial
+
+from command_pipeline import CommandError
+from data_layout import DeviceError
+from frame_parser import TYPE_ACK, TYPE_STATUS
+from giao_tiep_protocol import (
+    BiomechanicsHost, BAUD_RATE, READ_CHUNK, RECONNECT_DELAY, RECONNECT_DELAY_MAX,
+    CMD_GET_STATUS, CMD_START_MEASURE, CMD_STOP_MEASURE, config_commands,
+)
+from wire_capture import open_replay_port
+
+POLL_INTERVAL = 0.005       # s, chỉ dùng cho cổng không có fileno
+STREAM_QUEUE_MAX = 256      # khối / sự kiện tối đa chờ trong mỗi hàng đợi subscriber
+
+_END = object()
+
+
+class Subscription:
+    """Hàng đợi riêng của 1 subscriber. Huỷ 1 lần chờ (wait_for hết giờ) không làm mất đăng ký."""
+
+    def __init__(self, queues, maxsize):
+        self._queues = queues
+        self.queue = asyncio.Queue(maxsize)
+        queues.append(self.queue)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.queue is None:
+            raise StopAsyncIteration
+        item = await self.queue.get()
+        if item is _END:
+            self.close()
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        if self.queue is not None:
+            self._queues.remove(self.queue)
+            self.queue = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+class AsyncBiomechanicsHost(BiomechanicsHost):
+    def __init__(self, port, baud=BAUD_RATE, echo=False):
+        super().__init__(port, baud)
+        self.echo = echo
+        self.loop = None
+        self._fd = None
+        self._poll_task = None
+        self._reconnect_task = None
+        self._timer = None          # call_later kiểm tra timeout của self.commands
+        self._sample_queues = []
+        self._event_queues = []
+        self.dropped_blocks = 0
+        self.dropped_events = 0
+        # Sau handler nội bộ (đã khớp ACK / cập nhật self.status) mới phát ra hàng đợi sự kiện
+        self.subscribe_frame(TYPE_ACK, lambda ack: self._publish_event(("ack", ack)))
+        self.subscribe_frame(TYPE_STATUS, lambda status: self._publish_event(("status", status)))
+
+    # --- MỞ / ĐÓNG ---
+    def _open_port(self):
+        replay = open_replay_port(self.port)
+        if replay is not None:
+            replay.timeout = 0
+            return replay
+        return serial.Serial(self.port, self.baud, timeout=0)
+
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        self.ser = self._open_port()
+        self.running = True
+        self._attach()
+        return self
+
+    async def close(self):
+        self.running = False
+        self._detach()
+        for task in (self._poll_task, self._reconnect_task):
+            if task is not None:
+                task.cancel()
+        self._poll_task = self._reconnect_task = None
+        self.stop_recording()
+        self.stop_capture()
+        if self.ser is not None and self.ser.is_open:
+            self.ser.close()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.commands.cancel_all()
+        for q in self._sample_queues + self._event_queues:
+            self._put(q, _END, force=True)
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _attach(self):
+        try:
+            self._fd = self.ser.fileno()
+        except (AttributeError, OSError, serial.SerialException):
+            self._fd = None
+        if self._fd is not None:
+            self.loop.add_reader(self._fd, self._on_readable)
+        else:
+            self._poll_task = self.loop.create_task(self._poll_loop())
+
+    def _detach(self):
+        if self._fd is not None:
+            self.loop.remove_reader(self._fd)
+            self._fd = None
+
+    # --- ĐỌC ---
+    def _on_readable(self):
+        try:
+            data = self.ser.read(max(1, min(self.ser.in_waiting, READ_CHUNK)))
+        except (serial.SerialException, OSError) as e:
+            self._start_reconnect(e)
+            return
+        if data:
+            self._handle_bytes(data, time.perf_counter())
+
+    async def _poll_loop(self):
+        while self.running:
+            try:
+                n = self.ser.in_waiting
+                data = self.ser.read(min(n, READ_CHUNK)) if n else b''
+            except (serial.SerialException, OSError) as e:
+                self._poll_task = None
+                self._start_reconnect(e)
+                return
+            if data:
+                self._handle_bytes(data, time.perf_counter())
+            # Luôn nhường event loop để subscriber kịp lấy khối (replay có thể luôn có sẵn dữ liệu)
+            await asyncio.sleep(0 if data else POLL_INTERVAL)
+
+    def _start_reconnect(self, error):
+        self._detach()
+        if self.running and self._reconnect_task is None:
+            self._reconnect_task = self.loop.create_task(self._reconnect_async(error))
+
+    async def _reconnect_async(self, error):
+        if self.echo:
+            sys.stdout.write(f"\n>> [ERROR] Mat ket noi {self.port}: {error}. Dang ket noi lai...\n")
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+        self.parser.reset()
+        delay = RECONNECT_DELAY
+        while self.running:
+            await asyncio.sleep(delay)
+            try:
+                self.ser = self._open_port()
+            except (serial.SerialException, OSError):
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+                continue
+            self.reconnects += 1
+            self._reconnect_task = None
+            self._attach()
+            return
+
+    # --- LỆNH ---
+    async def command(self, cmd_id, args=b'', timeout=None, check=True):
+        """Gửi COMMAND và chờ ACK cùng (CmdID, Seq), có gửi lại khi mất ACK. Trả về Ack.
+
+        check=True: ACK khác OK -> CommandError. Hết lượt thử -> CommandTimeout.
+        """
+        ack = await self._submit(cmd_id, args, timeout)
+        if check and not ack.ok:
+            raise CommandError(ack)
+        return ack
+
+    async def configure(self, rates=None, bits=None, active_map=None, n_sensors=None, check=True):
+        """Gửi cả loạt lệnh cấu hình cùng lúc rồi chờ đủ ACK (xem BiomechanicsHost.configure)."""
+        acks = await asyncio.gather(*(self._submit(cmd_id, args) for cmd_id, args in
+                                      config_commands(rates, bits, active_map, n_sensors)))
+        if check:
+            for ack in acks:
+                if not ack.ok:
+                    raise CommandError(ack)
+        return list(acks)
+
+    def _submit(self, cmd_id, args=b'', timeout=None):
+        future = asyncio.wrap_future(self.submit_command(cmd_id, args, timeout), loop=self.loop)
+        self._arm_timer()
+        return future
+
+    def _arm_timer(self):
+        # 1 call_later cho cả bảng lệnh, luôn đặt theo deadline gần nhất
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        deadline = self.commands.poll()
+        if deadline is not None:
+            self._timer = self.loop.call_later(max(0.0, deadline - time.monotonic()), self._arm_timer)
+
+    # --- LUỒNG MẪU / SỰ KIỆN ---
+    def samples(self, maxsize=STREAM_QUEUE_MAX):
+        """async for block in host.samples(): SampleBlock theo thứ tự nhận (đăng ký ngay khi gọi)."""
+        return Subscription(self._sample_queues, maxsize)
+
+    def events(self, maxsize=STREAM_QUEUE_MAX):
+        """async for kind, obj in host.events(): ("status", DeviceStatus) | ("error", DeviceError)
+        | ("loss", SampleLoss) | ("ack", Ack)."""
+        return Subscription(self._event_queues, maxsize)
+
+    def _put(self, q, item, force=False):
+        try:
+            q.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            if not force:
+                return False
+            q.get_nowait()  # bỏ phần tử cũ nhất để chắc chắn có chỗ cho tín hiệu kết thúc
+            q.put_nowait(item)
+            return True
+
+    def _publish_event(self, event):
+        for q in self._event_queues:
+            if not self._put(q, event):
+                self.dropped_events += 1
+
+    # --- MÓC VÀO XỬ LÝ FRAME CỦA HOST ĐỒNG BỘ ---
+    def _on_event(self, event):
+        super()._on_event(event)
+        self._publish_event(("error" if isinstance(event, DeviceError) else "loss", event))
+
+    def _on_block(self, block):
+        super()._on_block(block)
+        for q in self._sample_queues:
+            if not self._put(q, block):
+                self.dropped_blocks += 1
+
+    def get_link_stats(self):
+        stats = super().get_link_stats()
+        stats["dropped_blocks"] = self.dropped_blocks
+        stats["dropped_events"] = self.dropped_events
+        return stats
+
+
+# ==============================================================================
+# CHẠY THỬ: python async_host.py PORT1 [PORT2 ...] (mỗi cổng đo 5 giây)
+# ==============================================================================
+async def _demo_device(port, seconds=5.0):
+    async with AsyncBiomechanicsHost(port) as host:
+        print(f">> [{port}] {await host.command(CMD_GET_STATUS)}")
+        await host.command(CMD_START_MEASURE)
+        frames = 0
+        t_end = time.monotonic() + seconds
+        async with host.samples() as samples:
+            try:
+                while True:
+                    block = await asyncio.wait_for(samples.__anext__(), max(0.0, t_end - time.monotonic()))
+                    frames += len(block)
+            except (asyncio.TimeoutError, StopAsyncIteration):
+                pass
+        await host.command(CMD_STOP_MEASURE)
+        print(f">> [{port}] {frames} frame | {host.get_link_stats()}")
+
+
+async def _demo(ports):
+    await asyncio.gather(*(_demo_device(p) for p in ports))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Cach dung: python async_host.py <port> [port ...]")
+        sys.exit(1)
+    asyncio.run(_demo(sys.argv[1:]))
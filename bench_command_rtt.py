@@ -0,0 +1,63 @@
+# ==============================================================================
+# BENCHMARK THỜI GIAN KHỨ HỒI LỆNH (COMMAND gửi đi -> nhận ACK) QUA PTY (LINUX)
+# Chạy: python bench_command_rtt.py
+# ==============================================================================
+import statistics
+import threading
+import time
+
+from device_sim import SimulatedDevice
+from frame_parser import TYPE_ACK
+from giao_tiep_protocol import BiomechanicsHost, CMD_GET_STATUS
+
+
+class _RttHost(BiomechanicsHost):
+    def __init__(self, port, baud, poll_interval=None):
+        super().__init__(port, baud, poll_interval)
+        self.echo = False
+        self.ack_event = threading.Event()
+        self.subscribe_frame(TYPE_ACK, lambda ack: self.ack_event.set())
+
+
+def measure_rtt(port, n=200, poll_interval=None, timeout=1.0):
+    """Gửi n lệnh GET_STATUS tuần tự, trả về list RTT (giây)."""
+    host = _RttHost(port, 115200, poll_interval)
+    host.ser = host._open_port()
+    host.start_reading()
+    rtts = []
+    try:
+        for _ in range(n):
+            host.ack_event.clear()
+            t0 = time.perf_counter()
+            host.send_command(CMD_GET_STATUS)
+            if host.ack_event.wait(timeout):
+                rtts.append(time.perf_counter() - t0)
+    finally:
+        host.running = False
+        host.read_thread.join()
+        host.ser.close()
+    return rtts
+
+
+def summarize(rtts):
+    rtts = sorted(rtts)
+    if not rtts:
+        return {"count": 0}
+    return {
+        "count": len(rtts),
+        "mean_ms": statistics.fmean(rtts) * 1e3,
+        "p50_ms": rtts[len(rtts) // 2] * 1e3,
+        "p99_ms": rtts[min(len(rtts) - 1, int(len(rtts) * 0.99))] * 1e3,
+        "max_ms": rtts[-1] * 1e3,
+    }
+
+
+if __name__ == "__main__":
+    device = SimulatedDevice()
+    try:
+        for name, poll in (("poll 5 ms (cu)", 0.005), ("event-driven", None)):
+            res = summarize(measure_rtt(device.port, poll_interval=poll))
+            print(f"{name:<16} n={res['count']:<4} mean={res['mean_ms']:.3f} ms  "
+                  f"p50={res['p50_ms']:.3f} ms  p99={res['p99_ms']:.3f} ms  max={res['max_ms']:.3f} ms")
+    finally:
+        device.close()
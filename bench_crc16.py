@@ -0,0 +1,78 @@
+# ==============================================================================
+# MICRO-BENCHMARK CRC16: bản cũ (8 vòng/byte) vs bảng tra vs crc_hqx
+# Chạy: python bench_crc16.py
+# ==============================================================================
+import os
+import struct
+import time
+
+import crc16
+
+
+def calculate_crc16_legacy(data: bytes) -> int:
+    # Bản gốc trong giao_tiep_protocol.py (giữ lại để so sánh tốc độ)
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= (byte << 8)
+        for _ in range(8):
+            if (crc & 0x8000):
+                crc = (crc << 1) ^ 0x1021
+            else:
+                crc <<= 1
+        crc &= 0xFFFF
+    return crc
+
+
+def _make_frame(payload):
+    body = struct.pack('<BBH', 0x01, 0x02, len(payload)) + payload
+    return b'\xA5\x5A' + body + struct.pack('<H', crc16.calculate_crc16(body))
+
+
+def _bytes_per_sec(fn, data, min_time=0.2):
+    loops = 0
+    t0 = time.perf_counter()
+    while True:
+        fn(data)
+        loops += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            return loops * len(data) / elapsed
+
+
+def bench_crc(sizes=(10, 148, 4096), min_time=0.2):
+    """Trả về dict {tên: {size: bytes/s}} cho từng cách tính CRC."""
+    impls = {
+        'legacy': calculate_crc16_legacy,
+        'table': lambda d: crc16.update_table(crc16.CRC16_INIT, d),
+        'update': crc16.calculate_crc16,
+    }
+    results = {}
+    for name, fn in impls.items():
+        results[name] = {}
+        for size in sizes:
+            data = os.urandom(size)
+            assert fn(data) == calculate_crc16_legacy(data)
+            results[name][size] = _bytes_per_sec(fn, data, min_time)
+    return results
+
+
+def bench_verify_frames(n_frames=10000, payload_len=6, min_time=0.2):
+    """Tốc độ kiểm tra CRC theo lô (frame/s)."""
+    frames = [_make_frame(os.urandom(payload_len)) for _ in range(n_frames)]
+    assert all(crc16.verify_frames(frames))
+    loops = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < min_time:
+        crc16.verify_frames(frames)
+        loops += 1
+    return loops * n_frames / (time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    res = bench_crc()
+    print(f"{'impl':<8} {'size':>6} {'MB/s':>10} {'x legacy':>9}")
+    for name, by_size in res.items():
+        for size, bps in by_size.items():
+            ratio = bps / res['legacy'][size]
+            print(f"{name:<8} {size:>6} {bps / 1e6:>10.2f} {ratio:>8.1f}x")
+    print(f"verify_frames (DATA 6B): {bench_verify_frames():,.0f} frame/s")
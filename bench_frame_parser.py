@@ -0,0 +1,80 @@
+# ==============================================================================
+# BENCHMARK FRAME PARSER: vòng đọc cũ (bytes += / cắt lại) vs FrameParser
+# Chạy: python bench_frame_parser.py
+# ==============================================================================
+import os
+import random
+import struct
+import time
+
+import crc16
+from frame_parser import FrameParser, build_frame, SOF, TYPE_DATA, TYPE_STATUS, TYPE_ACK
+
+
+def make_stream(n_frames=20000, n_channels=1, noise_every=0, seed=1):
+    """Sinh luồng byte gồm chủ yếu DATA, xen STATUS/ACK và (tuỳ chọn) rác để test resync."""
+    rnd = random.Random(seed)
+    out = bytearray()
+    for i in range(n_frames):
+        if i % 1000 == 0:
+            out += build_frame(TYPE_STATUS, bytes(144))
+        elif i % 500 == 0:
+            out += build_frame(TYPE_ACK, bytes([0x01, i & 0xFF, 0x00]))
+        else:
+            samples = struct.pack(f'<{n_channels}H', *(rnd.randrange(65536) for _ in range(n_channels)))
+            out += build_frame(TYPE_DATA, struct.pack('<I', i) + samples)
+        if noise_every and i % noise_every == 0:
+            out += os.urandom(5)
+    return bytes(out)
+
+
+def legacy_parse(stream, chunk_size):
+    # Vòng lặp cũ của _reader_loop (bytes bất biến, tạo 2 object mới mỗi frame)
+    buffer = b''
+    count = 0
+    for i in range(0, len(stream), chunk_size):
+        buffer += stream[i:i + chunk_size]
+        while len(buffer) >= 6:
+            sof_index = buffer.find(SOF)
+            if sof_index == -1: buffer = b''; break
+            if sof_index > 0: buffer = buffer[sof_index:]
+            if len(buffer) < 6: break
+            payload_len = struct.unpack_from('<H', buffer, 4)[0]
+            total_len = 6 + payload_len + 2
+            if len(buffer) < total_len: break
+            frame = buffer[:total_len]
+            buffer = buffer[total_len:]
+            if crc16.verify_frame(frame):
+                count += 1
+    return count
+
+
+def parser_parse(stream, chunk_size):
+    parser = FrameParser()
+    count = 0
+    view = memoryview(stream)
+    for i in range(0, len(stream), chunk_size):
+        for _ in parser.feed(view[i:i + chunk_size]):
+            count += 1
+    return count
+
+
+def bench_parse(fn, stream, chunk_size, min_time=0.5):
+    """Trả về (frame/s, MB/s)."""
+    loops = 0
+    frames = 0
+    t0 = time.perf_counter()
+    while True:
+        frames += fn(stream, chunk_size)
+        loops += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            return frames / elapsed, loops * len(stream) / elapsed / 1e6
+
+
+if __name__ == "__main__":
+    stream = make_stream()
+    for chunk_size in (64, 4096, 65536):
+        for name, fn in (('legacy', legacy_parse), ('FrameParser', parser_parse)):
+            fps, mbps = bench_parse(fn, stream, chunk_size)
+            print(f"{name:<12} chunk={chunk_size:>6}  {fps:>12,.0f} frame/s  {mbps:>7.2f} MB/s")
@@ -0,0 +1,119 @@
+# ==============================================================================
+# BENCHMARK PHÁT LUỒNG QUA SHARED MEMORY: ĐỘ TRỄ / KHỐI VÀ THÔNG LƯỢNG VỚI 1, 4, 8 SUBSCRIBER
+# Chạy: python bench_shm_stream.py
+# ==============================================================================
+# - Độ trễ: publisher phát khối 64 mẫu x 8 kênh đều 1000 khối/s, pc_time = time.time()
+#   lúc phát; subscriber đo time.time() - pc_time của mẫu cuối khi đọc được (gồm cả
+#   chu kỳ polling POLL_INTERVAL).
+# - Thông lượng: publisher phát liên tục khối 256 mẫu nhanh nhất có thể, đếm số mẫu
+#   mỗi subscriber nhận được (và số mẫu bị ghi đè) trong thời gian đó.
+import multiprocessing as mp
+import statistics
+import time
+
+import numpy as np
+
+from data_layout import DataLayout
+from sample_block import SampleBlock
+from shm_stream import Publisher, Subscriber
+
+N_CHANNELS = 8
+LATENCY_BLOCKS = 2000
+LATENCY_BLOCK_LEN = 64
+LATENCY_RATE = 1000.0       # khối/s
+THROUGHPUT_SECONDS = 2.0
+THROUGHPUT_BLOCK_LEN = 256
+
+
+def _subscriber_main(name, ready, stop, results):
+    sub = Subscriber(name)
+    ready.set()
+    latencies = []
+    samples = 0
+    total = 0
+    while not stop.is_set():
+        if not sub.wait(timeout=0.05):
+            continue
+        window = sub.read()
+        if not len(window):
+            continue
+        t_pub = float(window.pc_time[-1])
+        total = int(window.raw.sum(dtype=np.uint64))  # chạm vào toàn bộ dữ liệu như 1 consumer thật
+        if sub.check(window):
+            latencies.append(time.time() - t_pub)
+            samples += len(window)
+    results.put({"latencies": latencies, "samples": samples, "lost": sub.lost, "checksum": total})
+    sub.close()
+
+
+def _make_blocks(block_len):
+    layout = DataLayout(tuple(range(N_CHANNELS)), (16,) * N_CHANNELS)
+    ts = np.arange(block_len, dtype=np.uint32)
+    raw = np.random.default_rng(0).integers(0, 1 << 16, (block_len, N_CHANNELS), dtype=np.uint32)
+    return SampleBlock.from_raw(layout, ts, raw, 0.0)
+
+
+def _run(n_subs, phase):
+    ctx = mp.get_context("spawn")
+    pub = Publisher(capacity=1 << 16)
+    stop = ctx.Event()
+    results = ctx.Queue()
+    readies = [ctx.Event() for _ in range(n_subs)]
+    procs = [ctx.Process(target=_subscriber_main, args=(pub.name, r, stop, results)) for r in readies]
+    for p in procs:
+        p.start()
+    for r in readies:
+        r.wait()
+    published = 0
+    t0 = time.perf_counter()
+    if phase == "latency":
+        block = _make_blocks(LATENCY_BLOCK_LEN)
+        for k in range(LATENCY_BLOCKS):
+            due = t0 + k / LATENCY_RATE
+            while time.perf_counter() < due:
+                pass
+            block.pc_time = time.time()
+            pub.write_block(block)
+            published += len(block)
+    else:
+        block = _make_blocks(THROUGHPUT_BLOCK_LEN)
+        while time.perf_counter() - t0 < THROUGHPUT_SECONDS:
+            block.pc_time = time.time()
+            pub.write_block(block)
+            published += len(block)
+    elapsed = time.perf_counter() - t0
+    time.sleep(0.1)
+    stop.set()
+    reports = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    pub.close()
+    return published, elapsed, reports
+
+
+def bench(subscriber_counts=(1, 4, 8)):
+    rows = []
+    for n in subscriber_counts:
+        _, _, reports = _run(n, "latency")
+        lat = sorted(x for r in reports for x in r["latencies"])
+        published, elapsed, reports_t = _run(n, "throughput")
+        received = [r["samples"] for r in reports_t]
+        rows.append({
+            "subscribers": n,
+            "lat_median_us": statistics.median(lat) * 1e6 if lat else float('nan'),
+            "lat_p99_us": lat[int(len(lat) * 0.99)] * 1e6 if lat else float('nan'),
+            "pub_msamples_s": published / elapsed / 1e6,
+            "sub_min_msamples_s": min(received) / elapsed / 1e6,
+            "lost_max": max(r["lost"] for r in reports_t),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    print(f"{N_CHANNELS} kenh | do tre: khoi {LATENCY_BLOCK_LEN} mau @ {LATENCY_RATE:.0f} khoi/s"
+          f" | thong luong: khoi {THROUGHPUT_BLOCK_LEN} mau")
+    print(f"{'subs':>4} {'tre median (us)':>16} {'tre p99 (us)':>13} {'phat (M mau/s)':>15}"
+          f" {'nhan min (M mau/s)':>19} {'mat max':>8}")
+    for row in bench():
+        print(f"{row['subscribers']:>4} {row['lat_median_us']:>16.1f} {row['lat_p99_us']:>13.1f}"
+              f" {row['pub_msamples_s']:>15.2f} {row['sub_min_msamples_s']:>19.2f} {row['lost_max']:>8}")
@@ -0,0 +1,328 @@
+# ==============================================================================
+# BỘ BENCHMARK ĐẦU-CUỐI: CRC, PARSER, GIẢI MÃ DATA, HOST, DSP, PHÁT HIỆN SỰ KIỆN, GHI FILE, RTT LỆNH
+# Chạy: python bench_suite.py [-o ket_qua.json] [--compare baseline.json]
+# ==============================================================================
+# - Chạy offline trên Linux, không cần phần cứng: luồng byte tự sinh, RTT đo qua
+#   thiết bị giả lập trên pty (device_sim.py).
+# - Mỗi kết quả: {"value", "unit", "better": "higher" | "lower"}; file JSON gồm "meta"
+#   (máy, phiên bản, thời điểm) + "results".
+# - --compare: so với file baseline, kết quả xấu đi quá --threshold (tỉ lệ) bị đánh dấu
+#   REGRESSION và chương trình trả mã thoát 1 (dùng được trong CI).
+# - Số đo trên máy ồn (1 CPU, máy ảo...) dao động 5-15%: nên lấy baseline và kết quả
+#   mới trên cùng máy, hoặc nới --threshold.
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import crc16
+from bench_command_rtt import measure_rtt, summarize
+from bench_frame_parser import make_stream, parser_parse
+from data_layout import MAX_SENSORS, DataLayout, DeviceStatus
+from device_sim import SimulatedDevice
+from dsp import DspStage
+from event_detector import ChannelRule, EventDetector
+from frame_parser import TYPE_DATA, TYPE_STATUS, build_frame
+from giao_tiep_protocol import BiomechanicsHost
+from recorder import CsvSink
+from sample_block import decode_block, layout_dtype
+from session_file import SessionWriter
+
+DEFAULT_MIN_TIME = 0.5          # s, mỗi phép đo lặp tới khi đủ thời gian này
+DEFAULT_THRESHOLD = 0.15        # xấu đi > 15% => regression
+DECODE_FRAMES = 256             # = BATCH_MAX_FRAMES của host
+RECORD_BLOCK_FRAMES = 256
+RECORD_BLOCKS = 64
+RTT_COMMANDS = 200
+
+# Cấu hình kênh cho giải mã / host / ghi file: (tên, số kênh, số bit)
+CONFIGS = (
+    ("1ch16", 1, 16),
+    ("8ch16", 8, 16),
+    ("8ch24", 8, 24),
+    ("32ch32", 32, 32),
+)
+
+
+def _layout(n_channels, bits):
+    return DataLayout(tuple(range(n_channels)), (bits,) * n_channels)
+
+
+def _data_payloads(layout, n_frames, seed=0):
+    """n_frames payload DATA nối liền (ts tăng 1 ms, giá trị ngẫu nhiên trong dải bit)."""
+    rng = np.random.default_rng(seed)
+    rec = np.zeros(n_frames, dtype=layout_dtype(layout))
+    rec['ts'] = np.arange(n_frames, dtype=np.uint32)
+    for ch, bits, nbytes in zip(layout.channels, layout.bits, layout.sample_bytes):
+        values = rng.integers(0, 1 << bits, n_frames, dtype=np.uint64)
+        if nbytes == 3:
+            rec[f'ch{ch}'] = np.stack([(values >> s) & 0xFF for s in (0, 8, 16)], axis=1)
+        else:
+            rec[f'ch{ch}'] = values
+    return rec.tobytes()
+
+
+def _rate(fn, min_time):
+    """Lặp fn() tới khi đủ min_time giây -> số lần gọi / s."""
+    loops = 0
+    t0 = time.perf_counter()
+    while True:
+        fn()
+        loops += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            return loops / elapsed
+
+
+def _result(value, unit, better="higher"):
+    return {"value": value, "unit": unit, "better": better}
+
+
+# ==============================================================================
+# 1. CÁC NHÓM BENCHMARK (mỗi hàm trả về dict {tên kết quả: _result(...)})
+# ==============================================================================
+def bench_crc(min_time):
+    out = {}
+    for size in (148, 4096):
+        data = os.urandom(size)
+        calls = _rate(lambda: crc16.calculate_crc16(data), min_time)
+        out[f"crc.{size}B"] = _result(calls * size / 1e6, "MB/s")
+    body = build_frame(TYPE_DATA, bytes(6))
+    frames = [body] * 10000
+    calls = _rate(lambda: crc16.verify_frames(frames), min_time)
+    out["crc.verify_frames"] = _result(calls * len(frames), "frame/s")
+    return out
+
+
+def bench_parse(min_time):
+    out = {}
+    stream = make_stream()
+    for chunk in (64, 4096):
+        frames = parser_parse(stream, chunk)
+        calls = _rate(lambda: parser_parse(stream, chunk), min_time)
+        out[f"parse.chunk{chunk}"] = _result(calls * frames, "frame/s")
+    noisy = make_stream(noise_every=50)
+    frames = parser_parse(noisy, 4096)
+    calls = _rate(lambda: parser_parse(noisy, 4096), min_time)
+    out["parse.noisy"] = _result(calls * frames, "frame/s")
+    return out
+
+
+def bench_decode(min_time):
+    out = {}
+    for name, n_ch, bits in CONFIGS:
+        layout = _layout(n_ch, bits)
+        buffer = _data_payloads(layout, DECODE_FRAMES)
+        calls = _rate(lambda: decode_block(layout, buffer), min_time)
+        out[f"decode.{name}"] = _result(calls * DECODE_FRAMES * n_ch / 1e6, "Msample/s")
+    return out
+
+
+def _host_stream(layout, n_frames):
+    status = DeviceStatus.from_layout(layout)
+    status.samp_rate_map = tuple(1000 if ch in layout.channels else 0 for ch in range(MAX_SENSORS))
+    payloads = _data_payloads(layout, n_frames)
+    size = layout.payload_len
+    out = bytearray(build_frame(TYPE_STATUS, status.to_payload()))
+    for i in range(0, len(payloads), size):
+        out += build_frame(TYPE_DATA, payloads[i:i + size])
+    return bytes(out)
+
+
+def bench_host(min_time, chunk=4096, n_frames=20000):
+    """Đường đọc đầy đủ của BiomechanicsHost (parser + gom lô + giải mã + kiểm tra ts), không có serial."""
+    out = {}
+    for name, n_ch, bits in CONFIGS:
+        layout = _layout(n_ch, bits)
+        stream = _host_stream(layout, n_frames)
+
+        def run():
+            host = BiomechanicsHost(None, 0)
+            host.echo = False
+            view = memoryview(stream)
+            for i in range(0, len(view), chunk):
+                host._handle_bytes(view[i:i + chunk], time.perf_counter())
+            assert host.frames_ok == n_frames + 1 and not host.timing.missing
+
+        calls = _rate(run, min_time)
+        out[f"host.{name}"] = _result(calls * n_frames, "frame/s")
+    return out
+
+
+def bench_dsp(min_time):
+    """DspStage: IIR + hạ tần số 1 kHz -> 100 Hz + tháp tóm tắt, khối 256 frame."""
+    out = {}
+    for name, n_ch, bits in CONFIGS[1:]:
+        layout = _layout(n_ch, bits)
+        block = decode_block(layout, _data_payloads(layout, DECODE_FRAMES))
+        block.pc_time = np.arange(DECODE_FRAMES) * 1e-3
+        stage = DspStage(output_rate=100, smoothing=("iir", 40), frame_rate=1000)
+        stage.add_consumer(lambda b: None)
+        calls = _rate(lambda: stage.write_block(block), min_time)
+        out[f"dsp.{name}"] = _result(calls * DECODE_FRAMES * n_ch / 1e6, "Msample/s")
+    return out
+
+
+def bench_detect(min_time):
+    """EventDetector trên khối 256 frame: luật mặc định (so ngưỡng) và ngưỡng có trễ + chống dội."""
+    out = {}
+    layout = _layout(8, 16)
+    block = decode_block(layout, _data_payloads(layout, DECODE_FRAMES))
+    block.pc_time = np.arange(DECODE_FRAMES) * 1e-3
+    for name, rule in (("default", ChannelRule()), ("hysteresis", ChannelRule(hysteresis=0.05, debounce_ms=5))):
+        detector = EventDetector(default=rule)
+        detector.add_consumer(lambda events: None)
+        calls = _rate(lambda: detector.process(block, None, 1.0), min_time)
+        out[f"detect.{name}.8ch16"] = _result(calls * DECODE_FRAMES * 8 / 1e6, "Msample/s")
+    return out
+
+
+def bench_record(min_time):
+    out = {}
+    tmp = tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        for name, n_ch, bits in CONFIGS[1:3]:
+            layout = _layout(n_ch, bits)
+            block = decode_block(layout, _data_payloads(layout, RECORD_BLOCK_FRAMES), time.time())
+            for fmt, sink_cls in (("csv", CsvSink), ("bin", SessionWriter)):
+                path = os.path.join(tmp, f"{name}.{fmt}")
+
+                def run():
+                    sink = sink_cls(path, layout)
+                    for _ in range(RECORD_BLOCKS):
+                        sink.write_block(block)
+                    sink.close()
+
+                calls = _rate(run, min_time)
+                rows = calls * RECORD_BLOCKS * RECORD_BLOCK_FRAMES
+                out[f"record.{fmt}.{name}"] = _result(rows, "row/s")
+                out[f"record.{fmt}.{name}.mb"] = _result(calls * os.path.getsize(path) / 1e6, "MB/s")
+                os.remove(path)
+    finally:
+        os.rmdir(tmp)
+    return out
+
+
+def bench_rtt(min_time):
+    with SimulatedDevice() as device:
+        res = summarize(measure_rtt(device.port, n=RTT_COMMANDS))
+    if not res["count"]:
+        return {}
+    return {
+        "rtt.p50": _result(res["p50_ms"], "ms", "lower"),
+        "rtt.p99": _result(res["p99_ms"], "ms", "lower"),
+    }
+
+
+GROUPS = {
+    "crc": bench_crc,
+    "parse": bench_parse,
+    "decode": bench_decode,
+    "host": bench_host,
+    "dsp": bench_dsp,
+    "detect": bench_detect,
+    "record": bench_record,
+    "rtt": bench_rtt,
+}
+
+
+def run(groups=None, min_time=DEFAULT_MIN_TIME, log=print):
+    results = {}
+    for name in groups or GROUPS:
+        t0 = time.perf_counter()
+        results.update(GROUPS[name](min_time))
+        if log:
+            log(f">> {name}: xong sau {time.perf_counter() - t0:.1f} s")
+    return {
+        "meta": {
+            "time": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "min_time": min_time,
+        },
+        "results": results,
+    }
+
+
+# ==============================================================================
+# 2. SO SÁNH VỚI BASELINE
+# ==============================================================================
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """-> list (tên, giá trị baseline, giá trị mới, tỉ lệ mới/cũ, trạng thái)."""
+    rows = []
+    base = baseline["results"]
+    for name, res in current["results"].items():
+        old = base.get(name)
+        if old is None or not old["value"]:
+            rows.append((name, None, res["value"], None, "NEW"))
+            continue
+        ratio = res["value"] / old["value"]
+        # Quy về "tốt hơn" > 1 cho cả 2 chiều
+        gain = ratio if res["better"] == "higher" else 1.0 / ratio if ratio else float('inf')
+        if gain < 1.0 - threshold:
+            status = "REGRESSION"
+        elif gain > 1.0 + threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, old["value"], res["value"], ratio, status))
+    # Chỉ báo thiếu với các nhóm đã chạy lần này (chạy 1 phần bằng --group)
+    groups = {name.split('.')[0] for name in current["results"]}
+    for name in sorted(base.keys() - current["results"].keys()):
+        if name.split('.')[0] in groups:
+            rows.append((name, base[name]["value"], None, None, "MISSING"))
+    return rows
+
+
+def _print_results(report):
+    print(f"{'benchmark':<26} {'gia tri':>14}  don vi")
+    for name, res in report["results"].items():
+        print(f"{name:<26} {res['value']:>14,.3f}  {res['unit']}")
+
+
+def _print_compare(rows, threshold):
+    print(f"{'benchmark':<26} {'baseline':>14} {'moi':>14} {'moi/cu':>8}  ket qua (nguong {threshold:.0%})")
+    for name, old, new, ratio, status in rows:
+        old_s = f"{old:,.3f}" if old is not None else "-"
+        new_s = f"{new:,.3f}" if new is not None else "-"
+        ratio_s = f"{ratio:.2f}x" if ratio is not None else "-"
+        print(f"{name:<26} {old_s:>14} {new_s:>14} {ratio_s:>8}  {status}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark thong luong / do tre cua Communication_Stack")
+    ap.add_argument("-o", "--out", help="ghi ket qua ra file JSON")
+    ap.add_argument("--compare", metavar="BASELINE", help="so voi file JSON baseline")
+    ap.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                    help="ti le xau di toi da truoc khi bao REGRESSION (mac dinh 0.15)")
+    ap.add_argument("-g", "--group", action="append", choices=list(GROUPS),
+                    help="chi chay nhom nay (lap lai duoc; mac dinh: tat ca)")
+    ap.add_argument("-t", "--min-time", type=float, default=DEFAULT_MIN_TIME,
+                    help="thoi gian do toi thieu moi phep do (s)")
+    args = ap.parse_args()
+
+    report = run(args.group, args.min_time)
+    _print_results(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f">> Da ghi: {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        _print_compare(rows, args.threshold)
+        regressions = [r[0] for r in rows if r[4] == "REGRESSION"]
+        if regressions:
+            print(f">> REGRESSION: {', '.join(regressions)}")
+            sys.exit(1)
+    sys.exit(0)
@@ -7,32 +7,26 @@ import csv
 import msvcrt
 from datetime import datetime
 
+import crc16
+from frame_parser import (
+    FrameParser, build_frame, PROTOCOL_VER,
+    TYPE_STATUS, TYPE_DATA, TYPE_COMMAND, TYPE_ACK,
+)
+from console_view import ConsoleRenderer, HexTap
+
 # ==============================================================================
 # 1. CẤU HÌNH HỆ THỐNG
 # ==============================================================================
 SERIAL_PORT = 'COM2'
 BAUD_RATE = 115200
 
-SOF = b'\xA5\x5A'
-PROTOCOL_VER = 0x01
-TYPE_STATUS, TYPE_DATA, TYPE_COMMAND, TYPE_ACK = 1, 2, 3, 4
 CMD_GET_STATUS, CMD_START_MEASURE, CMD_STOP_MEASURE = 1, 2, 3
 
 
 # ==============================================================================
 # 2. HÀM CRC16
 # ==============================================================================
-def calculate_crc16(data: bytes) -> int:
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= (byte << 8)
-        for _ in range(8):
-            if (crc & 0x8000):
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-        crc &= 0xFFFF
-    return crc
+calculate_crc16 = crc16.calculate_crc16
 
 
 # ==============================================================================
@@ -47,14 +41,21 @@ class BiomechanicsHost:
         self.running = False
         self.read_thread = None
 
+        # Bộ tách frame dùng chung (frame_parser.py)
+        self.parser = FrameParser()
+
         # Biến ghi file
         self.is_recording = False
         self.csv_file = None
         self.csv_writer = None
         self.filename = ""
 
-        # [MOI] CHE DO DEBUG (SOI FRAME)
+        # [MOI] CHE DO DEBUG (SOI FRAME): luồng đọc chỉ lấy mẫu frame vào HexTap,
+        # định dạng hex + in ra do luồng hiển thị (ConsoleRenderer) làm
         self.debug_mode = False
+        self.hex_tap = HexTap()
+        self.console = None
+        self.last_data = None  # (ts, voltage, status) của frame DATA mới nhất
 
     def connect(self):
         try:
@@ -75,13 +76,28 @@ class BiomechanicsHost:
         if self.read_thread: self.read_thread.join()
         if self.ser and self.ser.is_open:
             self.ser.close()
-            print("\n>> [SYSTEM] Da ngat ket noi.")
+            self._log("\n>> [SYSTEM] Da ngat ket noi.\n")
 
     # --- TOGGLE DEBUG ---
     def toggle_debug(self):
         self.debug_mode = not self.debug_mode
+        self.hex_tap.enabled = self.debug_mode
         state = "ON (Hien thi Hex)" if self.debug_mode else "OFF (Giau Hex)"
-        sys.stdout.write(f"\n>>> [DEBUG MODE] {state}\n")
+        self._log(f"\n>>> [DEBUG MODE] {state}\n")
+
+    def _log(self, text):
+        if self.console is not None:
+            self.console.log(text)
+        else:
+            sys.stdout.write(text)
+
+    def status_line(self):
+        rec_tag = "[REC] " if self.is_recording else ""
+        if self.last_data is None:
+            return f"{rec_tag}[DATA] chua co du lieu | CRC loi: {self.parser.crc_errors}"
+        ts, voltage, status = self.last_data
+        return f"{rec_tag}[DATA] TS:{ts}ms | {voltage:.4f}V -> {status} | CRC loi: {self.parser.crc_errors}"
+
 
     # --- FILE RECORDING ---
     def start_recording(self):
@@ -93,16 +109,16 @@ class BiomechanicsHost:
             self.csv_writer = csv.writer(self.csv_file)
             self.csv_writer.writerow(["Timestamp", "ADC", "Volt", "Status", "Time"])
             self.is_recording = True
-            sys.stdout.write(f"\n\n>>> [REC] FILE: {self.filename}\n")
+            self._log(f"\n\n>>> [REC] FILE: {self.filename}\n")
         except Exception as e:
-            sys.stdout.write(f"\n>>> [ERROR] Tao file loi: {e}\n")
+            self._log(f"\n>>> [ERROR] Tao file loi: {e}\n")
 
     def stop_recording(self):
         if self.is_recording and self.csv_file:
             self.csv_file.close()
             self.is_recording = False
             self.csv_file = None
-            sys.stdout.write(f"\n\n>>> [REC] DA LUU FILE!\n")
+            self._log(f"\n\n>>> [REC] DA LUU FILE!\n")
 
     # --- COMMANDS ---
     def send_command(self, cmd_id, args=b''):
@@ -112,16 +128,10 @@ class BiomechanicsHost:
         self._send_raw_frame(TYPE_COMMAND, cmd_payload)
 
     def _send_raw_frame(self, msg_type, payload):
-        payload_len = len(payload)
-        header_for_crc = struct.pack('<BBH', PROTOCOL_VER, msg_type, payload_len)
-        data_to_crc = header_for_crc + payload
-        crc = calculate_crc16(data_to_crc)
-        full_frame = SOF + data_to_crc + struct.pack('<H', crc)
+        full_frame = build_frame(msg_type, payload)
 
-        # [MOI] IN RA FRAME GỬI ĐI NẾU ĐANG DEBUG
-        if self.debug_mode:
-            hex_str = full_frame.hex(' ').upper()
-            sys.stdout.write(f"\n[TX] {hex_str}\n")
+        # [MOI] SOI FRAME GỬI ĐI NẾU ĐANG DEBUG
+        self.hex_tap.tap("TX", msg_type, payload)
 
         self.ser.write(full_frame)
 
@@ -133,54 +143,33 @@ class BiomechanicsHost:
         self.read_thread.start()
 
     def _reader_loop(self):
-        buffer = b''
+        parser = self.parser
         while self.running and self.ser.is_open:
             try:
                 if self.ser.in_waiting:
-                    buffer += self.ser.read(self.ser.in_waiting)
-
-                while len(buffer) >= 6:
-                    sof_index = buffer.find(SOF)
-                    if sof_index == -1: buffer = b''; break
-                    if sof_index > 0: buffer = buffer[sof_index:]
-                    if len(buffer) < 6: break
-
-                    payload_len = struct.unpack_from('<H', buffer, 4)[0]
-                    total_len = 6 + payload_len + 2
-                    if len(buffer) < total_len: break
-
-                    frame = buffer[:total_len]
-                    buffer = buffer[total_len:]
-
-                    # [MOI] IN RA FRAME NHẬN ĐƯỢC NẾU ĐANG DEBUG
-                    # Chỉ in Frame điều khiển (ACK, STATUS) hoặc DATA nếu muốn soi kỹ
-                    # Ở đây tôi cho in hết để bạn thấy rõ
-                    if self.debug_mode:
-                        hex_str = frame.hex(' ').upper()
-                        # Nếu là gói DATA thì in gọn hơn chút kẻo trôi màn hình
-                        if frame[3] == TYPE_DATA:
-                            sys.stdout.write(f"\r[RX DATA] {hex_str}     ")
-                        else:
-                            sys.stdout.write(f"\n[RX CMD]  {hex_str}\n")
-
-                    self._process_frame(frame, payload_len)
+                    crc_errors_before = parser.crc_errors
+                    for msg_type, payload in parser.feed(self.ser.read(self.ser.in_waiting)):
+                        # [MOI] SOI FRAME NHẬN ĐƯỢC NẾU ĐANG DEBUG (DATA chỉ lấy mẫu thưa)
+                        self.hex_tap.tap("RX", msg_type, payload)
+
+                        self._process_frame(msg_type, payload)
+
+                    if self.debug_mode and parser.crc_errors != crc_errors_before:
+                        self._log(f"\n[RX CRC FAIL] Tong: {parser.crc_errors} | {parser.stats()}\n")
                 time.sleep(0.005)
             except Exception:
                 break
 
-    def _process_frame(self, frame, payload_len):
-        msg_type = frame[3]
-        payload = frame[6: 6 + payload_len]
-
+    def _process_frame(self, msg_type, payload):
         if msg_type == TYPE_ACK:
             cmd, seq, res = struct.unpack('<BBB', payload)
             res_str = "OK" if res == 0 else f"FAIL({res})"
-            sys.stdout.write(f"\n   << [ACK] Cmd:{hex(cmd)} -> {res_str}\n")
+            self._log(f"\n   << [ACK] Cmd:{hex(cmd)} -> {res_str}\n")
 
         elif msg_type == TYPE_STATUS:
             state = payload[0]
             n_sensors = payload[1]
-            sys.stdout.write(f"\n   << [STATUS] State:{state} Sensors:{n_sensors}\n")
+            self._log(f"\n   << [STATUS] State:{state} Sensors:{n_sensors}\n")
 
         elif msg_type == TYPE_DATA:
             ts, adc_raw = struct.unpack('<IH', payload)
@@ -195,11 +184,8 @@ class BiomechanicsHost:
                 except:
                     pass
 
-            # Nếu đang debug thì không in dòng đè [DATA] ... để tránh rối
-            if not self.debug_mode:
-                rec_tag = "[REC] " if self.is_recording else ""
-                sys.stdout.write(f"\r{rec_tag}[DATA] TS:{ts}ms | {voltage:.4f}V -> {status}      ")
-                sys.stdout.flush()
+            # Dòng [DATA] do luồng hiển thị vẽ lại theo nhịp (status_line)
+            self.last_data = (ts, voltage, status)
 
 
 # ==============================================================================
@@ -221,16 +207,20 @@ if __name__ == "__main__":
         print(" [q] QUIT")
         print("------------------------------------------")
 
+        console = ConsoleRenderer(host.status_line, hex_tap=host.hex_tap)
+        host.console = console
+        console.start()
+
         try:
             while True:
                 if msvcrt.kbhit():
                     key = msvcrt.getch().lower()
 
                     if key == b's':
-                        sys.stdout.write("\n>>> START...\n")
+                        host._log(">>> START...")
                         host.send_command(CMD_START_MEASURE)
                     elif key == b'x':
-                        sys.stdout.write("\n>>> STOP...\n")
+                        host._log(">>> STOP...")
                         host.send_command(CMD_STOP_MEASURE)
                     elif key == b'g':
                         host.send_command(CMD_GET_STATUS)
@@ -246,4 +236,5 @@ if __name__ == "__main__":
         except KeyboardInterrupt:
             pass
         finally:
-            host.disconnect()
\ No newline at end of file
+            host.disconnect()
+            console.stop()
\ No newline at end of file
@@ -0,0 +1,233 @@
+# ==============================================================================
+# BẢNG LỆNH ĐANG CHỜ ACK: GHÉP ACK THEO (CmdID, Seq), TIMEOUT, GỬI LẠI, PIPELINE
+# ==============================================================================
+# Mỗi lệnh gửi đi có 1 Future (concurrent.futures) -> kết quả là Ack (PROTOCOL.md mục 8).
+# - ACK khớp (CmdID, Seq) -> Future xong với Ack (kể cả mã lỗi; BUSY thì gửi lại).
+# - Hết timeout -> gửi lại đúng frame cũ (giữ Seq), thời gian chờ nhân backoff; hết số lần
+#   thử -> Future lỗi CommandTimeout.
+# - Tối đa max_in_flight lệnh cùng lúc trên đường truyền, phần dư xếp hàng và được gửi ngay
+#   khi có ACK trả về -> cấu hình 32 kênh chỉ tốn ~1 vòng khứ hồi thay vì 32 lần chờ.
+# - Ghi cổng lỗi (mất cổng...) -> Future của đúng lệnh đó lỗi theo exception của write, không
+#   ném ra nơi gọi poll() / on_ack() (luồng đọc) và không để Future nào treo mãi.
+# Không tự chạy timer: host gọi poll() định kỳ (luồng đọc thức dậy ít nhất mỗi READ_TIMEOUT).
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# Result codes (mục 8.2)
+ACK_OK = 0x00
+ACK_INVALID_COMMAND = 0x01
+ACK_INVALID_ARGUMENT = 0x02
+ACK_BUSY = 0x03
+ACK_FAILED = 0x04
+ACK_NOT_ALLOWED = 0x05
+
+ACK_RESULT_NAMES = {
+    ACK_OK: "OK", ACK_INVALID_COMMAND: "INVALID_COMMAND", ACK_INVALID_ARGUMENT: "INVALID_ARGUMENT",
+    ACK_BUSY: "BUSY", ACK_FAILED: "FAILED", ACK_NOT_ALLOWED: "NOT_ALLOWED",
+}
+
+# Kết quả tạm thời -> thử lại như khi mất ACK
+RETRY_RESULTS = (ACK_BUSY,)
+
+COMMAND_TIMEOUT = 0.2       # s chờ ACK lần đầu
+COMMAND_RETRIES = 3         # số lần gửi lại
+COMMAND_BACKOFF = 2.0       # hệ số nhân timeout sau mỗi lần gửi lại
+MAX_IN_FLIGHT = 32
+
+_ACK_STRUCT = struct.Struct('<BBB')
+
+
+class Ack:
+    __slots__ = ("cmd", "seq", "result", "attempts", "rtt")
+
+    def __init__(self, cmd, seq, result, attempts=1, rtt=0.0):
+        self.cmd = cmd
+        self.seq = seq
+        self.result = result
+        self.attempts = attempts
+        self.rtt = rtt  # s, tính từ lần gửi đầu tiên
+
+    @classmethod
+    def from_payload(cls, payload):
+        return cls(*_ACK_STRUCT.unpack_from(payload))
+
+    @property
+    def ok(self):
+        return self.result == ACK_OK
+
+    @property
+    def result_name(self):
+        return ACK_RESULT_NAMES.get(self.result, f"0x{self.result:02X}")
+
+    def __repr__(self):
+        return f"Ack(cmd=0x{self.cmd:02X}, seq={self.seq}, result={self.result_name}, attempts={self.attempts})"
+
+
+class CommandError(Exception):
+    """ACK trả về mã lỗi khác OK."""
+
+    def __init__(self, ack):
+        super().__init__(f"Lenh 0x{ack.cmd:02X} that bai: {ack.result_name}")
+        self.ack = ack
+
+
+class CommandTimeout(TimeoutError):
+    def __init__(self, cmd, seq, attempts):
+        super().__init__(f"Lenh 0x{cmd:02X} (seq {seq}) khong co ACK sau {attempts} lan gui")
+        self.cmd = cmd
+        self.seq = seq
+        self.attempts = attempts
+
+
+class _Pending:
+    __slots__ = ("cmd", "seq", "frame", "future", "timeout", "retries", "attempts",
+                 "deadline", "t_first")
+
+    def __init__(self, cmd, seq, frame, future, timeout, retries):
+        self.cmd = cmd
+        self.seq = seq
+        self.frame = frame
+        self.future = future
+        self.timeout = timeout
+        self.retries = retries
+        self.attempts = 0
+        self.deadline = 0.0
+        self.t_first = 0.0
+
+
+class PendingCommands:
+    def __init__(self, write, timeout=COMMAND_TIMEOUT, retries=COMMAND_RETRIES,
+                 backoff=COMMAND_BACKOFF, max_in_flight=MAX_IN_FLIGHT, clock=time.monotonic):
+        self._write = write             # write(frame_bytes)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_in_flight = max_in_flight
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._in_flight = {}            # (cmd, seq) -> _Pending
+        self._waiting = deque()
+
+        # Thống kê
+        self.sent = 0
+        self.retransmits = 0
+        self.timeouts = 0
+        self.unmatched_acks = 0
+        self.write_errors = 0
+
+    def __len__(self):
+        return len(self._in_flight) + len(self._waiting)
+
+    def is_busy(self, cmd, seq):
+        return (cmd, seq) in self._in_flight or any(p.cmd == cmd and p.seq == seq for p in self._waiting)
+
+    def submit(self, cmd, seq, frame, timeout=None, retries=None):
+        """Đăng ký + gửi (hoặc xếp hàng) 1 lệnh đã đóng frame. Trả về Future[Ack]."""
+        future = Future()
+        pending = _Pending(cmd, seq, frame, future,
+                           self.timeout if timeout is None else timeout,
+                           self.retries if retries is None else retries)
+        failed = []
+        with self._lock:
+            if len(self._in_flight) < self.max_in_flight:
+                self._transmit(pending, failed)
+            else:
+                self._waiting.append(pending)
+        _fail(failed)
+        return future
+
+    def on_ack(self, cmd, seq, result):
+        """Gọi khi nhận ACK. Trả về Ack nếu khớp 1 lệnh đang chờ, ngược lại None."""
+        resolved = None
+        failed = []
+        with self._lock:
+            pending = self._in_flight.get((cmd, seq))
+            if pending is None:
+                self.unmatched_acks += 1
+                return None
+            if result in RETRY_RESULTS and pending.attempts <= pending.retries:
+                # Thiết bị bận: gửi lại sau đúng khoảng backoff như khi mất ACK
+                return None
+            del self._in_flight[(cmd, seq)]
+            resolved = Ack(cmd, seq, result, pending.attempts, self.clock() - pending.t_first)
+            self._fill_window(failed)
+        if not pending.future.done():
+            pending.future.set_result(resolved)
+        _fail(failed)
+        return resolved
+
+    def poll(self):
+        """Gửi lại các lệnh hết hạn, báo lỗi lệnh hết lượt thử. Trả về deadline gần nhất (hoặc None)."""
+        now = self.clock()
+        failed = []         # (pending, exception): Future báo lỗi sau khi nhả khóa
+        with self._lock:
+            for key, pending in list(self._in_flight.items()):
+                if pending.deadline > now:
+                    continue
+                if pending.attempts > pending.retries:
+                    del self._in_flight[key]
+                    self.timeouts += 1
+                    failed.append((pending, CommandTimeout(pending.cmd, pending.seq, pending.attempts)))
+                else:
+                    self.retransmits += 1
+                    self._transmit(pending, failed)
+            if failed:
+                self._fill_window(failed)
+            next_deadline = min((p.deadline for p in self._in_flight.values()), default=None)
+        _fail(failed)
+        return next_deadline
+
+    def cancel_all(self):
+        with self._lock:
+            items = list(self._in_flight.values()) + list(self._waiting)
+            self._in_flight.clear()
+            self._waiting.clear()
+        for pending in items:
+            pending.future.cancel()
+
+    def stats(self):
+        return {"in_flight": len(self._in_flight), "queued": len(self._waiting), "sent": self.sent,
+                "retransmits": self.retransmits, "timeouts": self.timeouts,
+                "unmatched_acks": self.unmatched_acks, "write_errors": self.write_errors}
+
+    # Gọi khi đang giữ _lock; ghi lỗi -> bỏ lệnh khỏi bảng, thêm (pending, lỗi) vào failed
+    def _transmit(self, pending, failed):
+        key = (pending.cmd, pending.seq)
+        try:
+            self._write(pending.frame)
+        except Exception as e:
+            self.write_errors += 1
+            self._in_flight.pop(key, None)
+            failed.append((pending, e))
+            return
+        now = self.clock()
+        if pending.attempts == 0:
+            pending.t_first = now
+        wait = pending.timeout * self.backoff ** pending.attempts
+        pending.attempts += 1
+        pending.deadline = now + wait
+        self._in_flight[key] = pending
+        self.sent += 1
+
+    def _fill_window(self, failed):
+        while self._waiting and len(self._in_flight) < self.max_in_flight:
+            self._transmit(self._waiting.popleft(), failed)
+
+
+def _fail(failed):
+    for pending, error in failed:
+        if not pending.future.done():
+            pending.future.set_exception(error)
+
+
+def wait_all(futures, timeout=None):
+    """Chờ cả loạt Future -> list Ack theo đúng thứ tự gửi (lỗi đầu tiên được ném ra)."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    results = []
+    for future in futures:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        results.append(future.result(remaining))
+    return results
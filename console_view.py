@@ -0,0 +1,145 @@
+# ==============================================================================
+# HIỂN THỊ CONSOLE CÓ GIỚI HẠN TẦN SỐ (LUỒNG RIÊNG, KHÔNG CHẶN LUỒNG ĐỌC)
+# ==============================================================================
+# Luồng đọc không bao giờ ghi ra terminal nữa:
+#   - Thông báo (ACK, STATUS, REC...) -> renderer.log(text): chỉ append vào deque.
+#   - Giá trị mới nhất / bộ đếm -> luồng hiển thị tự lấy (status_fn) theo nhịp 10-30 Hz.
+#   - Soi frame (debug hex): HexTap giữ bản sao byte của 1 phần frame trong vòng đệm,
+#     việc định dạng hex chỉ làm ở luồng hiển thị, tối đa HEX_LINES_PER_TICK dòng / nhịp.
+# Terminal chậm chỉ làm chậm luồng hiển thị; deque đầy thì thông báo cũ nhất bị bỏ.
+import sys
+import threading
+import time
+from collections import deque
+
+from frame_parser import TYPE_DATA, build_frame
+
+DEFAULT_RATE_HZ = 15
+LOG_MAX = 256
+HEX_RING = 64
+HEX_DATA_EVERY = 100        # DATA: chỉ giữ 1 frame / 100 (STATUS/ACK/ERROR giữ hết)
+HEX_LINES_PER_TICK = 8
+
+_CLEAR_LINE = "\r\x1b[2K"
+
+
+class HexTap:
+    """Lấy mẫu frame để soi hex: gọi tap() trong luồng đọc (chỉ copy byte, không định dạng)."""
+
+    def __init__(self, data_every=HEX_DATA_EVERY, size=HEX_RING):
+        self.enabled = False
+        self.data_every = data_every
+        self._ring = deque(maxlen=size)
+        self._data_count = 0
+        self.skipped = 0
+
+    def tap(self, direction, msg_type, payload):
+        if not self.enabled:
+            return
+        if msg_type == TYPE_DATA:
+            self._data_count += 1
+            if self._data_count % self.data_every:
+                self.skipped += 1
+                return
+        self._ring.append((direction, msg_type, bytes(payload)))
+
+    def drain(self, limit=HEX_LINES_PER_TICK):
+        lines = []
+        ring = self._ring
+        while ring and len(lines) < limit:
+            direction, msg_type, payload = ring.popleft()
+            tag = "DATA" if msg_type == TYPE_DATA else f"T{msg_type:02X}"
+            lines.append(f"[{direction} {tag}] {build_frame(msg_type, payload).hex(' ').upper()}")
+        if ring:
+            lines.append(f"[HEX] ... con {len(ring)} frame cho hien thi")
+        return lines
+
+
+class ConsoleRenderer:
+    def __init__(self, status_fn, rate_hz=DEFAULT_RATE_HZ, out=None, hex_tap=None):
+        self.status_fn = status_fn      # () -> str: dòng trạng thái ghi đè tại chỗ
+        self.period = 1.0 / rate_hz
+        self.out = out or sys.stdout
+        self.hex_tap = hex_tap
+        self._logs = deque(maxlen=LOG_MAX)
+        self._stop = threading.Event()
+        self._thread = None
+        self.renders = 0
+
+    def log(self, text):
+        """Thêm 1 thông báo (an toàn gọi từ mọi luồng, không bao giờ chặn)."""
+        self._logs.append(text.strip("\n"))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.render()
+        self.out.write("\n")
+        self.out.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            try:
+                self.render()
+            except Exception as e:
+                self._logs.append(f">> [ERROR] Loi hien thi: {e}")
+
+    def render(self):
+        lines = []
+        logs = self._logs
+        while logs:
+            lines.append(logs.popleft())
+        if self.hex_tap is not None and self.hex_tap.enabled:
+            lines += self.hex_tap.drain()
+        text = "".join(f"{_CLEAR_LINE}{line}\n" for line in lines)
+        self.out.write(f"{text}{_CLEAR_LINE}{self.status_fn()}")
+        self.out.flush()
+        self.renders += 1
+
+
+class HostStatusLine:
+    """status_fn cho BiomechanicsHost: giá trị mới nhất mỗi kênh, frame/s, lỗi, trạng thái ghi."""
+
+    def __init__(self, host):
+        self.host = host
+        self._frames = host.frames_ok
+        self._t = time.monotonic()
+        self.fps = 0.0
+
+    def __call__(self):
+        host = self.host
+        now = time.monotonic()
+        frames = host.frames_ok
+        dt = now - self._t
+        if dt >= 0.5:
+            self.fps = (frames - self._frames) / dt
+            self._frames, self._t = frames, now
+        block = host.latest_block
+        if block is not None and len(block):
+            ts = int(block.timestamps[-1])
+            volts = block.volts[-1].tolist()
+            if block.layout.n_channels == 1:
+                state = "DA AN" if bool(block.pressed[-1, 0]) else "THA LONG"
+                values = f"{volts[0]:.4f}V -> {state}"
+            else:
+                values = " ".join(f"CH{ch}:{v:.3f}V" for ch, v in zip(block.layout.channels, volts))
+            data = f"TS: {ts}ms | {values}"
+        else:
+            data = "chua co DATA"
+        errors = (f"CRC:{host.crc_errors} RS:{host.resync_bytes} LM:{host.layout_mismatches}"
+                  f" MISS:{host.timing.missing} J:{host.timing.jitter_ms:.1f}ms")
+        rec = ""
+        recorder = host.recorder
+        if recorder is not None:
+            stats = recorder.stats()
+            rec = f" | [REC q={stats['queue_depth']}"
+            rec += f" bo={stats['dropped_frames']}]" if stats["dropped_frames"] else "]"
+        return f"[DATA] {data} | {self.fps:.0f} f/s | {errors}{rec}"
@@ -0,0 +1,76 @@
+# ==============================================================================
+# CRC16-CCITT DÙNG CHUNG (Poly 0x1021, Init 0xFFFF) - THEO PROTOCOL.md mục 3.6
+# ==============================================================================
+# - Bảng tra 256 phần tử tính sẵn: mỗi byte chỉ tốn 1 lần tra bảng thay vì 8 vòng lặp.
+# - update(crc, chunk) cho phép tính nối tiếp từng đoạn, nhận bytes/bytearray/memoryview
+#   mà không cần copy.
+# - Đường nhanh: binascii.crc_hqx (C, cũng là table-driven, cùng đa thức 0x1021,
+#   không đảo bit, không XOR cuối) -> cho kết quả giống hệt bản Python.
+import binascii
+import struct
+
+CRC16_POLY = 0x1021
+CRC16_INIT = 0xFFFF
+
+
+def _build_table(poly=CRC16_POLY):
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ poly) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _build_table()
+
+
+def update_table(crc: int, chunk) -> int:
+    """Cập nhật CRC bằng bảng tra thuần Python (dự phòng khi không có crc_hqx)."""
+    table = CRC16_TABLE
+    for byte in memoryview(chunk).cast('B'):
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+if hasattr(binascii, 'crc_hqx'):
+    def update(crc: int, chunk) -> int:
+        """Cập nhật CRC với một đoạn dữ liệu (bytes-like, không copy)."""
+        return binascii.crc_hqx(chunk, crc)
+else:  # pragma: no cover - chỉ gặp trên runtime không có binascii.crc_hqx
+    update = update_table
+
+
+def calculate_crc16(data) -> int:
+    """CRC của Ver | Type | Len | Payload (giữ nguyên tên hàm cũ)."""
+    return update(CRC16_INIT, data)
+
+
+def verify_frame(frame) -> bool:
+    """Kiểm tra CRC của một frame đầy đủ (SOF ... CRC16)."""
+    view = memoryview(frame)
+    if len(view) < 8:
+        return False
+    crc_rx = struct.unpack_from('<H', view, len(view) - 2)[0]
+    return update(CRC16_INIT, view[2:-2]) == crc_rx
+
+
+def verify_frames(frames):
+    """Kiểm tra CRC cho nhiều frame trong một lần gọi -> list[bool] theo đúng thứ tự."""
+    crc_fn = update
+    unpack_crc = struct.Struct('<H').unpack_from
+    init = CRC16_INIT
+    results = []
+    append = results.append
+    for frame in frames:
+        view = memoryview(frame)
+        n = len(view)
+        if n < 8:
+            append(False)
+            continue
+        append(crc_fn(init, view[2:n - 2]) == unpack_crc(view, n - 2)[0])
+    return results
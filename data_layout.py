@@ -0,0 +1,185 @@
+# ==============================================================================
+# GIẢI MÃ STATUS (PROTOCOL.md mục 5), BỐ CỤC DATA (mục 6) VÀ ERROR (mục 9)
+# ==============================================================================
+# - DeviceStatus.from_payload(): đọc đủ 144 byte STATUS thành object.
+# - DeviceError.from_payload(): Timestamp | ErrCode | AuxData.
+# - DataLayout: mỗi cấu hình (ActiveMap + BitsPerSmpMap) được tính 1 lần (số byte mỗi mẫu,
+#   độ dài payload) rồi cache lại. Giải mã DATA làm theo lô bằng NumPy trong sample_block.py.
+import struct
+
+# State (mục 5.2)
+STATE_NAMES = {0x00: "IDLE", 0x01: "MEASURING", 0x02: "CALIB", 0x03: "ERROR"}
+
+MAX_SENSORS = 32
+
+# ADS1115 GAIN_FOUR: 1 LSB = 0.03125 mV
+ADC_LSB_VOLT = 0.00003125
+
+# Firmware hiện tại gửi STATUS với ActiveMap/BitsPerSmpMap = 0 và DATA = TS + 1 mẫu 16-bit.
+# Khi đó coi NSensors kênh đầu tiên đang bật, mỗi kênh 16 bit.
+DEFAULT_BITS = 16
+
+# State | NSensors | ActiveMap | HealthMap | SampRateMap[32] | BitsPerSmpMap[32] |
+# SensorRoleMap[32] | ADCFlags | Reserved  (= 142 byte, phần còn lại tới 144 byte bỏ qua)
+_STATUS_STRUCT = struct.Struct('<BBII32H32s32sHH')
+STATUS_PAYLOAD_LEN = 144
+
+
+def bytes_per_sample(bits):
+    """Số byte của 1 mẫu theo bảng mục 6.4."""
+    if bits <= 8:
+        return 1
+    if bits <= 16:
+        return 2
+    if bits <= 24:
+        return 3
+    return 4
+
+
+def active_channels(active_map):
+    """Danh sách index kênh đang bật theo thứ tự tăng dần (mục 6.3)."""
+    return tuple(i for i in range(MAX_SENSORS) if active_map >> i & 1)
+
+
+# ==============================================================================
+# 1. STATUS
+# ==============================================================================
+class DeviceStatus:
+    __slots__ = ("state", "n_sensors", "active_map", "health_map", "samp_rate_map",
+                 "bits_map", "role_map", "adc_flags")
+
+    def __init__(self, state, n_sensors, active_map, health_map, samp_rate_map,
+                 bits_map, role_map, adc_flags=0):
+        self.state = state
+        self.n_sensors = n_sensors
+        self.active_map = active_map
+        self.health_map = health_map
+        self.samp_rate_map = tuple(samp_rate_map)
+        self.bits_map = tuple(bits_map)
+        self.role_map = tuple(role_map)
+        self.adc_flags = adc_flags
+
+    @classmethod
+    def from_payload(cls, payload):
+        if len(payload) < _STATUS_STRUCT.size:
+            raise ValueError(f"STATUS payload qua ngan: {len(payload)} byte")
+        fields = _STATUS_STRUCT.unpack_from(payload)
+        state, n_sensors, active_map, health_map = fields[:4]
+        samp_rate_map = fields[4:36]
+        bits_map, role_map, adc_flags = fields[36], fields[37], fields[38]
+        return cls(state, n_sensors, active_map, health_map, samp_rate_map,
+                   bytes(bits_map), bytes(role_map), adc_flags)
+
+    @classmethod
+    def from_layout(cls, layout, state=0x00):
+        """STATUS tối thiểu mô tả đúng bố cục (khi chưa nhận STATUS thật từ thiết bị)."""
+        active_map = 0
+        bits_map = [0] * MAX_SENSORS
+        for ch, bits in zip(layout.channels, layout.bits):
+            active_map |= 1 << ch
+            bits_map[ch] = bits
+        return cls(state, layout.n_channels, active_map, 0, [0] * MAX_SENSORS,
+                   bytes(bits_map), bytes(MAX_SENSORS))
+
+    def to_payload(self):
+        payload = _STATUS_STRUCT.pack(self.state, self.n_sensors, self.active_map, self.health_map,
+                                      *self.samp_rate_map, bytes(self.bits_map),
+                                      bytes(self.role_map), self.adc_flags, 0)
+        return payload + bytes(STATUS_PAYLOAD_LEN - len(payload))
+
+    @property
+    def state_name(self):
+        return STATE_NAMES.get(self.state, "Unknown")
+
+    def effective_active_map(self):
+        # Firmware cũ để ActiveMap = 0 nhưng NSensors > 0
+        if self.active_map == 0 and self.n_sensors:
+            return (1 << min(self.n_sensors, MAX_SENSORS)) - 1
+        return self.active_map
+
+    def layout_key(self):
+        """Khoá cache: chỉ những trường quyết định bố cục DATA."""
+        channels = active_channels(self.effective_active_map())
+        return channels, tuple(self.bits_map[ch] or DEFAULT_BITS for ch in channels)
+
+    def __eq__(self, other):
+        if not isinstance(other, DeviceStatus):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __repr__(self):
+        return (f"DeviceStatus(state={self.state_name}, n_sensors={self.n_sensors}, "
+                f"active_map=0x{self.active_map:08X}, channels={self.layout_key()[0]})")
+
+
+# ==============================================================================
+# 1b. ERROR (mục 9)
+# ==============================================================================
+ERROR_NAMES = {0x01: "ADC_OVERRUN", 0x02: "SENSOR_FAULT", 0x03: "FIFO_CRITICAL",
+               0x04: "LOW_VOLTAGE", 0xFE: "VENDOR_SPECIFIC"}
+
+_ERROR_STRUCT = struct.Struct('<IBH')
+
+
+class DeviceError:
+    __slots__ = ("timestamp_us", "code", "aux")
+
+    def __init__(self, timestamp_us, code, aux):
+        self.timestamp_us = timestamp_us
+        self.code = code
+        self.aux = aux
+
+    @classmethod
+    def from_payload(cls, payload):
+        if len(payload) < _ERROR_STRUCT.size:
+            raise ValueError(f"ERROR payload qua ngan: {len(payload)} byte")
+        return cls(*_ERROR_STRUCT.unpack_from(payload))
+
+    @property
+    def name(self):
+        return ERROR_NAMES.get(self.code, f"0x{self.code:02X}")
+
+    def __repr__(self):
+        return f"DeviceError({self.name}, ts={self.timestamp_us}us, aux=0x{self.aux:04X})"
+
+
+# ==============================================================================
+# 2. DATA LAYOUT (TÍNH 1 LẦN / CẤU HÌNH)
+# ==============================================================================
+class DataLayout:
+    def __init__(self, channels, bits):
+        if len(channels) != len(bits):
+            raise ValueError("channels va bits phai cung do dai")
+        self.channels = tuple(channels)
+        self.bits = tuple(bits)
+        self.sample_bytes = tuple(bytes_per_sample(b) for b in self.bits)
+        self.payload_len = 4 + sum(self.sample_bytes)
+
+    @classmethod
+    def from_status(cls, status):
+        return get_layout(status.layout_key())
+
+    @property
+    def n_channels(self):
+        return len(self.channels)
+
+    def key(self):
+        return self.channels, self.bits
+
+    def __repr__(self):
+        return f"DataLayout(channels={self.channels}, bits={self.bits}, payload_len={self.payload_len})"
+
+
+_LAYOUT_CACHE = {}
+
+
+def get_layout(key):
+    """Lấy DataLayout đã tạo theo khoá (channels, bits), tạo mới nếu chưa có."""
+    layout = _LAYOUT_CACHE.get(key)
+    if layout is None:
+        layout = _LAYOUT_CACHE[key] = DataLayout(*key)
+    return layout
+
+
+# Bố cục của firmware hiện tại: 1 kênh (index 0), 16 bit
+LEGACY_LAYOUT = get_layout(((0,), (DEFAULT_BITS,)))
@@ -0,0 +1,390 @@
+# ==============================================================================
+# NHIỀU THIẾT BỊ TRÊN 1 LUỒNG ĐỌC (selectors) + GHI CHUNG 1 PHIÊN ĐO
+# ==============================================================================
+# - Mỗi cổng vẫn là 1 BiomechanicsHost (parser, gom lô, bảng lệnh riêng) nhưng không
+#   có luồng đọc riêng: 1 luồng duy nhất select() trên fd của mọi cổng rồi đẩy byte
+#   vào host._handle_bytes. Cổng không có fileno (replay) được đọc mỗi vòng select.
+# - Đồng hồ chung: ts MCU (ms) của từng thiết bị được quy về time.time() của host bằng
+#   host.timing (sample_timing.py: đường bao dưới của t_nhận - ts + bù trôi clock).
+# - Ghi phiên: thư mục session_<thời gian>/ gồm <tên thiết bị>.bms (pc_time đã căn chỉnh)
+#   + session.json. Toàn bộ thiết bị dùng chung 1 luồng ghi (BlockRecorder).
+# - Mất kết nối 1 cổng không chặn các cổng khác: cổng đó được thử mở lại theo lịch backoff.
+import json
+import os
+import selectors
+import sys
+import threading
+import time
+from datetime import datetime
+
+import serial
+
+from giao_tiep_protocol import (
+    BiomechanicsHost, BAUD_RATE, READ_CHUNK, READ_TIMEOUT, RECONNECT_DELAY, RECONNECT_DELAY_MAX,
+    CMD_GET_STATUS, CMD_START_MEASURE, CMD_STOP_MEASURE,
+)
+from command_pipeline import wait_all
+from recorder import BlockRecorder
+from metrics import REGISTRY
+from session_file import SessionWriter, SESSION_EXT
+
+SESSION_MANIFEST = "session.json"
+
+
+class _DeviceBlock:
+    """Khối mẫu kèm tên thiết bị để đi chung 1 hàng đợi ghi."""
+    __slots__ = ("name", "block")
+
+    def __init__(self, name, block):
+        self.name = name
+        self.block = block
+
+    def __len__(self):
+        return len(self.block)
+
+
+class SessionSink:
+    """Đích ghi của BlockRecorder: mỗi thiết bị 1 file .bms trong thư mục phiên."""
+
+    def __init__(self, directory, start_time=None):
+        self.filename = directory
+        self.start_time = time.time() if start_time is None else start_time
+        os.makedirs(directory, exist_ok=True)
+        self._writers = {}
+        self.files = {}        # tên thiết bị -> [file, ...] (file mới khi bố cục kênh đổi)
+        self.ports = {}
+
+    def write_block(self, item):
+        name, block = item.name, item.block
+        writer = self._writers.get(name)
+        if writer is None or writer.layout.key() != block.layout.key():
+            if writer is not None:
+                writer.close()
+            files = self.files.setdefault(name, [])
+            part = f"_part{len(files) + 1}" if files else ""
+            path = os.path.join(self.filename, f"{name}{part}{SESSION_EXT}")
+            writer = self._writers[name] = SessionWriter(path, block.layout, start_time=self.start_time)
+            files.append(os.path.basename(path))
+        writer.write_block(block)
+
+    def flush(self):
+        for writer in list(self._writers.values()):
+            writer.flush()
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        manifest = {
+            "start_time": self.start_time,
+            "clock": "pc_time = ts MCU quy ve dong ho host (sample_timing.ClockAligner)",
+            "devices": {name: {"port": self.ports.get(name), "files": files}
+                        for name, files in self.files.items()},
+        }
+        with open(os.path.join(self.filename, SESSION_MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+
+class ManagedDevice:
+    def __init__(self, name, port, baud):
+        self.name = name
+        self.host = BiomechanicsHost(port, baud)
+        self.host.echo = False
+        self.fd = None
+        self.connected = False
+        self.retry_at = 0.0
+        self.retry_delay = RECONNECT_DELAY
+        self.frames = 0
+        self._rate_frames = 0
+        self._rate_t = time.monotonic()
+        self.frame_rate = 0.0
+
+    def update_rate(self, now):
+        dt = now - self._rate_t
+        if dt > 0:
+            self.frame_rate = (self.frames - self._rate_frames) / dt
+        self._rate_frames = self.frames
+        self._rate_t = now
+
+
+class DeviceManager:
+    def __init__(self, ports, baud=BAUD_RATE, names=None):
+        self.devices = {}
+        names = names or [os.path.basename(p.rstrip('/\\')) or p for p in ports]
+        for name, port in zip(names, ports):
+            if name in self.devices:
+                name = f"{name}_{len(self.devices)}"
+            device = ManagedDevice(name, port, baud)
+            device.host.add_block_consumer(lambda block, d=device: self._on_block(d, block))
+            self.devices[name] = device
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+        self.thread = None
+        self.recorder = None
+        self.write_time = None      # metrics.Histogram khi bật đo đạc
+        self.block_consumers = []   # callback(name, block), block.pc_time đã căn theo đồng hồ chung
+        self.loop_iterations = 0
+        self.loop_errors = 0        # lỗi select (fd hỏng) trong vòng đọc chung
+
+    # --- KẾT NỐI ---
+    def open(self):
+        for device in self.devices.values():
+            self._try_open(device)
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.stop_recording()
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        for device in self.devices.values():
+            self._drop(device)
+            device.host.commands.cancel_all()
+        self.selector.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _try_open(self, device):
+        host = device.host
+        try:
+            host.ser = host._open_port()
+        except (serial.SerialException, OSError) as e:
+            device.retry_at = time.monotonic() + device.retry_delay
+            device.retry_delay = min(device.retry_delay * 2, RECONNECT_DELAY_MAX)
+            sys.stdout.write(f"\n>> [ERROR] {device.name}: khong mo duoc {host.port}: {e}\n")
+            return False
+        try:
+            device.fd = host.ser.fileno()
+            self.selector.register(device.fd, selectors.EVENT_READ, device)
+        except (AttributeError, OSError, serial.SerialException):
+            device.fd = None  # replay: đọc mỗi vòng
+        host.parser.reset()
+        device.connected = True
+        device.retry_delay = RECONNECT_DELAY
+        return True
+
+    def _drop(self, device):
+        if device.fd is not None:
+            try:
+                self.selector.unregister(device.fd)
+            except (KeyError, ValueError):
+                pass
+            device.fd = None
+        ser = device.host.ser
+        if ser is not None:
+            try:
+                ser.close()
+            except Exception:
+                pass
+        device.connected = False
+
+    # --- VÒNG ĐỌC DUY NHẤT ---
+    def _loop(self):
+        devices = list(self.devices.values())
+        while self.running:
+            polled = [d for d in devices if d.connected and d.fd is None]
+            timeout = 0 if polled else READ_TIMEOUT
+            if self.selector.get_map():
+                # select đã chờ đủ timeout nếu không có gì đến -> không ngủ thêm
+                try:
+                    ready = [key.data for key, _ in self.selector.select(timeout)]
+                except (OSError, ValueError) as e:
+                    # fd hỏng: bỏ khỏi selector các thiết bị có fd không còn hợp lệ, vòng sau chạy tiếp
+                    self.loop_errors += 1
+                    self._drop_bad_fds(e)
+                    ready = []
+            else:
+                ready = []
+                if not polled:
+                    time.sleep(timeout)  # chưa có cổng nào mở: tránh vòng lặp bận
+            for device in ready + polled:
+                self._read(device)
+            now = time.monotonic()
+            for device in devices:
+                if not device.connected and now >= device.retry_at and self.running:
+                    self._reopen(device)
+                elif len(device.host.commands):
+                    try:
+                        device.host.commands.poll()
+                    except Exception as e:
+                        self._fail(device, "loi gui lenh", e)
+            self.loop_iterations += 1
+
+    def _fail(self, device, what, error):
+        # Lỗi của 1 thiết bị: đếm + báo, ngắt riêng thiết bị đó rồi thử mở lại (các thiết bị khác chạy tiếp)
+        device.host.process_errors += 1
+        sys.stdout.write(f"\n>> [ERROR] {device.name}: {what}: {error!r}. Se thu mo lai...\n")
+        self._drop(device)
+        device.retry_at = time.monotonic() + device.retry_delay
+
+    def _reopen(self, device):
+        try:
+            if self._try_open(device):
+                device.host.reconnects += 1
+        except Exception as e:
+            self._fail(device, "loi mo cong", e)
+            device.retry_delay = min(device.retry_delay * 2, RECONNECT_DELAY_MAX)
+
+    def _drop_bad_fds(self, error):
+        for device in self.devices.values():
+            if device.fd is None:
+                continue
+            try:
+                os.fstat(device.fd)
+            except OSError:
+                self._fail(device, "fd khong hop le", error)
+
+    def _read(self, device):
+        host = device.host
+        try:
+            n = host.ser.in_waiting
+            if not n and device.fd is not None:
+                # select báo sẵn sàng nhưng không có byte => cổng đã mất
+                raise serial.SerialException("cong khong con du lieu (EOF)")
+            data = host.ser.read(min(n, READ_CHUNK)) if n else b''
+        except (serial.SerialException, OSError) as e:
+            sys.stdout.write(f"\n>> [ERROR] Mat ket noi {device.name}: {e}. Se thu mo lai...\n")
+            self._drop(device)
+            device.retry_at = time.monotonic() + device.retry_delay
+            return
+        except Exception as e:
+            self._fail(device, "loi doc cong", e)
+            return
+        if data:
+            try:
+                host._handle_bytes(data, time.perf_counter())
+            except Exception as e:
+                # Như BiomechanicsHost._reader_loop: lỗi xử lý dữ liệu chỉ đếm + báo, không ngắt cổng
+                host.process_errors += 1
+                sys.stdout.write(f"\n>> [ERROR] {device.name}: Loi xu ly du lieu: {e!r}\n")
+
+    def _on_block(self, device, block):
+        device.frames += len(block)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.submit(_DeviceBlock(device.name, block))
+        for callback in self.block_consumers:
+            callback(device.name, block)
+
+    # --- LỆNH ---
+    def command(self, cmd_id, args=b'', names=None, timeout=None):
+        """Gửi cùng 1 lệnh tới các thiết bị (mặc định: tất cả) song song. -> {tên: Ack}."""
+        names = list(self.devices) if names is None else names
+        futures = [self.devices[n].host.submit_command(cmd_id, args, timeout) for n in names]
+        return dict(zip(names, wait_all(futures)))
+
+    def start_measure(self):
+        return self.command(CMD_START_MEASURE)
+
+    def stop_measure(self):
+        return self.command(CMD_STOP_MEASURE)
+
+    # --- GHI PHIÊN ---
+    def start_recording(self, directory=None):
+        if self.recorder is not None:
+            return self.recorder.filename
+        if directory is None:
+            directory = f"session_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+        sink = SessionSink(directory)
+        sink.ports = {name: d.host.port for name, d in self.devices.items()}
+        self.recorder = BlockRecorder(sink).start()
+        self.recorder.write_time = self.write_time
+        sys.stdout.write(f"\n>> [REC] BAT DAU GHI PHIEN: {directory} ({len(self.devices)} thiet bi)\n")
+        return directory
+
+    def stop_recording(self):
+        recorder = self.recorder
+        if recorder is None:
+            return None
+        self.recorder = None
+        recorder.stop()
+        stats = recorder.stats()
+        sys.stdout.write(f"\n>> [REC] DA LUU PHIEN: {recorder.filename} ({stats['written_frames']} frame"
+                         f", bo {stats['dropped_frames']})\n")
+        return stats
+
+    # --- ĐO ĐẠC (metrics.py) ---
+    def enable_metrics(self, registry=REGISTRY):
+        """Bật đo đạc cho mọi thiết bị (nhãn device=<tên>) + thời gian ghi của luồng ghi chung."""
+        for name, device in self.devices.items():
+            device.host.enable_metrics(registry, {"device": name})
+        self.write_time = registry.histogram("bm_session_write_seconds",
+                                             help="Thoi gian ghi 1 khoi vao phien")
+        if self.recorder is not None:
+            self.recorder.write_time = self.write_time
+
+    def disable_metrics(self):
+        for device in self.devices.values():
+            device.host.disable_metrics()
+        self.write_time = None
+        if self.recorder is not None:
+            self.recorder.write_time = None
+
+    # --- THỐNG KÊ ---
+    def stats(self):
+        """Theo thiết bị: tốc độ frame (tính từ lần gọi trước), độ sâu hàng đợi, lỗi đường truyền."""
+        now = time.monotonic()
+        out = {}
+        for name, device in self.devices.items():
+            device.update_rate(now)
+            host = device.host
+            try:
+                os_queue = host.ser.in_waiting if device.connected else 0
+            except (serial.SerialException, OSError):
+                os_queue = 0
+            link = host.parser.stats()
+            out[name] = {
+                "connected": device.connected,
+                "frames": device.frames,
+                "frame_rate": device.frame_rate,
+                "os_queue_bytes": os_queue,
+                "parser_backlog_bytes": host.parser.backlog,
+                "crc_errors": link["crc_errors"],
+                "resync_bytes": link["resync_bytes"],
+                "layout_mismatches": host.layout_mismatches,
+                "reconnects": host.reconnects,
+                "process_errors": host.process_errors,
+                "missing_samples": host.timing.missing,
+                "jitter_ms": host.timing.jitter_ms,
+                "clock_offset": host.timing.clock.offset,
+                "clock_skew_ppm": host.timing.clock.skew * 1e6,
+            }
+        if self.recorder is not None:
+            out["_recorder"] = self.recorder.stats()
+        out["_loop"] = {"iterations": self.loop_iterations, "errors": self.loop_errors}
+        return out
+
+
+# ==============================================================================
+# CHẠY: python device_manager.py PORT1 PORT2 ... (Ctrl+C để dừng)
+# ==============================================================================
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Cach dung: python device_manager.py <port> [port ...]")
+        sys.exit(1)
+    manager = DeviceManager(sys.argv[1:]).open()
+    try:
+        manager.command(CMD_GET_STATUS)
+        manager.start_measure()
+        manager.start_recording()
+        while True:
+            time.sleep(1.0)
+            line = " | ".join(f"{n}: {s['frame_rate']:.0f} f/s q={s['os_queue_bytes']}"
+                              for n, s in manager.stats().items() if not n.startswith("_"))
+            sys.stdout.write(f"\r{line}    ")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            manager.stop_measure()
+        except Exception:
+            pass
+        manager.close()
@@ -0,0 +1,515 @@
+# ==============================================================================
+# THIẾT BỊ GIẢ LẬP TRÊN PTY (LINUX) ĐỂ THỬ TẢI KHÔNG CẦN PHẦN CỨNG
+# ==============================================================================
+# Bắt chước for_mcu/ban_chuan_protocol.ino và PROTOCOL.md:
+#   - Nhận COMMAND (mục 7): GET_STATUS / START / STOP / SET_NSENSORS / SET_RATE / SET_BITS /
+#     SET_ACTIVEMAP / CALIBRATE -> ACK (mục 8), lệnh đổi cấu hình gửi STATUS 144 byte sau ACK.
+#   - IDLE: STATUS heartbeat mỗi HEARTBEAT_S giây. MEASURING: DATA theo SampRateMap
+#     (tối đa 32 kênh, 1-4 byte/mẫu, tới 65535 Hz), ts = millis() của thiết bị.
+#   - Hàng đợi gửi đầy (host đọc không kịp) -> bỏ DATA + ERROR ADC_OVERRUN (mục 9).
+# Host kết nối tới sim.port như cổng COM thật (BiomechanicsHost không cần sửa).
+#
+# Lỗi chèn theo kịch bản (Fault):
+#   bitflip / truncate / drop / garbage : áp lên frame DATA (xác suất mỗi frame hoặc 1 lần tại giây "at")
+#   burst : giữ mọi byte gửi trong "duration" giây rồi xả 1 lần
+#   stall : thiết bị treo "duration" giây (DATA trong lúc treo mất), sau đó ERROR FIFO_CRITICAL
+#   error : gửi 1 frame ERROR (code, aux)
+#
+#   python device_sim.py -c 8 -r 1000 -b 24 -f bitflip:prob=1e-4 -f stall:at=5,duration=0.5
+import argparse
+import os
+import select
+import struct
+import threading
+import time
+import tty
+
+import numpy as np
+
+import crc16
+from data_layout import DeviceStatus, DataLayout, MAX_SENSORS
+from frame_parser import (
+    FrameParser, build_frame, SOF, PROTOCOL_VER, HEADER_LEN, CRC_LEN,
+    TYPE_STATUS, TYPE_DATA, TYPE_COMMAND, TYPE_ACK, TYPE_ERROR,
+)
+from sample_block import layout_dtype
+from command_pipeline import (
+    ACK_OK, ACK_INVALID_COMMAND, ACK_INVALID_ARGUMENT,
+)
+from giao_tiep_protocol import (
+    CMD_GET_STATUS, CMD_START_MEASURE, CMD_STOP_MEASURE, CMD_SET_NSENSORS, CMD_SET_RATE,
+    CMD_SET_BITS, CMD_SET_ACTIVEMAP, CMD_CALIBRATE,
+)
+
+STATE_IDLE = 0x00
+STATE_MEASURING = 0x01
+STATE_CALIB = 0x02
+
+ERR_ADC_OVERRUN = 0x01
+ERR_FIFO_CRITICAL = 0x03
+
+DEFAULT_RATE_HZ = 10            # firmware hiện tại: 1 DATA / 100 ms
+HEARTBEAT_S = 3.0
+CALIB_S = 0.5
+MAX_FRAMES_PER_TICK = 4096      # số DATA tạo tối đa mỗi vòng lặp
+TX_QUEUE_MAX = 4 << 20          # byte chờ gửi; vượt => bỏ DATA (ADC_OVERRUN)
+IDLE_WAIT = 0.05                # s, thời gian chờ select tối đa
+
+_ERROR_STRUCT = struct.Struct('<IBH')
+_HEADER_STRUCT = struct.Struct('<BBH')
+
+# Args hợp lệ của từng lệnh (mục 7.4)
+_COMMAND_ARGS = {
+    CMD_GET_STATUS: 0, CMD_START_MEASURE: 0, CMD_STOP_MEASURE: 0, CMD_SET_NSENSORS: 1,
+    CMD_SET_RATE: 3, CMD_SET_BITS: 2, CMD_SET_ACTIVEMAP: 4, CMD_CALIBRATE: 1,
+}
+
+FRAME_FAULTS = ("bitflip", "truncate", "drop", "garbage")
+TIME_FAULTS = ("burst", "stall", "error")
+
+
+class Fault:
+    """1 lỗi chèn: theo xác suất mỗi frame DATA (prob) hoặc 1 lần tại giây thứ "at" kể từ START."""
+
+    def __init__(self, kind, at=None, prob=0.0, count=1, duration=0.0, code=ERR_ADC_OVERRUN, aux=0, size=64):
+        if kind not in FRAME_FAULTS + TIME_FAULTS:
+            raise ValueError(f"Loai loi khong ho tro: {kind}")
+        if kind in TIME_FAULTS and at is None:
+            raise ValueError(f"{kind} can tham so at")
+        self.kind = kind
+        self.at = at
+        self.prob = prob
+        self.count = count          # bitflip: số bit lật / frame; drop: số frame liên tiếp
+        self.duration = duration    # burst / stall (s)
+        self.code = code            # error
+        self.aux = aux
+        self.size = size            # garbage: số byte rác
+        self.fired = False
+        self.hits = 0
+
+    @classmethod
+    def parse(cls, text):
+        """"stall:at=5,duration=0.5" -> Fault."""
+        kind, _, params = text.partition(':')
+        kwargs = {}
+        for item in filter(None, params.split(',')):
+            key, _, value = item.partition('=')
+            kwargs[key] = float(value) if key in ("at", "prob", "duration") else int(value, 0)
+        return cls(kind, **kwargs)
+
+    def __repr__(self):
+        when = f"at={self.at}s" if self.at is not None else f"prob={self.prob}"
+        return f"Fault({self.kind}, {when}, hits={self.hits})"
+
+
+class SimulatedDevice:
+    def __init__(self, n_channels=1, rates=None, bits=None, faults=(), clock_ppm=0.0, seed=0, legacy=None):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+        # Cấu hình giống STATUS (mục 5). legacy: ActiveMap/SampRate/Bits = 0 như firmware hiện tại
+        if legacy is None:
+            legacy = n_channels == 1 and rates is None and bits is None
+        self.state = STATE_IDLE
+        self.n_sensors = n_channels
+        self.active_map = 0 if legacy else (1 << n_channels) - 1
+        self.rates = [0] * MAX_SENSORS
+        self.bits = [0] * MAX_SENSORS
+        if not legacy:
+            for ch in range(n_channels):
+                self.rates[ch] = rates if isinstance(rates, int) else (rates or {}).get(ch, DEFAULT_RATE_HZ)
+                self.bits[ch] = bits if isinstance(bits, int) else (bits or {}).get(ch, 16)
+        self.faults = list(faults)
+        self.clock_ppm = clock_ppm
+        self.rng = np.random.default_rng(seed)
+
+        self.parser = FrameParser(max_payload_len={TYPE_COMMAND: 2 + 4})
+        self._tx = bytearray()
+        self._boot = time.monotonic()
+        self._measure_t0 = 0.0
+        self._frame_index = 0
+        self._next_heartbeat = 0.0
+        self._calib_until = None
+        self._calib_state = STATE_IDLE
+        self._hold_until = 0.0      # burst / stall: chưa gửi byte nào trước thời điểm này
+        self._stall_until = 0.0
+        self._stall_dropped = 0
+        self._overrun = False
+        self._layout = None
+
+        # Thống kê
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.dropped_frames = 0     # hàng đợi đầy / stall / fault drop
+        self.commands = 0
+        self.bad_commands = 0
+
+        self._lock = threading.Lock()
+        self.running = True
+        self._send_status()         # firmware gửi STATUS ngay khi khởi động
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    # --- TRẠNG THÁI ---
+    def status(self):
+        return DeviceStatus(self.state, self.n_sensors, self.active_map, self.active_map,
+                            self.rates, bytes(self.bits), bytes(MAX_SENSORS))
+
+    @property
+    def layout(self):
+        return DataLayout.from_status(self.status())
+
+    @property
+    def frame_rate(self):
+        channels = self.layout.channels
+        return max((self.rates[ch] for ch in channels), default=0) or DEFAULT_RATE_HZ
+
+    def millis(self, t=None):
+        t = time.monotonic() if t is None else t
+        return int((t - self._boot) * 1000.0 * (1.0 + self.clock_ppm * 1e-6)) & 0xFFFFFFFF
+
+    def inject(self, fault):
+        """Thêm lỗi khi đang chạy (vd. Fault("stall", at=0, duration=1) = treo ngay)."""
+        with self._lock:
+            if fault.at is not None and self.state == STATE_MEASURING:
+                fault.at += time.monotonic() - self._measure_t0
+            self.faults.append(fault)
+
+    # --- GỬI ---
+    def _queue(self, msg_type, payload):
+        self._tx += build_frame(msg_type, payload)
+
+    def _send_status(self):
+        self._queue(TYPE_STATUS, self.status().to_payload())
+
+    def _send_error(self, code, aux):
+        self._queue(TYPE_ERROR, _ERROR_STRUCT.pack(self.millis() * 1000 & 0xFFFFFFFF, code, min(aux, 0xFFFF)))
+
+    def _flush_tx(self, now):
+        if not self._tx or now < self._hold_until:
+            return
+        try:
+            n = os.write(self.master, self._tx)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.running = False
+            return
+        del self._tx[:n]
+        self.bytes_sent += n
+
+    # --- LỆNH ---
+    def _handle_command(self, payload):
+        if len(payload) < 2:
+            return
+        cmd, seq = payload[0], payload[1]
+        args = bytes(payload[2:])
+        self.commands += 1
+        need = _COMMAND_ARGS.get(cmd)
+        if need is None:
+            self.bad_commands += 1
+            self._queue(TYPE_ACK, bytes([cmd, seq, ACK_INVALID_COMMAND]))
+            return
+        if len(args) != need:
+            self.bad_commands += 1
+            self._queue(TYPE_ACK, bytes([cmd, seq, ACK_INVALID_ARGUMENT]))
+            return
+
+        result = ACK_OK
+        config_changed = False
+        if cmd == CMD_START_MEASURE:
+            if self.state != STATE_MEASURING:
+                self._start_measure()
+        elif cmd == CMD_STOP_MEASURE:
+            self.state = STATE_IDLE
+        elif cmd == CMD_SET_NSENSORS:
+            if args[0] > MAX_SENSORS:
+                result = ACK_INVALID_ARGUMENT
+            else:
+                self.n_sensors = args[0]
+                config_changed = True
+        elif cmd == CMD_SET_RATE:
+            index, hz = struct.unpack('<BH', args)
+            if index >= MAX_SENSORS:
+                result = ACK_INVALID_ARGUMENT
+            else:
+                self.rates[index] = hz
+                config_changed = True
+        elif cmd == CMD_SET_BITS:
+            index, nbits = args
+            if index >= MAX_SENSORS or not 1 <= nbits <= 32:
+                result = ACK_INVALID_ARGUMENT
+            else:
+                self.bits[index] = nbits
+                config_changed = True
+        elif cmd == CMD_SET_ACTIVEMAP:
+            self.active_map = struct.unpack('<I', args)[0]
+            config_changed = True
+        elif cmd == CMD_CALIBRATE:
+            self._calib_state = self.state
+            self.state = STATE_CALIB
+            self._calib_until = time.monotonic() + CALIB_S
+            config_changed = True
+        if result != ACK_OK:
+            self.bad_commands += 1
+        self._queue(TYPE_ACK, bytes([cmd, seq, result]))
+        # GET_STATUS và mọi lệnh đổi cấu hình: STATUS sau ACK (mục 7.5)
+        if result == ACK_OK and (cmd == CMD_GET_STATUS or config_changed):
+            self._send_status()
+            if config_changed and self.state == STATE_MEASURING:
+                self._restart_timeline()
+
+    def _start_measure(self):
+        self.state = STATE_MEASURING
+        self._measure_t0 = time.monotonic()
+        self._measure_ts = self.millis(self._measure_t0)
+        self._frame_index = 0
+        for fault in self.faults:
+            fault.fired = False
+
+    def _restart_timeline(self):
+        # Tần số / bố cục đổi giữa chừng: đánh số frame lại từ bây giờ, ts vẫn liên tục
+        now = time.monotonic()
+        elapsed = now - self._measure_t0
+        self._measure_ts = self.millis(now)
+        self._measure_t0 = now
+        for fault in self.faults:
+            if fault.at is not None:
+                fault.at -= elapsed
+        self._frame_index = 0
+
+    # --- DATA ---
+    def _data_template(self, layout):
+        if self._layout is None or self._layout.key() != layout.key():
+            self._layout = layout
+            dtype = layout_dtype(layout)
+            header = SOF + _HEADER_STRUCT.pack(PROTOCOL_VER, TYPE_DATA, layout.payload_len)
+            self._frame_dtype = np.dtype([('head', 'u1', HEADER_LEN), ('payload', dtype), ('crc', '<u2')])
+            self._frame_head = np.frombuffer(header, dtype=np.uint8)
+        return self._frame_dtype
+
+    def _build_data(self, first, n):
+        """n frame DATA từ frame số first -> (mảng frame có cấu trúc, thời điểm tương đối mỗi frame)."""
+        layout = self.layout
+        rate = self.frame_rate
+        frames = np.zeros(n, dtype=self._data_template(layout))
+        t = np.arange(first, first + n, dtype=np.float64) / rate
+        ts = self._measure_ts + t * 1000.0 * (1.0 + self.clock_ppm * 1e-6)
+        frames['head'] = self._frame_head
+        payload = frames['payload']
+        # millis() nguyên: làm tròn xuống nhưng bỏ sai số dấu phẩy động (0.999999 ms -> 1 ms)
+        payload['ts'] = np.floor(ts + 1e-6).astype(np.int64) & 0xFFFFFFFF
+        for ch, nbits, nbytes in zip(layout.channels, layout.bits, layout.sample_bytes):
+            full = (1 << nbits) - 1
+            wave = 0.5 + 0.4 * np.sin(2 * np.pi * 0.5 * t + ch) + self.rng.normal(0, 0.01, n)
+            values = (np.clip(wave, 0.0, 1.0) * full).astype(np.uint32)
+            if nbytes == 3:
+                payload[f'ch{ch}'] = values.view(np.uint8).reshape(n, 4)[:, :3]
+            else:
+                payload[f'ch{ch}'] = values
+        # CRC của Ver | Type | Len | Payload từng frame (crc_hqx, C)
+        raw = frames.view(np.uint8).reshape(n, -1)
+        update, init = crc16.update, crc16.CRC16_INIT
+        end = raw.shape[1] - CRC_LEN
+        frames['crc'] = [update(init, row[2:end]) for row in raw]
+        return frames, t
+
+    def _generate(self, now):
+        if self.state != STATE_MEASURING:
+            return
+        rate = self.frame_rate
+        due = int((now - self._measure_t0) * rate) + 1
+        n = min(due - self._frame_index, MAX_FRAMES_PER_TICK)
+        if n <= 0:
+            return
+        first = self._frame_index
+        self._frame_index += n
+        if now < self._stall_until:
+            self._stall_dropped += n
+            self.dropped_frames += n
+            return
+        if len(self._tx) > TX_QUEUE_MAX:
+            # Host đọc không kịp: thiết bị bỏ mẫu như ADC_OVERRUN thật
+            self.dropped_frames += n
+            if not self._overrun:
+                self._overrun = True
+                self._send_error(ERR_ADC_OVERRUN, n)
+            return
+        self._overrun = False
+        frames, t = self._build_data(first, n)
+        hits = self._frame_fault_hits(t)
+        if not hits:
+            self._tx += frames.tobytes()
+            self.frames_sent += n
+            return
+        self._apply_frame_faults(frames, hits)
+
+    def _frame_fault_hits(self, t):
+        hits = {}
+        for fault in self.faults:
+            if fault.kind not in FRAME_FAULTS:
+                continue
+            if fault.at is not None:
+                if fault.fired or t[-1] < fault.at:
+                    continue
+                fault.fired = True
+                idx = [int(np.searchsorted(t, fault.at))]
+            elif fault.prob:
+                idx = np.flatnonzero(self.rng.random(len(t)) < fault.prob).tolist()
+            else:
+                continue
+            for i in idx:
+                hits.setdefault(i, []).append(fault)
+        return hits
+
+    def _apply_frame_faults(self, frames, hits):
+        raw = frames.view(np.uint8).reshape(len(frames), -1)
+        out = self._tx
+        skip = 0
+        for i in range(len(frames)):
+            if skip:
+                skip -= 1
+                self.dropped_frames += 1
+                continue
+            faults = hits.get(i)
+            if not faults:
+                out += raw[i].tobytes()
+                self.frames_sent += 1
+                continue
+            frame = bytearray(raw[i].tobytes())
+            keep = True
+            for fault in faults:
+                fault.hits += 1
+                if fault.kind == "bitflip":
+                    for bit in self.rng.integers(0, len(frame) * 8, fault.count).tolist():
+                        frame[bit >> 3] ^= 1 << (bit & 7)
+                elif fault.kind == "truncate":
+                    del frame[int(self.rng.integers(1, len(frame))):]
+                elif fault.kind == "garbage":
+                    out += self.rng.integers(0, 256, fault.size, dtype=np.uint8).tobytes()
+                elif fault.kind == "drop":
+                    keep = False
+                    skip = max(skip, fault.count - 1)
+            if keep:
+                out += frame
+                self.frames_sent += 1
+            else:
+                self.dropped_frames += 1
+
+    def _time_faults(self, now):
+        if self.state != STATE_MEASURING:
+            return
+        elapsed = now - self._measure_t0
+        for fault in self.faults:
+            if fault.kind not in TIME_FAULTS or fault.fired or elapsed < fault.at:
+                continue
+            fault.fired = True
+            fault.hits += 1
+            if fault.kind == "error":
+                self._send_error(fault.code, fault.aux)
+            elif fault.kind == "burst":
+                self._hold_until = max(self._hold_until, now + fault.duration)
+            elif fault.kind == "stall":
+                self._hold_until = max(self._hold_until, now + fault.duration)
+                self._stall_until = max(self._stall_until, now + fault.duration)
+                self._stall_dropped = 0
+
+    # --- VÒNG LẶP ---
+    def _loop(self):
+        while self.running:
+            now = time.monotonic()
+            with self._lock:
+                if self._stall_dropped and now >= self._stall_until:
+                    self._send_error(ERR_FIFO_CRITICAL, self._stall_dropped)
+                    self._stall_dropped = 0
+                if self._calib_until is not None and now >= self._calib_until:
+                    self._calib_until = None
+                    self.state = self._calib_state
+                    self._send_status()
+                if self.state == STATE_IDLE and now >= self._next_heartbeat:
+                    self._next_heartbeat = now + HEARTBEAT_S
+                    self._send_status()
+                self._time_faults(now)
+                self._generate(now)
+                self._flush_tx(now)
+
+            wait = IDLE_WAIT
+            if self.state == STATE_MEASURING:
+                wait = min(wait, max(0.0, (self._frame_index / self.frame_rate) - (now - self._measure_t0)))
+            if now < self._hold_until:
+                wait = min(wait, self._hold_until - now)
+            writers = [self.master] if self._tx and now >= self._hold_until else []
+            try:
+                readable, _, _ = select.select([self.master], writers, [], wait)
+            except (OSError, ValueError):
+                break
+            if readable:
+                try:
+                    data = os.read(self.master, 4096)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    break
+                with self._lock:
+                    for msg_type, payload in self.parser.feed(data):
+                        if msg_type == TYPE_COMMAND:
+                            self._handle_command(payload)
+
+    def stats(self):
+        elapsed = time.monotonic() - self._measure_t0 if self.state == STATE_MEASURING else 0.0
+        return {
+            "state": self.state,
+            "frame_rate": self.frame_rate,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped_frames": self.dropped_frames,
+            "tx_queue_bytes": len(self._tx),
+            "commands": self.commands,
+            "bad_commands": self.bad_commands,
+            "achieved_rate": self._frame_index / elapsed if elapsed else 0.0,
+            "faults": [repr(f) for f in self.faults],
+        }
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Thiet bi gia lap tren pty")
+    ap.add_argument("-c", "--channels", type=int, default=1)
+    ap.add_argument("-r", "--rate", type=int, default=None, help="Hz moi kenh (mac dinh: firmware cu 10 Hz)")
+    ap.add_argument("-b", "--bits", type=int, default=None, help="bit / mau (1-32)")
+    ap.add_argument("--ppm", type=float, default=0.0, help="clock MCU nhanh hon host (ppm)")
+    ap.add_argument("-f", "--fault", action="append", default=[], type=Fault.parse,
+                    help="vd. bitflip:prob=1e-4 | truncate:at=3 | drop:at=2,count=50 | burst:at=4,duration=0.5"
+                         " | stall:at=5,duration=1 | error:at=6,code=2,aux=3 | garbage:prob=1e-3,size=32")
+    ap.add_argument("--start", action="store_true", help="bat dau do ngay, khong cho START_MEASURE")
+    args = ap.parse_args()
+
+    device = SimulatedDevice(args.channels, args.rate, args.bits, args.fault, clock_ppm=args.ppm)
+    if args.start:
+        with device._lock:
+            device._start_measure()
+    print(f">> [SIM] Cong: {device.port} | {device.layout.n_channels} kenh @ {device.frame_rate} Hz"
+          f" | payload {device.layout.payload_len} byte (Ctrl+C de dung)")
+    try:
+        while True:
+            time.sleep(1.0)
+            s = device.stats()
+            print(f">> [SIM] state={s['state']} gui={s['frames_sent']} ({s['achieved_rate']:.0f} f/s)"
+                  f" bo={s['dropped_frames']} tx_q={s['tx_queue_bytes']} lenh={s['commands']}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        device.close()
@@ -0,0 +1,615 @@
+# ==============================================================================
+# DSP TRỰC TUYẾN SAU GIẢI MÃ: LỌC, HẠ TẦN SỐ CHỐNG ALIAS, TÓM TẮT MIN/MAX/MEAN NHIỀU MỨC
+# ==============================================================================
+# DspStage gắn vào host như 1 block consumer (cùng kiểu shm_stream.Publisher):
+#   SampleBlock (volts, tần số frame) -> [làm trơn: trung bình trượt | IIR 1 cực]
+#                                      -> [FIR chống alias + hạ tần số] -> DspBlock -> consumer
+#   SampleBlock (volts thô)           -> tháp tóm tắt min/max/mean theo cửa sổ pc_time
+# - Mỗi frame DATA mang 1 mẫu của mọi kênh, tần số frame = tần số lớn nhất trong SampRateMap;
+#   tần số cắt của bộ lọc chống alias lấy theo từng kênh: 0.8 * min(tần số ra, tần số kênh) / 2.
+#   Thiết bị không báo tần số (firmware cũ) -> dùng chu kỳ SampleTiming tự học.
+# - Mọi bộ lọc giữ trạng thái giữa các khối và chạy bằng NumPy trên cả khối (không lặp từng mẫu).
+# - Tháp tóm tắt: mức đầu (vd 1 s) tính từ mẫu, các mức sau (10 s, 60 s) gộp từ mức trước.
+#   Khi đang ghi, mỗi mức ghi 1 file .bmsum cạnh file dữ liệu thô:
+#     sensor_data_<thời gian>.csv -> sensor_data_<thời gian>.sum1s.bmsum, .sum10s.bmsum ...
+#   Bố cục .bmsum: [Header 256 byte như .bms, RecordSize + Level (s)] + record cố định độ dài
+#     t0 f8 (giây epoch đầu cửa sổ) | count u4 | min f4[C] | max f4[C] | mean f4[C]
+#   Đọc bằng memmap (SummaryReader) -> xem cả phiên nhiều giờ chỉ đọc vài nghìn record.
+import glob
+import math
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from data_layout import DeviceStatus, DataLayout, STATUS_PAYLOAD_LEN
+from sample_block import pc_times
+
+SUMMARY_MAGIC = b'BMSUM001'
+SUMMARY_VERSION = 1
+SUMMARY_EXT = '.bmsum'
+HEADER_SIZE = 256
+DEFAULT_LEVELS = (1, 10, 60)        # s
+ANTIALIAS_MARGIN = 0.8              # cắt ở 80% Nyquist của tần số ra
+TAPS_PER_FACTOR = 8                 # độ dài FIR = 8 * hệ số hạ + 1
+MAX_TAPS = 4097
+PASS_THROUGH_D = 1e-12              # OnePole: hệ số nhớ d = 1 - alpha nhỏ hơn -> bỏ qua lọc
+BATCH_FRAMES = 256                  # DspStage gom tới chừng này frame ...
+BATCH_MAX_DELAY = 0.05              # ... hoặc chừng này giây (theo pc_time) rồi mới xử lý
+
+_HEADER_STRUCT = struct.Struct('<8sHHId')
+_STATUS_OFFSET = _HEADER_STRUCT.size
+
+
+# ==============================================================================
+# 1. BỘ LỌC CÓ TRẠNG THÁI (đầu vào / ra: mảng (N, C) float)
+# ==============================================================================
+def design_lowpass(cutoff, taps):
+    """FIR pha tuyến tính (sinc cửa sổ Hamming), cutoff theo chu kỳ / mẫu (0 < cutoff <= 0.5), DC gain 1."""
+    n = np.arange(taps) - (taps - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return h / h.sum()
+
+
+class MovingAverage:
+    """Trung bình trượt n mẫu (cumsum trên khối + phần đuôi của khối trước)."""
+
+    def __init__(self, n):
+        self.n = n
+        self._tail = None
+
+    def reset(self):
+        self._tail = None
+
+    def process(self, x):
+        if self.n <= 1 or not len(x):
+            return x
+        if self._tail is None:
+            self._tail = np.repeat(x[:1], self.n - 1, axis=0)
+        ext = np.concatenate((self._tail, x))
+        c = np.cumsum(ext, axis=0)
+        out = np.empty_like(x, dtype=np.float64)
+        out[0] = c[self.n - 1]
+        out[1:] = c[self.n:] - c[:-self.n]
+        self._tail = ext[-(self.n - 1):]
+        return out / self.n
+
+
+class OnePole:
+    """IIR 1 cực y += a * (x - y), tần số cắt fc (Hz) ở tần số mẫu fs.
+
+    Tính đóng trên cả khối: y_k = d^k * y_0 + a * d^k * sum_{j<=k} d^-j * x_j (d = 1 - a),
+    chia đoạn để d^-j không tràn float64.
+    """
+
+    def __init__(self, cutoff_hz, fs):
+        self.cutoff_hz = cutoff_hz
+        self.set_rate(fs)
+
+    def set_rate(self, fs):
+        self.alpha = 1.0 - math.exp(-2 * math.pi * self.cutoff_hz / fs)
+        d = 1.0 - self.alpha
+        # Tần số cắt >> fs: d gần 0 (exp tràn dưới -> d = 0, chia d^-j ra NaN) -> coi như không lọc
+        if d < PASS_THROUGH_D:
+            self.alpha, d = 1.0, 0.0
+        self._chunk = max(1, int(-300 / math.log10(d))) if 0 < d < 1 else 1 << 20
+        self._y = None
+
+    def reset(self):
+        self._y = None
+
+    def process(self, x):
+        if not len(x):
+            return x
+        a = self.alpha
+        d = 1.0 - a
+        if d == 0.0:
+            out = np.array(x, dtype=np.float64)
+            self._y = out[-1]
+            return out
+        y = self._y if self._y is not None else np.asarray(x[0], dtype=np.float64)
+        out = np.empty(x.shape, dtype=np.float64)
+        for i0 in range(0, len(x), self._chunk):
+            seg = x[i0:i0 + self._chunk]
+            p = d ** np.arange(1, len(seg) + 1)[:, None]
+            out[i0:i0 + len(seg)] = p * (y + a * np.cumsum(seg / p, axis=0))
+            y = out[i0 + len(seg) - 1]
+        self._y = y
+        return out
+
+
+class FirDecimator:
+    """Lọc chống alias (FIR riêng từng kênh) rồi giữ 1 / factor mẫu; chỉ tính tại các mẫu được giữ.
+
+    cutoffs: tần số cắt từng kênh theo chu kỳ / mẫu vào.
+    """
+
+    def __init__(self, factor, cutoffs):
+        self.factor = factor
+        self.taps = min(TAPS_PER_FACTOR * factor + 1, MAX_TAPS)
+        self.h = np.stack([design_lowpass(c, self.taps) for c in cutoffs])     # (C, taps)
+        self.delay = (self.taps - 1) // 2       # trễ nhóm (mẫu vào)
+        self._hist = None
+        self._hist_t = None
+        self._phase = 0                         # vị trí mẫu ra kế tiếp trong khối sau
+
+    def reset(self):
+        self._hist = None
+        self._hist_t = None
+        self._phase = 0
+
+    def process(self, x, times):
+        """x (N, C), times: các cột thời gian (N,) đi kèm -> (y (M, C), times ở tâm cửa sổ)."""
+        n = len(x)
+        h_len = self.taps - 1
+        if self._hist is None:
+            # Khởi đầu bằng mẫu đầu tiên lặp lại: không có quá độ từ 0
+            self._hist = np.repeat(x[:1], h_len, axis=0)
+            self._hist_t = [np.repeat(t[:1], h_len) for t in times]
+        ext = np.concatenate((self._hist, x))
+        ext_t = [np.concatenate((ht, t)) for ht, t in zip(self._hist_t, times)]
+        phase = self._phase
+        idx = np.arange(phase, n, self.factor)
+        if len(idx):
+            windows = sliding_window_view(ext, self.taps, axis=0)[phase::self.factor]
+            y = np.einsum('mct,ct->mc', windows, self.h)
+            out_t = [t[idx + self.delay] for t in ext_t]
+            self._phase = int(idx[-1]) + self.factor - n
+        else:
+            y = np.empty((0, x.shape[1]))
+            out_t = [t[:0] for t in ext_t]
+            self._phase = phase - n
+        self._hist = ext[-h_len:] if h_len else ext[:0]
+        self._hist_t = [t[-h_len:] if h_len else t[:0] for t in ext_t]
+        return y, out_t
+
+
+# ==============================================================================
+# 2. TÓM TẮT MIN / MAX / MEAN THEO CỬA SỔ THỜI GIAN (THÁP NHIỀU MỨC)
+# ==============================================================================
+def summary_dtype(n_channels):
+    return np.dtype([('t0', '<f8'), ('count', '<u4'), ('min', '<f4', (n_channels,)),
+                     ('max', '<f4', (n_channels,)), ('mean', '<f4', (n_channels,))])
+
+
+class SummaryLevel:
+    """Gộp (t, count, min, max, sum) vào cửa sổ floor(t / seconds); trả về các cửa sổ đã đóng."""
+
+    def __init__(self, seconds, n_channels):
+        self.seconds = seconds
+        self.dtype = summary_dtype(n_channels)
+        self._open = None       # (window_id, count, min, max, sum) của cửa sổ chưa đóng
+
+    def add(self, t, count, vmin, vmax, vsum):
+        if not len(t):
+            return np.empty(0, dtype=self.dtype)
+        w = np.floor(t / self.seconds).astype(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(w)) + 1))
+        ids = w[starts]
+        counts = np.add.reduceat(count, starts)
+        mins = np.minimum.reduceat(vmin, starts, axis=0)
+        maxs = np.maximum.reduceat(vmax, starts, axis=0)
+        sums = np.add.reduceat(vsum, starts, axis=0)
+        if self._open is not None and self._open[0] == ids[0]:
+            _, c, lo, hi, s = self._open
+            counts[0] += c
+            mins[0] = np.minimum(mins[0], lo)
+            maxs[0] = np.maximum(maxs[0], hi)
+            sums[0] += s
+            closed_prev = None
+        else:
+            closed_prev = self._open
+        self._open = (ids[-1], counts[-1], mins[-1], maxs[-1], sums[-1])
+        n_closed = len(ids) - 1 + (closed_prev is not None)
+        out = np.empty(n_closed, dtype=self.dtype)
+        k = 0
+        if closed_prev is not None:
+            self._fill(out[:1], *closed_prev)
+            k = 1
+        if len(ids) > 1:
+            self._fill(out[k:], ids[:-1], counts[:-1], mins[:-1], maxs[:-1], sums[:-1])
+        return out
+
+    def _fill(self, out, ids, counts, mins, maxs, sums):
+        out['t0'] = np.asarray(ids, dtype=np.float64) * self.seconds
+        out['count'] = counts
+        out['min'] = mins
+        out['max'] = maxs
+        out['mean'] = np.asarray(sums) / np.asarray(counts)[..., None]
+
+    def flush(self):
+        """Đóng cửa sổ đang mở (khi dừng ghi)."""
+        out = np.empty(0 if self._open is None else 1, dtype=self.dtype)
+        if self._open is not None:
+            self._fill(out, *self._open)
+            self._open = None
+        return out
+
+
+class SummaryPyramid:
+    def __init__(self, n_channels, levels=DEFAULT_LEVELS):
+        self.levels = [SummaryLevel(s, n_channels) for s in sorted(levels)]
+
+    def add_samples(self, t, volts):
+        """-> list mảng record đã đóng của từng mức."""
+        ones = np.ones(len(t), dtype=np.int64)
+        closed = [self.levels[0].add(t, ones, volts, volts, volts)]
+        for level in self.levels[1:]:
+            closed.append(self._add_records(level, closed[-1]))
+        return closed
+
+    def flush(self):
+        closed = []
+        carry = None
+        for level in self.levels:
+            rec = level.flush() if carry is None else np.concatenate((self._add_records(level, carry),
+                                                                      level.flush()))
+            closed.append(rec)
+            carry = rec
+        return closed
+
+    @staticmethod
+    def _add_records(level, rec):
+        if not len(rec):
+            return np.empty(0, dtype=level.dtype)
+        counts = rec['count'].astype(np.int64)
+        return level.add(rec['t0'], counts, rec['min'], rec['max'],
+                         rec['mean'].astype(np.float64) * counts[:, None])
+
+
+# ==============================================================================
+# 3. FILE TÓM TẮT .bmsum (GHI / ĐỌC BẰNG MEMMAP)
+# ==============================================================================
+def summary_path(data_filename, seconds):
+    root, _ = os.path.splitext(data_filename)
+    return f"{root}.sum{seconds:g}s{SUMMARY_EXT}"
+
+
+class SummaryWriter:
+    def __init__(self, filename, layout, seconds, status=None):
+        self.filename = filename
+        self.seconds = seconds
+        self.dtype = summary_dtype(layout.n_channels)
+        self.records = 0
+        if status is None or status.layout_key() != layout.key():
+            status = DeviceStatus.from_layout(layout)
+        head = _HEADER_STRUCT.pack(SUMMARY_MAGIC, SUMMARY_VERSION, HEADER_SIZE,
+                                   self.dtype.itemsize, float(seconds))
+        head += status.to_payload()
+        self._file = open(filename, 'wb')
+        self._file.write(head + bytes(HEADER_SIZE - len(head)))
+
+    def write(self, rec):
+        if len(rec):
+            self._file.write(rec.data)
+            self.records += len(rec)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SummaryReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            head = f.read(HEADER_SIZE)
+        if len(head) < _STATUS_OFFSET + STATUS_PAYLOAD_LEN:
+            raise ValueError("File tom tat qua ngan")
+        magic, version, self.header_size, record_size, self.seconds = _HEADER_STRUCT.unpack_from(head)
+        if magic != SUMMARY_MAGIC:
+            raise ValueError(f"Sai magic: {magic!r}")
+        if version > SUMMARY_VERSION:
+            raise ValueError(f"Phien ban file chua ho tro: {version}")
+        self.status = DeviceStatus.from_payload(head[_STATUS_OFFSET:_STATUS_OFFSET + STATUS_PAYLOAD_LEN])
+        self.layout = DataLayout.from_status(self.status)
+        self.dtype = summary_dtype(self.layout.n_channels)
+        if self.dtype.itemsize != record_size:
+            raise ValueError("RecordSize khong khop voi STATUS trong header")
+        n_records = (os.path.getsize(path) - self.header_size) // record_size
+        if n_records > 0:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r',
+                                     offset=self.header_size, shape=(n_records,))
+        else:
+            self.records = np.empty(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def time_range(self, t_start, t_end):
+        """Các cửa sổ giao với [t_start, t_end] (pc_time, giây epoch)."""
+        t0 = self.records['t0']
+        i0 = int(np.searchsorted(t0, t_start - self.seconds, side='right'))
+        i1 = int(np.searchsorted(t0, t_end, side='right'))
+        return self.records[i0:i1]
+
+    def close(self):
+        mm = getattr(self.records, '_mmap', None)
+        self.records = np.empty(0, dtype=self.dtype)
+        if mm is not None:
+            try:
+                mm.close()
+            except BufferError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_pyramid(data_filename):
+    """{số giây: SummaryReader} của mọi mức tóm tắt cạnh file dữ liệu."""
+    root, _ = os.path.splitext(data_filename)
+    readers = {}
+    for path in glob.glob(f"{glob.escape(root)}.sum*s{SUMMARY_EXT}"):
+        reader = SummaryReader(path)
+        readers[reader.seconds] = reader
+    return dict(sorted(readers.items()))
+
+
+def query_pyramid(readers, t_start, t_end, max_points=2000):
+    """Mức mịn nhất có <= max_points cửa sổ trong [t_start, t_end] -> (số giây, record)."""
+    if not readers:
+        raise ValueError("Khong co muc tom tat nao")
+    for seconds, reader in readers.items():
+        if (t_end - t_start) / seconds <= max_points:
+            return seconds, reader.time_range(t_start, t_end)
+    seconds = max(readers)
+    return seconds, readers[seconds].time_range(t_start, t_end)
+
+
+# ==============================================================================
+# 4. DSP STAGE GẮN VÀO HOST
+# ==============================================================================
+class DspBlock:
+    """Khối sau lọc / hạ tần số: timestamps (M,) ts MCU, pc_time (M,), volts (M, C) float."""
+    __slots__ = ("layout", "timestamps", "pc_time", "volts", "rate")
+
+    def __init__(self, layout, timestamps, pc_time, volts, rate):
+        self.layout = layout
+        self.timestamps = timestamps
+        self.pc_time = pc_time
+        self.volts = volts
+        self.rate = rate        # Hz của khối ra (None nếu chưa biết)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __repr__(self):
+        return f"DspBlock(frames={len(self)}, channels={self.layout.channels}, rate={self.rate})"
+
+
+class DspStage:
+    """Lọc + hạ tần số + tóm tắt nhiều mức cho luồng SampleBlock của host.
+
+    output_rate: Hz của DspBlock ra (None = giữ tần số frame, chỉ làm trơn).
+    smoothing: None | ("ma", số mẫu) | ("iir", tần số cắt Hz), áp dụng ở tần số frame.
+    frame_rate: tần số frame (Hz) khi không có STATUS (xử lý khối đọc lại từ file...).
+    Khối vào được gom tới batch_frames frame hoặc max_delay giây rồi mới xử lý một lần.
+    """
+
+    def __init__(self, output_rate=None, smoothing=None, levels=DEFAULT_LEVELS, frame_rate=None,
+                 batch_frames=BATCH_FRAMES, max_delay=BATCH_MAX_DELAY):
+        self.output_rate = output_rate
+        self.default_rate = frame_rate
+        self.smoothing = smoothing
+        self.levels = tuple(levels)
+        self.batch_frames = batch_frames
+        self.max_delay = max_delay
+        self.consumers = []
+        self.host = None
+        self.layout = None
+        self.frame_rate = None
+        self.channel_rates = None
+        self._status = None
+        self._filter = None
+        self._decimator = None
+        self.pyramid = None
+        self._writers = None
+        self._pending = []
+        self._pending_frames = 0
+        # Luồng đọc (write_block) và luồng gọi start/stop_recording, flush dùng chung trạng thái
+        self._lock = threading.RLock()
+
+        # Thống kê
+        self.frames_in = 0
+        self.frames_out = 0
+        self.batches = 0
+        self.summaries_written = 0
+        self.process_time = 0.0
+
+    def attach(self, host):
+        self.host = host
+        host.dsp = self
+        host.add_block_consumer(self.write_block)
+        return self
+
+    def detach(self, host):
+        host.remove_block_consumer(self.write_block)
+        if host.dsp is self:
+            host.dsp = None
+        self.stop_recording()
+        self.flush()
+        self.host = None
+
+    def add_consumer(self, callback):
+        """Đăng ký hàm nhận DspBlock (gọi trong luồng đọc, cần xử lý nhanh)."""
+        self.consumers.append(callback)
+
+    def remove_consumer(self, callback):
+        if callback in self.consumers:
+            self.consumers.remove(callback)
+
+    def _rates(self, layout):
+        host = self.host
+        status = host.status if host is not None else None
+        rates = [status.samp_rate_map[ch] if status is not None else 0 for ch in layout.channels]
+        frame_rate = max(rates, default=0)
+        if not frame_rate:
+            period = host.timing.period if host is not None else None
+            frame_rate = 1000.0 / period if period else self.default_rate
+            rates = [frame_rate] * layout.n_channels
+        return frame_rate, [r or frame_rate for r in rates]
+
+    def _configure(self, layout):
+        key_changed = self.layout is None or layout.key() != self.layout.key()
+        self.layout = layout
+        self.frame_rate, self.channel_rates = self._rates(layout)
+        if self.host is not None:
+            self._status = self.host.status
+        fs = self.frame_rate
+        self._filter = None
+        if self.smoothing is not None:
+            kind, value = self.smoothing
+            if kind == "ma":
+                self._filter = MovingAverage(int(value))
+            elif kind == "iir" and fs:
+                self._filter = OnePole(value, fs)
+        self._decimator = None
+        if self.output_rate and fs and fs > self.output_rate:
+            factor = max(1, int(round(fs / self.output_rate)))
+            out = fs / factor
+            cutoffs = [min(0.5, ANTIALIAS_MARGIN * min(out, r) / 2 / fs) for r in self.channel_rates]
+            self._decimator = FirDecimator(factor, cutoffs)
+        if key_changed:
+            # Bố cục đổi ngoài luồng ghi của host: đóng tháp cũ (file .bmsum theo bố cục cũ)
+            self._close_summaries()
+            self.pyramid = SummaryPyramid(layout.n_channels, self.levels)
+
+    @property
+    def rate_out(self):
+        if self.frame_rate is None:
+            return None
+        return self.frame_rate / self._decimator.factor if self._decimator else self.frame_rate
+
+    def write_block(self, block):
+        n = len(block)
+        if not n:
+            return
+        with self._lock:
+            pending = self._pending
+            if pending and block.layout.key() != pending[0].layout.key():
+                self._process_pending()
+            pending.append(block)
+            self._pending_frames += n
+            if (self._pending_frames >= self.batch_frames or
+                    _last_time(block) - _first_time(pending[0]) >= self.max_delay):
+                self._process_pending()
+
+    def flush(self):
+        """Xử lý ngay các khối đang gom."""
+        with self._lock:
+            self._process_pending()
+
+    def _process_pending(self):
+        pending = self._pending
+        if not pending:
+            return
+        t0 = time.perf_counter()
+        layout = pending[0].layout
+        if len(pending) == 1:
+            block = pending[0]
+            n = len(block)
+            volts, timestamps, pc_time = block.volts, block.timestamps, pc_times(block)
+        else:
+            n = self._pending_frames
+            volts = np.concatenate([b.volts for b in pending])
+            timestamps = np.concatenate([b.timestamps for b in pending])
+            pc_time = np.concatenate([pc_times(b) for b in pending])
+        pending.clear()
+        self._pending_frames = 0
+
+        host = self.host
+        if self.layout is None or layout.key() != self.layout.key():
+            self._configure(layout)
+        elif host is not None and (host.status is not self._status or self.frame_rate is None):
+            # STATUS mới (vd GET_STATUS định kỳ): chỉ dựng lại bộ lọc khi tần số thật sự đổi
+            self._status = host.status
+            if self._rates(layout) != (self.frame_rate, self.channel_rates):
+                self._configure(layout)
+        self.frames_in += n
+        self.batches += 1
+
+        # Tóm tắt trên giá trị thô (giữ đúng đỉnh min / max)
+        closed = self.pyramid.add_samples(pc_time, volts)
+        if self._writers is not None:
+            self._write_summaries(closed)
+
+        if self.consumers:
+            x = volts
+            if self._filter is not None:
+                x = self._filter.process(x)
+            if self._decimator is not None:
+                x, (timestamps, pc_time) = self._decimator.process(x, (timestamps, pc_time))
+            if len(x):
+                self.frames_out += len(x)
+                out = DspBlock(layout, timestamps, pc_time, x, self.rate_out)
+                for callback in self.consumers:
+                    callback(out)
+        self.process_time += time.perf_counter() - t0
+
+    # --- GHI THÁP TÓM TẮT CẠNH FILE DỮ LIỆU ---
+    def start_recording(self, data_filename, layout, status=None):
+        """Mở 1 file .bmsum / mức cạnh data_filename (host gọi khi bắt đầu ghi)."""
+        with self._lock:
+            self._process_pending()
+            self._close_summaries()
+            if self.layout is None or layout.key() != self.layout.key():
+                self._configure(layout)
+            # Tháp mới: file tóm tắt chỉ gồm các mẫu được ghi
+            self.pyramid = SummaryPyramid(layout.n_channels, self.levels)
+            self._writers = [SummaryWriter(summary_path(data_filename, s), layout, s, status)
+                             for s in self.levels]
+
+    def stop_recording(self):
+        with self._lock:
+            self._process_pending()
+            self._close_summaries()
+
+    def _close_summaries(self):
+        writers = self._writers
+        if writers is None:
+            return
+        self._write_summaries(self.pyramid.flush())
+        self._writers = None
+        for writer in writers:
+            writer.close()
+
+    def _write_summaries(self, closed):
+        for writer, rec in zip(self._writers, closed):
+            if len(rec):
+                writer.write(rec)
+                self.summaries_written += len(rec)
+
+    @property
+    def summary_files(self):
+        return [w.filename for w in self._writers] if self._writers else []
+
+    def stats(self):
+        return {
+            "frame_rate": self.frame_rate,
+            "rate_out": self.rate_out,
+            "factor": self._decimator.factor if self._decimator else 1,
+            "taps": self._decimator.taps if self._decimator else 0,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "batches": self.batches,
+            "pending_frames": self._pending_frames,
+            "summaries_written": self.summaries_written,
+            "process_time_s": self.process_time,
+        }
+
+
+def _first_time(block):
+    return float(np.asarray(block.pc_time).flat[0])
+
+
+def _last_time(block):
+    return float(np.asarray(block.pc_time).flat[-1])
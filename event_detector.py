@@ -0,0 +1,231 @@
+# ==============================================================================
+# BỘ PHÁT HIỆN SỰ KIỆN THEO KÊNH: NGƯỠNG CÓ TRỄ (HYSTERESIS), CHỐNG DỘI (DEBOUNCE), CẠNH LÊN / XUỐNG
+# ==============================================================================
+# Thay cho so sánh cứng "volts < 0.60 -> DA AN" trên từng mẫu:
+# - Mỗi kênh 1 ChannelRule, chọn theo thứ tự: rules[kênh] -> role_rules[SensorRoleMap[kênh]] -> default.
+#   Rule mặc định (0.60 V, active_low, không trễ, không chống dội) cho đúng kết quả như trước.
+# - Chạy trên cả SampleBlock bằng NumPy (không lặp từng mẫu):
+#     x = volts (active_high) hoặc -volts (active_low)
+#     vào trạng thái kích hoạt khi x > ngưỡng vào, rời khi x <= ngưỡng ra (= ngưỡng vào -/+ trễ)
+#     giữa 2 lần quyết định -> giữ trạng thái trước (forward-fill bằng maximum.accumulate)
+#     chống dội: trạng thái mới chỉ được nhận khi kéo dài >= debounce_ms (đổi ra số frame theo chu kỳ)
+# - Kết quả: block.pressed = trạng thái đã lọc (chỉ mục / console dùng chung), và mảng sự kiện
+#   gọn (DETECT_DTYPE) chỉ tại các cạnh, gửi cho consumer đã đăng ký.
+# - Độ trễ sự kiện: từ lúc byte chứa mẫu về (t_arrival của lần đọc) tới khi consumer chạy xong
+#   (không có consumer: tới lúc sự kiện được tạo).
+import time
+
+import numpy as np
+
+from metrics import Histogram
+from sample_block import PRESS_THRESHOLD_V
+
+EDGES = ("both", "rising", "falling")   # cạnh điện áp được phát sự kiện
+LATENCY_BUCKETS = (50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3)
+
+DETECT_DTYPE = np.dtype([
+    ('ts', '<u4'),              # ts MCU (ms) của mẫu tại cạnh
+    ('pc_time', '<f8'),
+    ('channel', 'u1'),
+    ('active', '?'),            # True = vào trạng thái kích hoạt (vd DA AN)
+    ('rising', '?'),            # hướng điện áp tại cạnh
+    ('value', '<f4'),           # điện áp tại cạnh
+    ('held_ms', '<u4'),         # thời gian ở trạng thái trước đó (0 nếu chưa biết)
+])
+
+
+class ChannelRule:
+    """Quy tắc 1 kênh. active_low: kích hoạt khi điện áp THẤP hơn ngưỡng (cảm biến lực kiểu FSR)."""
+    __slots__ = ("threshold", "hysteresis", "active_low", "debounce_ms", "edges", "name")
+
+    def __init__(self, threshold=PRESS_THRESHOLD_V, hysteresis=0.0, active_low=True,
+                 debounce_ms=0.0, edges="both", name="DA AN"):
+        if edges not in EDGES:
+            raise ValueError(f"edges phai la 1 trong {EDGES}")
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.active_low = active_low
+        self.debounce_ms = debounce_ms
+        self.edges = edges
+        self.name = name
+
+    def __repr__(self):
+        return (f"ChannelRule({self.name}, {'<' if self.active_low else '>'}{self.threshold}V"
+                f" hys={self.hysteresis}V debounce={self.debounce_ms}ms edges={self.edges})")
+
+
+DEFAULT_RULE = ChannelRule()
+
+
+class EventDetector:
+    def __init__(self, rules=None, role_rules=None, default=DEFAULT_RULE):
+        self.rules = dict(rules or {})              # kênh -> ChannelRule
+        self.role_rules = dict(role_rules or {})    # mã SensorRoleMap -> ChannelRule
+        self.default = default
+        self.consumers = []
+        self.latency = Histogram("bm_detect_latency_seconds", LATENCY_BUCKETS,
+                                 "Tre tu luc nhan byte toi khi consumer su kien chay xong")
+        self._status = None
+        self._key = None
+
+        # Thống kê
+        self.blocks = 0
+        self.events = 0
+
+    def add_consumer(self, callback):
+        """Đăng ký hàm nhận mảng sự kiện DETECT_DTYPE (gọi trong luồng đọc, cần xử lý nhanh)."""
+        self.consumers.append(callback)
+
+    def remove_consumer(self, callback):
+        if callback in self.consumers:
+            self.consumers.remove(callback)
+
+    def set_rule(self, channel, rule):
+        self.rules[channel] = rule
+        self._key = None
+
+    def set_status(self, status, layout):
+        self._status = status
+        self._key = None
+
+    def rule_for(self, channel):
+        rule = self.rules.get(channel)
+        if rule is None and self._status is not None:
+            rule = self.role_rules.get(self._status.role_map[channel])
+        return rule or self.default
+
+    def _compile(self, layout, period_ms):
+        rules = [self.rule_for(ch) for ch in layout.channels]
+        self.channel_rules = rules
+        self._channels = np.asarray(layout.channels, dtype=np.uint8)
+        self._sign = np.array([-1.0 if r.active_low else 1.0 for r in rules])
+        self._enter = np.array([r.threshold * (-1.0 if r.active_low else 1.0) for r in rules])
+        self._leave = self._enter - np.array([r.hysteresis for r in rules])
+        period = period_ms or 1.0
+        self._debounce = np.array([max(1, int(round(r.debounce_ms / period))) for r in rules])
+        self._emit_rising = np.array([r.edges != "falling" for r in rules])
+        self._emit_falling = np.array([r.edges != "rising" for r in rules])
+        # Ngưỡng trễ 0 + không chống dội trên mọi kênh: trạng thái = so sánh trực tiếp
+        self._simple = not np.any(self._leave != self._enter) and not np.any(self._debounce > 1)
+        n = layout.n_channels
+        if self._key is None or self._key[0] != layout.key():
+            self._raw = None                            # trạng thái thô (sau trễ) ở mẫu cuối
+            self._state = None                          # trạng thái đã chống dội ở mẫu cuối
+            self._run = np.zeros(n, dtype=np.int64)     # số frame trạng thái thô đã giữ
+            self._last_edge = np.zeros(n, dtype=np.int64)
+            self._has_edge = np.zeros(n, dtype=bool)
+        self._key = (layout.key(), period_ms)
+
+    def process(self, block, t_arrival=None, period_ms=None):
+        """Cập nhật block.pressed và phát sự kiện cạnh; trả về mảng sự kiện (có thể rỗng)."""
+        n = len(block)
+        if not n:
+            return np.empty(0, dtype=DETECT_DTYPE)
+        if self._key is None or self._key[0] != block.layout.key() or self._key[1] != period_ms:
+            self._compile(block.layout, period_ms)
+        self.blocks += 1
+        x = block.volts * self._sign
+        if self._state is None:
+            # Mẫu đầu tiên: trạng thái ban đầu = so sánh với ngưỡng vào, không coi là cạnh
+            self._state = self._raw = x[0] > self._enter
+        prev_state = self._state
+
+        if self._simple:
+            state = x > self._enter
+        else:
+            state = self._filter(x)
+        block.pressed = state
+
+        changed = np.empty(state.shape, dtype=bool)
+        np.not_equal(state[0], prev_state, out=changed[0])
+        np.not_equal(state[1:], state[:-1], out=changed[1:])
+        self._state = state[-1]
+        if not changed.any():
+            return np.empty(0, dtype=DETECT_DTYPE)
+        return self._emit(block, state, changed, t_arrival)
+
+    def _filter(self, x):
+        """Trễ + chống dội trên cả khối, giữ trạng thái giữa các khối."""
+        n, c = x.shape
+        # Đường nhanh (đa số khối): không mẫu nào vượt ngưỡng ngược trạng thái thô đang giữ và
+        # không có trạng thái chờ chống dội -> cả khối giữ nguyên trạng thái
+        raw_prev = self._raw
+        if np.array_equal(raw_prev, self._state) and not np.where(raw_prev, x <= self._leave,
+                                                                  x > self._enter).any():
+            self._run = self._run + n
+            return np.broadcast_to(raw_prev, x.shape).copy()
+        rows = np.arange(n)[:, None]
+        # 1) Trễ: quyết định tại mẫu vượt ngưỡng vào hoặc ngưỡng ra, còn lại giữ trạng thái trước
+        enter = x > self._enter
+        decided = enter | (x <= self._leave)
+        last = np.where(decided, rows, -1)
+        np.maximum.accumulate(last, axis=0, out=last)
+        raw = np.where(last >= 0, np.take_along_axis(enter, np.maximum(last, 0), axis=0), self._raw)
+        if not np.any(self._debounce > 1):
+            self._raw = raw[-1]
+            return raw
+        # 2) Chống dội: độ dài đoạn trạng thái thô hiện tại tại mỗi mẫu (nối tiếp từ khối trước)
+        flips = np.empty(raw.shape, dtype=bool)
+        np.not_equal(raw[0], self._raw, out=flips[0])
+        np.not_equal(raw[1:], raw[:-1], out=flips[1:])
+        start = np.where(flips, rows, -1)
+        np.maximum.accumulate(start, axis=0, out=start)
+        run = np.where(start >= 0, rows - start + 1, self._run + rows + 1)
+        confirmed = run >= self._debounce
+        last = np.where(confirmed, rows, -1)
+        np.maximum.accumulate(last, axis=0, out=last)
+        state = np.where(last >= 0, np.take_along_axis(raw, np.maximum(last, 0), axis=0), self._state)
+        self._raw = raw[-1]
+        self._run = run[-1]
+        return state
+
+    def _emit(self, block, state, changed, t_arrival):
+        rows, cols = np.nonzero(changed)
+        active = state[rows, cols]
+        rising = active != (self._sign[cols] < 0)
+        keep = np.where(rising, self._emit_rising[cols], self._emit_falling[cols])
+        ts = block.timestamps[rows].astype(np.int64)
+        # held_ms: khoảng từ cạnh trước trên cùng kênh (thứ tự mẫu trong khối đã tăng dần)
+        held = np.zeros(len(rows), dtype=np.int64)
+        order = np.lexsort((rows, cols))
+        c_sorted, ts_sorted = cols[order], ts[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = c_sorted[1:] != c_sorted[:-1]
+        prev_ts = np.empty(len(order), dtype=np.int64)
+        prev_ts[1:] = ts_sorted[:-1]
+        prev_ts[first] = self._last_edge[c_sorted[first]]
+        known = ~first | self._has_edge[c_sorted]
+        held[order] = np.where(known, (ts_sorted - prev_ts) & 0xFFFFFFFF, 0)
+        last_rows = order[np.flatnonzero(np.r_[c_sorted[1:] != c_sorted[:-1], True])]
+        self._last_edge[cols[last_rows]] = ts[last_rows]
+        self._has_edge[cols[last_rows]] = True
+
+        events = np.empty(int(keep.sum()), dtype=DETECT_DTYPE)
+        if not len(events):
+            return events
+        rows, cols = rows[keep], cols[keep]
+        events['ts'] = ts[keep]
+        pc_time = block.pc_time
+        events['pc_time'] = pc_time[rows] if isinstance(pc_time, np.ndarray) and pc_time.ndim else pc_time
+        events['channel'] = self._channels[cols]
+        events['active'] = active[keep]
+        events['rising'] = rising[keep]
+        events['value'] = block.volts[rows, cols]
+        events['held_ms'] = held[keep]
+        self.events += len(events)
+        for callback in self.consumers:
+            callback(events)
+        if t_arrival is not None:
+            self.latency.observe(time.perf_counter() - t_arrival)
+        return events
+
+    def stats(self):
+        latency = self.latency
+        return {
+            "blocks": self.blocks,
+            "events": self.events,
+            "latency_count": latency.count,
+            "latency_mean_ms": latency.sum / latency.count * 1e3 if latency.count else 0.0,
+            "latency_p50_ms": latency.quantile(0.5) * 1e3,
+            "latency_p99_ms": latency.quantile(0.99) * 1e3,
+        }
@@ -0,0 +1,134 @@
+# ==============================================================================
+# BẢNG ĐIỀU PHỐI FRAME THEO LOẠI: HANDLER DỰNG SẴN + SUBSCRIBER RIÊNG TỪNG LOẠI
+# ==============================================================================
+# - Mỗi loại frame (Type) có 1 FrameHandler: hàm giải mã payload (None = giữ nguyên payload)
+#   + danh sách subscriber nhận đối tượng đã giải mã (Ack, DeviceStatus, DeviceError...).
+# - compile() dựng bảng 256 phần tử: table[msg_type] = hàm(payload) hoặc None. Hot path chỉ còn
+#   1 phép lấy phần tử + gọi đúng các subscriber đang đăng ký; loại không ai đăng ký bị bỏ qua
+#   trước khi giải mã. Đăng ký / hủy => dựng bảng mới rồi thay cả list (luồng đọc luôn thấy
+#   1 bảng nhất quán, không cần khóa).
+# - Đo thời gian xử lý theo loại (set_timing(True)): hàm trong bảng được bọc bằng perf_counter,
+#   tắt đi thì không tốn gì thêm.
+# - Nhiều subscriber: mỗi subscriber chạy trong try riêng (1 cái lỗi không làm mất frame của các
+#   cái sau), lỗi được đếm vào handler.errors rồi ném lại lỗi cuối cho nơi gọi (luồng đọc đếm
+#   process_errors). 1 subscriber: gọi thẳng, lỗi đi thẳng lên nơi gọi.
+import time
+
+TABLE_SIZE = 256
+
+
+class FrameHandler:
+    def __init__(self, msg_type, name, decode=None):
+        self.msg_type = msg_type
+        self.name = name
+        self.decode = decode
+        self.subscribers = []
+
+        # Thống kê (chỉ đếm khi bật đo thời gian)
+        self.frames = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0             # số lần subscriber lỗi (khi có nhiều subscriber)
+
+    def compile(self, timing=False):
+        """Hàm xử lý 1 payload của loại này, None nếu không có subscriber."""
+        subscribers = tuple(self.subscribers)
+        if not subscribers:
+            return None
+        decode = self.decode
+        if len(subscribers) == 1:
+            callback = subscribers[0]
+            if decode is None:
+                handler = callback
+            else:
+                def handler(payload):
+                    callback(decode(payload))
+        else:
+            def handler(payload):
+                obj = payload if decode is None else decode(payload)
+                error = None
+                for callback in subscribers:
+                    try:
+                        callback(obj)
+                    except Exception as e:
+                        self.errors += 1
+                        error = e
+                if error is not None:
+                    raise error
+        if not timing:
+            return handler
+        inner = handler
+        perf_counter = time.perf_counter
+
+        def handler(payload):
+            t0 = perf_counter()
+            try:
+                inner(payload)
+            finally:
+                dt = perf_counter() - t0
+                self.frames += 1
+                self.total += dt
+                if dt > self.max:
+                    self.max = dt
+        return handler
+
+    def reset_stats(self):
+        self.frames = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def stats(self):
+        return {"subscribers": len(self.subscribers), "frames": self.frames, "errors": self.errors,
+                "mean_ms": self.total / self.frames * 1e3 if self.frames else 0.0,
+                "max_ms": self.max * 1e3}
+
+
+class FrameDispatcher:
+    def __init__(self):
+        self.handlers = {}
+        self.table = [None] * TABLE_SIZE
+        self.timing = False
+
+    def register(self, msg_type, name, decode=None):
+        """Khai báo 1 loại frame (đã có thì trả về handler cũ)."""
+        handler = self.handlers.get(msg_type)
+        if handler is None:
+            handler = self.handlers[msg_type] = FrameHandler(msg_type, name, decode)
+        return handler
+
+    def subscribe(self, msg_type, callback):
+        handler = self.handlers.get(msg_type)
+        if handler is None:
+            handler = self.register(msg_type, f"0x{msg_type:02X}")
+        handler.subscribers.append(callback)
+        self.compile()
+
+    def unsubscribe(self, msg_type, callback):
+        handler = self.handlers.get(msg_type)
+        if handler is not None and callback in handler.subscribers:
+            handler.subscribers.remove(callback)
+            self.compile()
+
+    def set_timing(self, enabled):
+        if enabled and not self.timing:
+            for handler in self.handlers.values():
+                handler.reset_stats()
+        self.timing = enabled
+        self.compile()
+
+    def compile(self):
+        table = [None] * TABLE_SIZE
+        for msg_type, handler in self.handlers.items():
+            table[msg_type] = handler.compile(self.timing)
+        self.table = table
+
+    def dispatch(self, msg_type, payload):
+        """Xử lý 1 frame; False nếu loại này không có subscriber (bỏ qua, không giải mã)."""
+        handler = self.table[msg_type]
+        if handler is None:
+            return False
+        handler(payload)
+        return True
+
+    def stats(self):
+        return {handler.name: handler.stats() for handler in self.handlers.values()}
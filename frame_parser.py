@@ -0,0 +1,179 @@
+# ==============================================================================
+# BỘ TÁCH FRAME (PARSER) ĐỘC LẬP VỚI PYSERIAL
+# ==============================================================================
+# Dùng chung cho cổng COM thật, file replay và kiểm thử:
+#     parser = FrameParser()
+#     for msg_type, payload in parser.feed(chunk):
+#         ...
+# - Bộ đệm là 1 bytearray cấp phát sẵn, KHÔNG bao giờ đổi kích thước.
+# - payload trả về là memoryview trỏ thẳng vào bộ đệm (không copy), chỉ hợp lệ
+#   tới khi lấy frame kế tiếp. Muốn giữ lại thì bytes(payload).
+# - Chỉ dồn dữ liệu về đầu bộ đệm (compact) khi phần trống phía sau không đủ chỗ.
+import struct
+
+import crc16
+
+# ==============================================================================
+# 1. HẰNG SỐ KHUNG TRUYỀN (PROTOCOL.md mục 2, 3)
+# ==============================================================================
+SOF = b'\xA5\x5A'
+PROTOCOL_VER = 0x01
+
+# Frame Types
+TYPE_STATUS = 0x01
+TYPE_DATA = 0x02
+TYPE_COMMAND = 0x03
+TYPE_ACK = 0x04
+TYPE_ERROR = 0x05
+
+HEADER_LEN = 6  # SOF(2) + Ver(1) + Type(1) + Len(2)
+CRC_LEN = 2
+
+# Độ dài Payload tối đa theo từng loại frame (Device -> Host).
+# Len vượt mức này => coi như SOF giả / Len bị lỗi, bỏ qua ngay thay vì chờ đủ 64 KB.
+MAX_PAYLOAD_LEN = {
+    TYPE_STATUS: 144,
+    TYPE_DATA: 4 + 32 * 4,  # Timestamp + tối đa 32 kênh x 4 byte
+    TYPE_ACK: 3,
+    TYPE_ERROR: 7,
+}
+
+DEFAULT_CAPACITY = 64 * 1024
+
+_HEADER_STRUCT = struct.Struct('<BBH')
+_CRC_STRUCT = struct.Struct('<H')
+
+
+def build_frame(msg_type, payload=b''):
+    """Đóng gói 1 frame đầy đủ: SOF | Ver | Type | Len | Payload | CRC16."""
+    data_to_crc = _HEADER_STRUCT.pack(PROTOCOL_VER, msg_type, len(payload)) + bytes(payload)
+    return SOF + data_to_crc + _CRC_STRUCT.pack(crc16.calculate_crc16(data_to_crc))
+
+
+# ==============================================================================
+# 2. CLASS FRAME PARSER
+# ==============================================================================
+class FrameParser:
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_payload_len=None):
+        if max_payload_len is None:
+            max_payload_len = MAX_PAYLOAD_LEN
+        max_frame = HEADER_LEN + max(max_payload_len.values()) + CRC_LEN
+        if capacity < max_frame:
+            raise ValueError(f"capacity phai >= {max_frame} byte")
+        self.max_payload_len = dict(max_payload_len)
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        # Vị trí (tính từ byte đầu tiên từng nạp vào) của byte _buf[0] và của SOF frame vừa trả ra
+        self._base = 0
+        self.frame_offset = -1
+
+        # Thống kê
+        self.frames_ok = 0
+        self.crc_errors = 0
+        self.oversize_frames = 0
+        self.resync_bytes = 0
+
+    @property
+    def payload_capacity(self):
+        """Len lớn nhất bộ đệm chứa được trọn 1 frame."""
+        return len(self._buf) - HEADER_LEN - CRC_LEN
+
+    @property
+    def backlog(self):
+        """Số byte đang nằm chờ trong bộ đệm (frame chưa đủ)."""
+        return self._end - self._start
+
+    def reset(self):
+        self._base += self._end
+        self._start = 0
+        self._end = 0
+
+    def stats(self):
+        return {
+            "frames_ok": self.frames_ok,
+            "crc_errors": self.crc_errors,
+            "oversize_frames": self.oversize_frames,
+            "resync_bytes": self.resync_bytes,
+        }
+
+    def feed(self, data):
+        """Nạp thêm byte, lần lượt sinh ra (msg_type, payload_view) cho từng frame hợp lệ."""
+        src = memoryview(data).cast('B')
+        total = len(src)
+        pos = 0
+        capacity = len(self._buf)
+        while pos < total:
+            if self._start == self._end:
+                self._base += self._end
+                self._start = self._end = 0
+            room = capacity - self._end
+            if room < total - pos and self._start > 0:
+                # Compact: chỉ dời phần frame dở dang về đầu bộ đệm
+                remain = self._end - self._start
+                self._buf[0:remain] = self._view[self._start:self._end]
+                self._base += self._start
+                self._start = 0
+                self._end = remain
+                room = capacity - remain
+            n = min(room, total - pos)
+            self._buf[self._end:self._end + n] = src[pos:pos + n]
+            self._end += n
+            pos += n
+            yield from self._parse()
+
+    def _parse(self):
+        buf = self._buf
+        view = self._view
+        max_lens = self.max_payload_len
+        crc_update = crc16.update
+        crc_init = crc16.CRC16_INIT
+        start = self._start
+        end = self._end
+
+        while end - start >= HEADER_LEN:
+            if buf[start] != 0xA5 or buf[start + 1] != 0x5A:
+                idx = buf.find(SOF, start, end)
+                if idx == -1:
+                    # Giữ lại byte cuối nếu nó có thể là nửa đầu của SOF
+                    keep = 1 if buf[end - 1] == 0xA5 else 0
+                    self.resync_bytes += end - keep - start
+                    start = end - keep
+                    break
+                self.resync_bytes += idx - start
+                start = idx
+                if end - start < HEADER_LEN:
+                    break
+
+            msg_type = buf[start + 3]
+            payload_len = buf[start + 4] | (buf[start + 5] << 8)
+            max_len = max_lens.get(msg_type)
+            if buf[start + 2] != PROTOCOL_VER or max_len is None or payload_len > max_len:
+                # SOF giả hoặc header hỏng: dò lại từ byte ngay sau SOF này
+                if max_len is not None and payload_len > max_len:
+                    self.oversize_frames += 1
+                self.resync_bytes += 1
+                start += 1
+                continue
+
+            frame_end = start + HEADER_LEN + payload_len + CRC_LEN
+            if frame_end > end:
+                break
+
+            crc_rx = buf[frame_end - 2] | (buf[frame_end - 1] << 8)
+            if crc_update(crc_init, view[start + 2:frame_end - 2]) != crc_rx:
+                # Sai CRC: bỏ frame, chỉ mất 1 byte rồi dò SOF kế tiếp
+                self.crc_errors += 1
+                self.resync_bytes += 1
+                start += 1
+                continue
+
+            self.frames_ok += 1
+            self._start = frame_end
+            self.frame_offset = self._base + start
+            yield msg_type, view[start + HEADER_LEN:frame_end - CRC_LEN]
+            start = self._start
+            end = self._end
+
+        self._start = start
@@ -2,54 +2,115 @@ import serial
 import time
 import struct
 import sys
+import os
 import threading
-import csv
-import msvcrt  # <--- [QUAN TRỌNG] Thư viện bắt phím trên Windows
+from collections import deque
 from datetime import datetime
 
+import crc16
+from data_layout import DeviceStatus, DeviceError, DataLayout, LEGACY_LAYOUT
+from frame_parser import (
+    FrameParser, build_frame, PROTOCOL_VER,
+    TYPE_STATUS, TYPE_DATA, TYPE_COMMAND, TYPE_ACK, TYPE_ERROR,
+)
+from sample_block import decode_block
+from recorder import BlockRecorder, CsvSink, FLUSH_INTERVAL
+from session_file import SessionWriter, SESSION_EXT
+from session_index import IndexedSink
+from session_segments import SegmentedSink, SEGMENT_MAX_BYTES, manifest_path
+from wire_capture import CaptureWriter, CAPTURE_EXT, open_replay_port
+from command_pipeline import PendingCommands, CommandError, Ack, ACK_RESULT_NAMES, wait_all
+from frame_dispatch import FrameDispatcher, TABLE_SIZE
+from console_view import ConsoleRenderer, HostStatusLine
+from metrics import HostMetrics, REGISTRY
+from sample_timing import SampleTiming, SampleLoss
+from event_detector import EventDetector
+
 # ==============================================================================
 # 1. CẤU HÌNH HỆ THỐNG
 # ==============================================================================
 SERIAL_PORT = 'COM2'
 BAUD_RATE = 115200
 
-# Constants
-SOF = b'\xA5\x5A'
-PROTOCOL_VER = 0x01
+# Luồng đọc: ser.read() chặn tới khi có byte (hoặc hết READ_TIMEOUT) thay vì ngủ 5 ms.
+# READ_TIMEOUT chỉ quyết định tốc độ thoát vòng đọc khi disconnect, không cộng vào độ trễ.
+READ_TIMEOUT = 0.05
+READ_CHUNK = 4096
+RECONNECT_DELAY = 0.5       # s, tăng gấp đôi sau mỗi lần mở lại thất bại
+RECONNECT_DELAY_MAX = 5.0
 
-# Frame Types
-TYPE_STATUS = 0x01
-TYPE_DATA = 0x02
-TYPE_COMMAND = 0x03
-TYPE_ACK = 0x04
+# Constants / Frame Types / MAX_PAYLOAD_LEN: định nghĩa trong frame_parser.py
 
 # Command IDs
 CMD_GET_STATUS = 0x01
 CMD_START_MEASURE = 0x02
 CMD_STOP_MEASURE = 0x03
+CMD_SET_NSENSORS = 0x04
+CMD_SET_RATE = 0x05
+CMD_SET_BITS = 0x06
+CMD_SET_ACTIVEMAP = 0x07
+CMD_CALIBRATE = 0x08
+
+# Số frame DATA tối đa gom vào 1 khối trước khi giải mã (khối cũng được đẩy ra sau mỗi lần đọc)
+BATCH_MAX_FRAMES = 256
+
+# Số sự kiện (ERROR thiết bị + mất mẫu do host phát hiện) gần nhất được giữ lại
+EVENT_LOG_MAX = 256
+
+
+def config_commands(rates=None, bits=None, active_map=None, n_sensors=None):
+    """Danh sách (CmdID, Args) cho loạt lệnh cấu hình (mục 7.4)."""
+    commands = []
+    if n_sensors is not None:
+        commands.append((CMD_SET_NSENSORS, struct.pack('<B', n_sensors)))
+    for index, hz in sorted((rates or {}).items()):
+        commands.append((CMD_SET_RATE, struct.pack('<BH', index, hz)))
+    for index, nbits in sorted((bits or {}).items()):
+        commands.append((CMD_SET_BITS, struct.pack('<BB', index, nbits)))
+    if active_map is not None:
+        commands.append((CMD_SET_ACTIVEMAP, struct.pack('<I', active_map)))
+    return commands
 
 
 # ==============================================================================
 # 2. HÀM TIỆN ÍCH (CRC16)
 # ==============================================================================
-def calculate_crc16(data: bytes) -> int:
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= (byte << 8)
-        for _ in range(8):
-            if (crc & 0x8000):
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-        crc &= 0xFFFF
-    return crc
+calculate_crc16 = crc16.calculate_crc16
+
+
+class LatencyStats:
+    """Thống kê độ trễ gọn nhẹ (giây): số mẫu, trung bình, lớn nhất, gần nhất."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def snapshot(self):
+        return {"count": self.count, "mean_ms": self.mean * 1e3,
+                "max_ms": self.max * 1e3, "last_ms": self.last * 1e3}
 
 
 # ==============================================================================
 # 3. CLASS GIAO TIẾP (GIỮ NGUYÊN)
 # ==============================================================================
 class BiomechanicsHost:
-    def __init__(self, port, baud):
+    def __init__(self, port, baud, poll_interval=None):
         self.port = port
         self.baud = baud
         self.ser = None
@@ -57,19 +118,103 @@ class BiomechanicsHost:
         self.running = False
         self.read_thread = None
 
-        # Biến ghi file
+        # None = chế độ chờ sự kiện (chặn trên ser.read); số giây = chế độ polling cũ
+        self.poll_interval = poll_interval
+
+        # Bộ tách frame (giữ luôn thống kê CRC / resync / Len quá dài)
+        self.parser = FrameParser()
+
+        # Độ trễ từ lúc byte về tới lúc frame được xử lý, số lần mở lại cổng, lỗi xử lý frame
+        self.dispatch_latency = LatencyStats()
+        self.reconnects = 0
+        self.process_errors = 0
+        self.frames_skipped = 0     # frame thuộc loại không có subscriber
+
+        # Bảng điều phối theo loại frame (frame_dispatch.py): handler nội bộ là subscriber đầu tiên,
+        # chương trình ngoài đăng ký thêm bằng subscribe_frame
+        self.dispatcher = FrameDispatcher()
+        self.dispatcher.register(TYPE_ACK, "ACK", Ack.from_payload)
+        self.dispatcher.register(TYPE_STATUS, "STATUS", DeviceStatus.from_payload)
+        self.dispatcher.register(TYPE_DATA, "DATA")     # payload thô, giải mã theo lô
+        self.dispatcher.register(TYPE_ERROR, "ERROR", DeviceError.from_payload)
+        self.dispatcher.subscribe(TYPE_ACK, self._on_ack_frame)
+        self.dispatcher.subscribe(TYPE_STATUS, self._on_status)
+        self.dispatcher.subscribe(TYPE_DATA, self._on_data_payload)
+        self.dispatcher.subscribe(TYPE_ERROR, self._on_event)
+
+        # Cấu hình thiết bị từ STATUS gần nhất + bố cục DATA tương ứng
+        self.status = None
+        self.layout = LEGACY_LAYOUT
+        self.layout_mismatches = 0
+
+        # Kiểm tra ts MCU (mất mẫu / trùng / tràn / jitter) + pc_time theo đồng hồ đã căn
+        self.timing = SampleTiming()
+        # ERROR từ thiết bị (DeviceError) và mất mẫu do host phát hiện (SampleLoss)
+        self.event_log = deque(maxlen=EVENT_LOG_MAX)
+        self.event_consumers = []
+        self.device_errors = {}     # tên mã lỗi -> số lần
+        # Trạng thái kênh (ngưỡng có trễ / chống dội / luật theo vai trò) -> block.pressed + sự kiện cạnh
+        self.detector = EventDetector()
+        self._t_arrival = None      # thời điểm nhận của lần đọc đang xử lý (đo trễ sự kiện)
+
+        # Gom payload DATA thành lô để giải mã bằng NumPy; consumer nhận SampleBlock
+        self._batch = bytearray()
+        self._batch_frames = 0
+        self.block_consumers = []
+
+        # Biến ghi file (việc ghi đĩa chạy ở luồng riêng trong BlockRecorder)
         self.is_recording = False
-        self.csv_file = None
-        self.csv_writer = None
+        self.recorder = None
+        self.record_flush_interval = FLUSH_INTERVAL
+        self.record_format = "csv"  # "csv" hoặc "bin" (.bms, xem session_file.py)
+        # Ghi kèm chỉ mục thời gian + sự kiện (.bmidx / .bmevt, xem session_index.py)
+        self.record_index = True
+        # Chia phiên thành segment theo dung lượng / thời gian + nén segment đã đóng ở luồng nền
+        # (session_segments.py, bật bằng enable_segments()). Mặc định cả 2 giới hạn None = 1 file
+        # không giới hạn như cũ: reprocess / session_index / dsp chỉ đọc file đơn
+        self.record_segment_bytes = None
+        self.record_segment_seconds = None
+        self.record_compress = "gzip"       # None | "gzip" | "zstd" (cần gói zstandard)
+        self.record_compress_level = None
         self.filename = ""
 
+        # Ghi byte thô (tee) để phát lại offline
+        self.capture = None
+
+        # Lệnh chờ ACK (ghép theo CmdID + Seq, timeout, gửi lại, pipeline)
+        self._write_lock = threading.Lock()
+        self.commands = PendingCommands(self._write_frame)
+
+        # In ACK / STATUS / mẫu mới nhất ra console (tắt khi nhúng vào chương trình khác)
+        self.echo = True
+        # console_view.ConsoleRenderer: luồng đọc chỉ đẩy thông báo vào hàng đợi của nó và lưu
+        # khối mới nhất; việc in ra terminal do luồng hiển thị làm theo nhịp cố định.
+        # Luồng đọc KHÔNG BAO GIỜ ghi terminal: echo=True mà chưa gắn console thì start_reading()
+        # tự tạo 1 renderer (disconnect() dừng nó); echo=False thì luồng đọc không in gì.
+        self.console = None
+        self._own_console = False
+        self.latest_block = None
+
+        # metrics.HostMetrics khi bật đo đạc (enable_metrics), None = tắt
+        self.metrics = None
+
+        # dsp.DspStage (lọc / hạ tần số / tháp tóm tắt) khi được gắn vào, None = không dùng
+        self.dsp = None
+
+    def _open_port(self):
+        # "replay:<file>" / "replay-rt:<file>": phát lại file capture thay cho cổng COM
+        replay = open_replay_port(self.port)
+        if replay is not None:
+            return replay
+        return serial.Serial(self.port, self.baud, timeout=READ_TIMEOUT)
+
     def connect(self):
         try:
             try:
                 s = serial.Serial(self.port, self.baud); s.close()
             except:
                 pass
-            self.ser = serial.Serial(self.port, self.baud, timeout=0.1)
+            self.ser = self._open_port()
             print(f">> [SYSTEM] Da ket noi {self.port} (Ver {PROTOCOL_VER})")
             return True
         except Exception as e:
@@ -78,141 +223,484 @@ class BiomechanicsHost:
 
     def disconnect(self):
         self.stop_recording()
+        self.stop_capture()
         self.running = False
         if self.read_thread: self.read_thread.join()
+        self.commands.cancel_all()
         if self.ser and self.ser.is_open:
             self.ser.close()
-            print("\n>> [SYSTEM] Da ngat ket noi.")
+            self._log("\n>> [SYSTEM] Da ngat ket noi.\n")
+        if self._own_console:
+            self._own_console = False
+            console, self.console = self.console, None
+            console.stop()
 
     # --- FILE RECORDING ---
-    def start_recording(self):
+    def start_recording(self, fmt=None):
         if self.is_recording: return
+        if fmt is not None:
+            self.record_format = fmt
+        ext = SESSION_EXT if self.record_format == "bin" else ".csv"
         timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        self.filename = f"sensor_data_{timestamp_str}.csv"
+        self.filename = f"sensor_data_{timestamp_str}{ext}"
+        part = 1
+        while os.path.exists(self.filename) or os.path.exists(manifest_path(self.filename)):
+            part += 1
+            self.filename = f"sensor_data_{timestamp_str}_{part}{ext}"
         try:
-            self.csv_file = open(self.filename, mode='w', newline='')
-            self.csv_writer = csv.writer(self.csv_file)
-            self.csv_writer.writerow(["Timestamp_MCU_ms", "ADC_Raw", "Voltage_V", "Status", "PC_Time"])
+            if self.record_segment_bytes or self.record_segment_seconds:
+                sink = SegmentedSink(self.filename, self.layout, self.status, self.record_format,
+                                     self.record_segment_bytes, self.record_segment_seconds,
+                                     self.record_compress, self.record_compress_level, self.record_index)
+            elif self.record_format == "bin":
+                sink = SessionWriter(self.filename, self.layout, self.status)
+            else:
+                sink = CsvSink(self.filename, self.layout)
+            if self.record_index and not isinstance(sink, SegmentedSink):
+                sink = IndexedSink(sink, self.status)
+            self.recorder = BlockRecorder(sink, flush_interval=self.record_flush_interval).start()
+            if self.metrics is not None:
+                self.recorder.write_time = self.metrics.write_time
+            # Tháp tóm tắt 1 s / 10 s / 60 s ghi cạnh file dữ liệu thô
+            if self.dsp is not None:
+                self.dsp.start_recording(self.filename, self.layout, self.status)
             self.is_recording = True
             # In xuống dòng mới để không bị data đè
-            sys.stdout.write(f"\n>> [REC] BAT DAU GHI FILE: {self.filename}\n")
+            if isinstance(sink, SegmentedSink):
+                self._log(f"\n>> [REC] BAT DAU GHI PHIEN CHIA SEGMENT: {sink.manifest_path}\n")
+            else:
+                self._log(f"\n>> [REC] BAT DAU GHI FILE: {self.filename}\n")
         except Exception as e:
-            sys.stdout.write(f"\n>> [ERROR] Khong the tao file: {e}\n")
+            self._log(f"\n>> [ERROR] Khong the tao file: {e}\n")
+
+    def enable_segments(self, max_bytes=SEGMENT_MAX_BYTES, max_seconds=None, compress="gzip", level=None):
+        """Bật ghi chia segment (manifest + nén nền) cho các lần start_recording sau.
+        max_bytes = max_seconds = None -> tắt, quay lại 1 file."""
+        self.record_segment_bytes = max_bytes
+        self.record_segment_seconds = max_seconds
+        self.record_compress = compress
+        self.record_compress_level = level
 
     def stop_recording(self):
-        if self.is_recording and self.csv_file:
-            self.csv_file.close()
+        recorder = self.recorder
+        if self.is_recording and recorder:
             self.is_recording = False
-            self.csv_file = None
-            self.csv_writer = None
-            sys.stdout.write(f"\n>> [REC] DA LUU FILE: {self.filename}\n")
+            self.recorder = None
+            recorder.stop()
+            if self.dsp is not None:
+                self.dsp.stop_recording()
+            stats = recorder.stats()
+            sink = recorder.sink
+            if isinstance(sink, SegmentedSink):
+                # Phiên chia segment: không có file self.filename, chỉ có manifest + các segment
+                # (segment cuối đang được nén ở luồng nền)
+                msg = (f"\n>> [REC] DA LUU PHIEN: {sink.manifest_path} ({stats['written_frames']} frame, "
+                       f"{len(sink.segments)} segment: {', '.join(seg['file'] for seg in sink.segments)}")
+            else:
+                msg = f"\n>> [REC] DA LUU FILE: {self.filename} ({stats['written_frames']} frame"
+            if stats["dropped_frames"]:
+                msg += f", BO {stats['dropped_frames']} frame do hang doi day"
+            self._log(msg + ")\n")
+
+    # --- RAW CAPTURE ---
+    def start_capture(self, filename=None):
+        if self.capture: return
+        if filename is None:
+            filename = f"capture_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}{CAPTURE_EXT}"
+        try:
+            self.capture = CaptureWriter(filename)
+            self._log(f"\n>> [CAP] BAT DAU GHI BYTE THO: {filename}\n")
+        except Exception as e:
+            self._log(f"\n>> [ERROR] Khong the tao file capture: {e}\n")
+
+    def stop_capture(self):
+        capture = self.capture
+        if capture:
+            self.capture = None
+            capture.close()
+            self._log(f"\n>> [CAP] DA LUU: {capture.filename} ({capture.bytes} byte)\n")
+
+    def _log(self, text):
+        # Chỉ ghi thẳng stdout khi chưa có console (luồng chính, trước start_reading / sau disconnect)
+        console = self.console
+        if console is not None:
+            console.log(text)
+        elif self.echo:
+            sys.stdout.write(text)
 
     # --- SEND COMMAND ---
     def send_command(self, cmd_id, args=b''):
-        if not self.ser: return
-        self.seq_counter = (self.seq_counter + 1) % 256
-        cmd_payload = struct.pack('<BB', cmd_id, self.seq_counter) + args
+        """Gửi COMMAND không chờ ACK, trả về Seq đã dùng (None nếu chưa kết nối)."""
+        if not self.ser: return None
+        seq = self._next_seq(cmd_id)
+        cmd_payload = struct.pack('<BB', cmd_id, seq) + args
         self._send_raw_frame(TYPE_COMMAND, cmd_payload)
+        return seq
+
+    def submit_command(self, cmd_id, args=b'', timeout=None, retries=None):
+        """Gửi COMMAND có theo dõi ACK -> concurrent.futures.Future[Ack].
+
+        Cần luồng đọc đang chạy (nó nhận ACK và kiểm tra timeout / gửi lại).
+        """
+        if not self.ser:
+            raise ConnectionError(f"{self.port} chua ket noi")
+        seq = self._next_seq(cmd_id)
+        frame = build_frame(TYPE_COMMAND, struct.pack('<BB', cmd_id, seq) + args)
+        return self.commands.submit(cmd_id, seq, frame, timeout, retries)
+
+    def execute(self, cmd_id, args=b'', timeout=None, check=True):
+        """Gửi 1 lệnh và chờ ACK (đã gồm các lần gửi lại). check=True: ACK lỗi -> CommandError."""
+        ack = self.submit_command(cmd_id, args, timeout).result()
+        if check and not ack.ok:
+            raise CommandError(ack)
+        return ack
+
+    def configure(self, rates=None, bits=None, active_map=None, n_sensors=None, check=True):
+        """Gửi loạt lệnh cấu hình cùng lúc (pipeline) rồi chờ tất cả ACK.
+
+        rates / bits: {sensor_index: giá trị}. Trả về list Ack theo thứ tự gửi.
+        """
+        futures = [self.submit_command(cmd_id, args) for cmd_id, args in
+                   config_commands(rates, bits, active_map, n_sensors)]
+        acks = wait_all(futures)
+        if check:
+            for ack in acks:
+                if not ack.ok:
+                    raise CommandError(ack)
+        return acks
+
+    def _next_seq(self, cmd_id):
+        # Bỏ qua Seq còn đang chờ ACK của cùng lệnh (khi quay vòng 256)
+        for _ in range(256):
+            self.seq_counter = (self.seq_counter + 1) % 256
+            if not self.commands.is_busy(cmd_id, self.seq_counter):
+                break
+        return self.seq_counter
 
     def _send_raw_frame(self, msg_type, payload):
-        payload_len = len(payload)
-        header_for_crc = struct.pack('<BBH', PROTOCOL_VER, msg_type, payload_len)
-        data_to_crc = header_for_crc + payload
-        crc = calculate_crc16(data_to_crc)
-        full_frame = SOF + data_to_crc + struct.pack('<H', crc)
-        self.ser.write(full_frame)
+        self._write_frame(build_frame(msg_type, payload))
+
+    def _write_frame(self, frame):
+        # Luồng chính (lệnh mới) và luồng đọc (gửi lại) cùng ghi -> không để frame xen nhau
+        with self._write_lock:
+            self.ser.write(frame)
 
     # --- RECEIVE LOOP ---
     def start_reading(self):
+        if self.echo and self.console is None:
+            self.console = ConsoleRenderer(HostStatusLine(self)).start()
+            self._own_console = True
         self.running = True
         self.read_thread = threading.Thread(target=self._reader_loop)
         self.read_thread.daemon = True
         self.read_thread.start()
 
     def _reader_loop(self):
-        buffer = b''
-        while self.running and self.ser.is_open:
+        while self.running:
+            try:
+                if self.poll_interval is None:
+                    # Chặn tới khi có ít nhất 1 byte rồi lấy luôn phần đang chờ
+                    data = self.ser.read(min(max(1, self.ser.in_waiting), READ_CHUNK))
+                else:
+                    data = self.ser.read(self.ser.in_waiting) if self.ser.in_waiting else b''
+                    if not data:
+                        time.sleep(self.poll_interval)
+            except (serial.SerialException, OSError) as e:
+                if not self.running:
+                    break
+                self._reconnect(e)
+                continue
             try:
-                if self.ser.in_waiting:
-                    buffer += self.ser.read(self.ser.in_waiting)
-
-                while len(buffer) >= 6:
-                    sof_index = buffer.find(SOF)
-                    if sof_index == -1: buffer = b''; break
-                    if sof_index > 0: buffer = buffer[sof_index:]
-                    if len(buffer) < 6: break
-
-                    payload_len = struct.unpack_from('<H', buffer, 4)[0]
-                    total_len = 6 + payload_len + 2
-                    if len(buffer) < total_len: break
-
-                    frame = buffer[:total_len]
-                    buffer = buffer[total_len:]
-                    self._process_frame(frame, payload_len)
-                time.sleep(0.005)
+                if data:
+                    self._handle_bytes(data, time.perf_counter())
+                if len(self.commands):
+                    self.commands.poll()
+            except Exception as e:
+                # Lỗi ngoài dự kiến (consumer, ghi capture...) không được làm chết luồng đọc
+                self.process_errors += 1
+                self._log(f"\n>> [ERROR] Loi xu ly du lieu: {e!r}\n")
+
+    def _handle_bytes(self, data, t_arrival):
+        capture = self.capture
+        if capture is not None:
+            try:
+                capture.write(data, time.time())
             except Exception:
-                break
-
-    def _process_frame(self, frame, payload_len):
-        msg_type = frame[3]
-        payload = frame[6: 6 + payload_len]
-
-        if msg_type == TYPE_ACK:
-            cmd, seq, res = struct.unpack('<BBB', payload)
-            res_str = "OK" if res == 0 else f"FAIL({res})"
-            # In xuống dòng để dễ nhìn ACK
-            sys.stdout.write(f"\n   << [ACK] Cmd: {hex(cmd)} -> {res_str}\n")
-
-        elif msg_type == TYPE_STATUS:
-            state = payload[0]
-            n_sensors = payload[1]
-            state_map = {0: "IDLE", 1: "MEASURING", 2: "CALIB", 3: "ERROR"}
-            sys.stdout.write(f"\n   << [STATUS] State: {state_map.get(state, 'Unknown')} | Active: {n_sensors}\n")
-
-        elif msg_type == TYPE_DATA:
-            ts, adc_raw = struct.unpack('<IH', payload)
-            voltage = adc_raw * 0.00003125
-            status = "THA LONG"
-            if voltage < 0.60: status = "DA AN"
-
-            # Ghi file nền
-            rec_tag = ""
-            if self.is_recording and self.csv_writer:
-                rec_tag = "[REC] "
-                try:
-                    self.csv_writer.writerow([
-                        ts, adc_raw, f"{voltage:.4f}", status,
-                        datetime.now().strftime("%H:%M:%S.%f")[:-3]
-                    ])
-                except:
-                    pass
-
-            # HIỂN THỊ REALTIME (Ghi đè dòng cũ)
-            # Dùng sys.stdout.write với \r để đưa con trỏ về đầu dòng
-            sys.stdout.write(f"\r{rec_tag}[DATA] TS: {ts}ms | {voltage:.4f}V -> {status}        ")
-            sys.stdout.flush()
+                self.process_errors += 1
+        self._t_arrival = t_arrival
+        perf_counter = time.perf_counter
+        latency = self.dispatch_latency
+        metrics = self.metrics
+        # Đếm mọi lần đọc; đo thời gian chỉ 1 / metrics.sample_every lần đọc
+        if metrics is not None and metrics.on_read(len(data)):
+            frames_before = self.parser.frames_ok
+        else:
+            metrics = None
+        table = self.dispatcher.table
+        for msg_type, payload in self.parser.feed(data):
+            latency.add(perf_counter() - t_arrival)
+            handler = table[msg_type]
+            if handler is None:
+                self.frames_skipped += 1
+                continue
+            try:
+                handler(payload)
+            except Exception:
+                # Payload sai cấu trúc không được làm chết luồng đọc
+                self.process_errors += 1
+        # Hết dữ liệu của lần đọc này -> giải mã ngay phần DATA đã gom
+        if self._batch_frames:
+            try:
+                self._flush_data_batch()
+            except Exception:
+                self.process_errors += 1
+        if metrics is not None:
+            frames = self.parser.frames_ok - frames_before
+            if frames:
+                metrics.frame_time.observe((perf_counter() - t_arrival) / frames)
+
+    # --- KHỐI MẪU (BATCH DECODE) ---
+    def add_block_consumer(self, callback):
+        """Đăng ký hàm nhận SampleBlock (gọi trong luồng đọc, cần xử lý nhanh)."""
+        self.block_consumers.append(callback)
+
+    def remove_block_consumer(self, callback):
+        if callback in self.block_consumers:
+            self.block_consumers.remove(callback)
+
+    def _flush_data_batch(self):
+        metrics = self.metrics
+        try:
+            if metrics is not None and metrics.sampled:
+                t0 = time.perf_counter()
+                block = decode_block(self.layout, self._batch)
+                metrics.on_decode(time.perf_counter() - t0, self._batch_frames)
+            else:
+                block = decode_block(self.layout, self._batch)
+        finally:
+            # Lô lỗi cũng phải bỏ, không thì mọi lần flush sau đều hỏng theo
+            del self._batch[:]
+            self._batch_frames = 0
+        # pc_time từng frame = ts MCU quy về đồng hồ host (bù trôi), thay cho giờ giải mã
+        losses, block.pc_time = self.timing.check(block.timestamps, time.time())
+        for loss in losses:
+            self._on_event(loss)
+        try:
+            self.detector.process(block, self._t_arrival, self.timing.period)
+        except Exception:
+            self.process_errors += 1
+        self._on_block(block)
+
+    # --- SỰ KIỆN: ERROR THIẾT BỊ + MẤT MẪU ---
+    def add_event_consumer(self, callback):
+        """Đăng ký hàm nhận DeviceError / SampleLoss (gọi trong luồng đọc)."""
+        self.event_consumers.append(callback)
+
+    def remove_event_consumer(self, callback):
+        if callback in self.event_consumers:
+            self.event_consumers.remove(callback)
+
+    def _call_consumers(self, callbacks, arg):
+        # 1 consumer lỗi không được chặn các consumer sau nó hay làm chết luồng đọc
+        for callback in callbacks:
+            try:
+                callback(arg)
+            except Exception:
+                self.process_errors += 1
+
+    def _on_event(self, event):
+        self.event_log.append(event)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.submit_event(event)
+        if isinstance(event, DeviceError):
+            self.device_errors[event.name] = self.device_errors.get(event.name, 0) + 1
+        self._call_consumers(self.event_consumers, event)
+        if not self.echo:
+            return
+        if isinstance(event, SampleLoss):
+            detail = f"thieu {event.count} mau" if event.kind == "gap" else f"delta {event.delta_ms}ms"
+            self._log(f"\n   << [LOSS] {event.name}: {detail} @ TS {event.ts_ms}ms\n")
+        else:
+            self._log(f"\n   << [ERROR] {event.name} | Aux: 0x{event.aux:04X} @ {event.timestamp_us}us\n")
+
+    def _reconnect(self, error):
+        self._log(f"\n>> [ERROR] Mat ket noi {self.port}: {error}. Dang ket noi lai...\n")
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+        self.parser.reset()
+        delay = RECONNECT_DELAY
+        while self.running:
+            time.sleep(delay)
+            try:
+                self.ser = self._open_port()
+            except (serial.SerialException, OSError):
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+                continue
+            self.reconnects += 1
+            self._log(f"\n>> [SYSTEM] Da ket noi lai {self.port}\n")
+            return
+
+    # --- THỐNG KÊ ĐƯỜNG TRUYỀN ---
+    @property
+    def frames_ok(self):
+        return self.parser.frames_ok
+
+    @property
+    def crc_errors(self):
+        return self.parser.crc_errors
+
+    @property
+    def oversize_frames(self):
+        return self.parser.oversize_frames
+
+    @property
+    def resync_bytes(self):
+        return self.parser.resync_bytes
+
+    # --- ĐO ĐẠC (metrics.py) ---
+    def enable_metrics(self, registry=REGISTRY, labels=None):
+        """Bật đo đạc hot path, đăng ký metric (nhãn mặc định port=...) vào registry."""
+        if self.metrics is None:
+            # Thời gian xử lý theo loại frame (bọc perf_counter trong bảng điều phối)
+            self.dispatcher.set_timing(True)
+            self.metrics = HostMetrics(self, registry, labels)
+            if self.recorder is not None:
+                self.recorder.write_time = self.metrics.write_time
+        return self.metrics
+
+    def disable_metrics(self):
+        metrics = self.metrics
+        if metrics is None:
+            return
+        self.metrics = None
+        self.dispatcher.set_timing(False)
+        if self.recorder is not None:
+            self.recorder.write_time = None
+        metrics.close()
+
+    def get_link_stats(self):
+        stats = self.parser.stats()
+        stats["reconnects"] = self.reconnects
+        stats["process_errors"] = self.process_errors
+        stats["frames_skipped"] = self.frames_skipped
+        stats["handlers"] = self.dispatcher.stats()
+        stats["commands"] = self.commands.stats()
+        stats["timing"] = self.timing.stats()
+        stats["detector"] = self.detector.stats()
+        stats["device_errors"] = dict(self.device_errors)
+        stats["dispatch_latency"] = self.dispatch_latency.snapshot()
+        return stats
+
+    def _on_ack(self, cmd, seq, res):
+        ack = self.commands.on_ack(cmd, seq, res)
+        if ack is not None and self.metrics is not None:
+            self.metrics.command_rtt.observe(ack.rtt)
+        return ack
+
+    # --- ĐIỀU PHỐI FRAME THEO LOẠI ---
+    def subscribe_frame(self, msg_type, callback):
+        """Đăng ký callback cho 1 loại frame (gọi trong luồng đọc, cần xử lý nhanh).
+
+        callback nhận Ack / DeviceStatus / DeviceError đã giải mã; DATA và loại tự khai báo
+        (dispatcher.register) nhận payload là memoryview vào bộ đệm parser, cần copy nếu giữ lại.
+        """
+        self.dispatcher.subscribe(msg_type, callback)
+
+    def unsubscribe_frame(self, msg_type, callback):
+        self.dispatcher.unsubscribe(msg_type, callback)
+
+    def register_frame_type(self, msg_type, name, max_payload_len, decode=None):
+        """Khai báo loại frame mới: parser chấp nhận Type này (Len <= max_payload_len) và
+        bảng điều phối giải mã bằng decode (None = payload thô) trước khi gọi subscriber."""
+        if not 0 <= msg_type < TABLE_SIZE:
+            raise ValueError(f"msg_type phai trong 0..{TABLE_SIZE - 1}")
+        # Len > sức chứa bộ đệm parser: frame không bao giờ đủ -> feed() không tiến được
+        limit = min(self.parser.payload_capacity, 0xFFFF)
+        if not 0 <= max_payload_len <= limit:
+            raise ValueError(f"max_payload_len phai trong 0..{limit} byte (suc chua bo dem parser)")
+        self.parser.max_payload_len[msg_type] = max_payload_len
+        return self.dispatcher.register(msg_type, name, decode)
+
+    def _process_frame(self, msg_type, payload):
+        """Xử lý 1 frame ngoài hot path (công cụ / phát lại); luồng đọc tra thẳng dispatcher.table."""
+        if not self.dispatcher.dispatch(msg_type, payload):
+            self.frames_skipped += 1
+
+    def _on_ack_frame(self, ack):
+        self._on_ack(ack.cmd, ack.seq, ack.result)
+        # In xuống dòng để dễ nhìn ACK
+        if self.echo:
+            res_str = "OK" if ack.result == 0 else f"FAIL({ACK_RESULT_NAMES.get(ack.result, ack.result)})"
+            self._log(f"\n   << [ACK] Cmd: {hex(ack.cmd)} -> {res_str}\n")
+
+    def _on_status(self, status):
+        self.status = status
+        layout = DataLayout.from_status(status)
+        if layout is not self.layout:
+            # Khối đang gom thuộc bố cục cũ
+            if self._batch_frames:
+                self._flush_data_batch()
+            self.layout = layout
+            # Cấu hình kênh đổi => cột CSV đổi, sang file mới
+            if self.is_recording:
+                self.stop_recording()
+                self.start_recording()
+        self.timing.set_status(status, layout)
+        self.detector.set_status(status, layout)
+        if self.echo:
+            self._log(f"\n   << [STATUS] State: {status.state_name} | Active: {status.n_sensors}"
+                      f" | Kenh: {list(layout.channels)} | Bits: {list(layout.bits)}\n")
+
+    def _on_data_payload(self, payload):
+        if len(payload) != self.layout.payload_len:
+            # DATA không khớp STATUS gần nhất (chưa nhận STATUS mới?) -> bỏ qua
+            self.layout_mismatches += 1
+            return
+        self._batch += payload
+        self._batch_frames += 1
+        if self._batch_frames >= BATCH_MAX_FRAMES:
+            self._flush_data_batch()
+
+    def _on_block(self, block):
+        # Ghi file nền: chỉ đẩy khối sang luồng ghi
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.submit(block)
+
+        self._call_consumers(self.block_consumers, block)
+
+        # ConsoleRenderer tự lấy khối mới nhất theo nhịp hiển thị (HostStatusLine)
+        self.latest_block = block
 
 
 # ==============================================================================
 # 4. CHƯƠNG TRÌNH CHÍNH (SỬ DỤNG MSVCRT - KHÔNG CẦN ENTER)
 # ==============================================================================
 if __name__ == "__main__":
+    import msvcrt  # <--- [QUAN TRỌNG] Thư viện bắt phím trên Windows
+
     host = BiomechanicsHost(SERIAL_PORT, BAUD_RATE)
 
     if host.connect():
-        host.start_reading()
-        time.sleep(1)
-        host.send_command(CMD_GET_STATUS)
-
         print("\n--- DIEU KHIEN TUC THOI (KHONG CAN ENTER) ---")
         print(" [s] START Measuring")
         print(" [x] STOP Measuring")
         print(" [g] Get Status")
-        print(" [r] START Recording")
+        print(" [r] START Recording (CSV)")
+        print(" [b] START Recording (Binary .bms)")
         print(" [e] END Recording")
+        print(" [c] START/STOP Capture (byte tho)")
         print(" [q] Quit")
         print("---------------------------------------------")
 
+        # Từ đây mọi thứ in ra terminal đi qua luồng hiển thị (15 Hz) do start_reading() tạo
+        host.start_reading()
+        time.sleep(1)
+        host.send_command(CMD_GET_STATUS)
+
         try:
             while True:
                 # Kiểm tra xem có phím nào được ấn không
@@ -221,25 +709,34 @@ if __name__ == "__main__":
                     key = msvcrt.getch().decode('utf-8').lower()
 
                     if key == 's':
-                        sys.stdout.write("\n>> Gui lenh START...\n")
+                        host._log(">> Gui lenh START...")
                         host.send_command(CMD_START_MEASURE)
 
                     elif key == 'x':
-                        sys.stdout.write("\n>> Gui lenh STOP...\n")
+                        host._log(">> Gui lenh STOP...")
                         host.send_command(CMD_STOP_MEASURE)
 
                     elif key == 'g':
-                        sys.stdout.write("\n>> Gui lenh GET STATUS...\n")
+                        host._log(">> Gui lenh GET STATUS...")
                         host.send_command(CMD_GET_STATUS)
 
                     elif key == 'r':
-                        host.start_recording()
+                        host.start_recording("csv")
+
+                    elif key == 'b':
+                        host.start_recording("bin")
 
                     elif key == 'e':
                         host.stop_recording()
 
+                    elif key == 'c':
+                        if host.capture:
+                            host.stop_capture()
+                        else:
+                            host.start_capture()
+
                     elif key == 'q':
-                        sys.stdout.write("\n>> Tam biet!\n")
+                        host._log(">> Tam biet!")
                         break
 
                 # Nghỉ cực ngắn để không ngốn CPU
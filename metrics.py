@@ -0,0 +1,375 @@
+# ==============================================================================
+# ĐO ĐẠC HOT PATH: COUNTER / GAUGE / HISTOGRAM BUCKET CỐ ĐỊNH + XUẤT SỐ LIỆU
+# ==============================================================================
+# - Registry giữ các metric (tên + nhãn). Metric tự cập nhật (inc / set / observe) hoặc
+#   lấy giá trị qua hàm fn lúc snapshot (bộ đếm sẵn có của parser, recorder... -> 0 chi phí).
+# - HostMetrics nối registry vào BiomechanicsHost: host.enable_metrics() / disable_metrics().
+#   Khi tắt, hot path chỉ tốn 1 phép so sánh "self.metrics is not None".
+# - Xuất: snapshot() (dict), MetricsDumper (ghi JSON lines định kỳ ra file),
+#   MetricsServer (HTTP cục bộ: /metrics dạng Prometheus text, /json).
+#
+#   python metrics.py COM3 9108 metrics.jsonl
+#     -> đo cổng COM3, xem http://127.0.0.1:9108/metrics, ghi snapshot mỗi 5 s vào metrics.jsonl
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bucket (giây)
+LATENCY_BUCKETS = (1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4,
+                   1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1.0)
+RTT_BUCKETS = (1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+# Counter luôn chính xác; histogram thời gian (parse, giải mã) chỉ lấy mẫu 1 / SAMPLE_EVERY
+# lần đọc serial để chi phí đo không đáng kể cả khi mỗi lần đọc chỉ có vài frame
+SAMPLE_EVERY = 8
+DUMP_INTERVAL = 5.0         # s
+HTTP_HOST = "127.0.0.1"
+
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help="", labels=None, fn=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.fn = fn
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, buckets, help="", labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)   # phần tử cuối: > bucket lớn nhất
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # bisect_left: value == biên thuộc bucket "le" đó (ngữ nghĩa Prometheus)
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Ước lượng phân vị theo biên trên của bucket (đủ cho theo dõi, không nội suy)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for bound, n in zip(self.bounds + (float('inf'),), self.counts):
+            running += n
+            if running >= target:
+                return bound
+        return float('inf')
+
+    def get(self):
+        return {"count": self.count, "sum": self.sum, "p50": self.quantile(0.5),
+                "p99": self.quantile(0.99),
+                "buckets": dict(zip([str(b) for b in self.bounds] + ["+Inf"], self.counts))}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        key = (metric.name, tuple(sorted(metric.labels.items())))
+        with self._lock:
+            existing = self._metrics.get(key)
+            if existing is not None:
+                return existing
+            self._metrics[key] = metric
+        return metric
+
+    def counter(self, name, help="", labels=None, fn=None):
+        return self._add(Counter(name, help, labels, fn))
+
+    def gauge(self, name, help="", labels=None, fn=None):
+        return self._add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS, help="", labels=None):
+        return self._add(Histogram(name, buckets, help, labels))
+
+    def remove(self, labels):
+        """Bỏ mọi metric có đúng bộ nhãn này (vd. khi tắt đo 1 host)."""
+        items = tuple(sorted(labels.items()))
+        with self._lock:
+            for key in [k for k in self._metrics if k[1] == items]:
+                del self._metrics[key]
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        out = {}
+        for m in self.metrics():
+            out[m.name + _label_str(m.labels)] = m.get()
+        return out
+
+    def to_prometheus(self):
+        lines = []
+        seen = set()
+        for m in sorted(self.metrics(), key=lambda m: m.name):
+            if m.name not in seen:
+                seen.add(m.name)
+                if m.help:
+                    lines.append(f"# HELP {m.name} {m.help}")
+                lines.append(f"# TYPE {m.name} {m.kind}")
+            if m.kind == "histogram":
+                running = 0
+                for bound, n in zip(m.bounds + ("+Inf",), m.counts):
+                    running += n
+                    labels = dict(m.labels, le=bound)
+                    lines.append(f"{m.name}_bucket{_label_str(labels)} {running}")
+                lines.append(f"{m.name}_sum{_label_str(m.labels)} {m.sum}")
+                lines.append(f"{m.name}_count{_label_str(m.labels)} {m.count}")
+            else:
+                lines.append(f"{m.name}{_label_str(m.labels)} {m.get()}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# ==============================================================================
+# NỐI VÀO HOST
+# ==============================================================================
+class HostMetrics:
+    """Các metric của 1 BiomechanicsHost (nhãn mặc định port=...)."""
+
+    def __init__(self, host, registry=REGISTRY, labels=None, sample_every=SAMPLE_EVERY):
+        self.registry = registry
+        self.sample_every = sample_every
+        self.sampled = False    # lần đọc hiện tại có đo thời gian không
+        self.n_reads = 0
+        self.n_bytes = 0
+        self._countdown = sample_every
+        self.labels = labels = labels or {"port": host.port}
+        parser = host.parser
+        commands = host.commands
+        r = registry
+
+        # Đọc serial
+        r.counter("bm_reads_total", "So lan doc serial", labels, fn=lambda: self.n_reads)
+        r.counter("bm_bytes_total", "So byte nhan", labels, fn=lambda: self.n_bytes)
+        self.read_size = r.histogram("bm_read_bytes", SIZE_BUCKETS, "Byte moi lan doc (lay mau)", labels)
+        r.gauge("bm_parser_backlog_bytes", "Byte cho trong bo dem parser", labels, fn=lambda: parser.backlog)
+
+        # Parser (bộ đếm sẵn có)
+        r.counter("bm_frames_total", "Frame hop le", labels, fn=lambda: parser.frames_ok)
+        r.counter("bm_crc_errors_total", "Frame sai CRC", labels, fn=lambda: parser.crc_errors)
+        r.counter("bm_resync_bytes_total", "Byte bo qua khi do lai SOF", labels, fn=lambda: parser.resync_bytes)
+        r.counter("bm_oversize_frames_total", "Frame Len vuot gioi han", labels, fn=lambda: parser.oversize_frames)
+        r.counter("bm_process_errors_total", "Loi xu ly frame", labels, fn=lambda: host.process_errors)
+        r.counter("bm_layout_mismatches_total", "DATA khong khop STATUS", labels, fn=lambda: host.layout_mismatches)
+        r.counter("bm_reconnects_total", "So lan mo lai cong", labels, fn=lambda: host.reconnects)
+        r.counter("bm_frames_skipped_total", "Frame loai khong co subscriber", labels,
+                  fn=lambda: host.frames_skipped)
+        # Xử lý theo loại frame (bảng điều phối, frame_dispatch.py)
+        self._type_labels = []
+        for handler in host.dispatcher.handlers.values():
+            type_labels = dict(labels, type=handler.name)
+            self._type_labels.append(type_labels)
+            r.counter("bm_frames_handled_total", "Frame da xu ly theo loai", type_labels,
+                      fn=lambda h=handler: h.frames)
+            r.gauge("bm_frame_handler_mean_seconds", "Thoi gian xu ly trung binh 1 frame theo loai", type_labels,
+                    fn=lambda h=handler: h.total / h.frames if h.frames else 0.0)
+        # Thời gian mẫu (sample_timing.py)
+        timing = host.timing
+        r.counter("bm_missing_samples_total", "Mau thieu theo ts MCU", labels, fn=lambda: timing.missing)
+        r.counter("bm_duplicate_samples_total", "Mau trung ts", labels, fn=lambda: timing.duplicates)
+        r.gauge("bm_sample_jitter_ms", "Jitter ts MCU so voi chu ky ky vong", labels, fn=lambda: timing.jitter_ms)
+        r.counter("bm_detect_events_total", "Su kien canh tu bo phat hien", labels,
+                  fn=lambda: host.detector.events)
+        r.gauge("bm_detect_latency_p99_seconds", "Tre nhan byte -> consumer su kien (p99)", labels,
+                fn=lambda: host.detector.latency.quantile(0.99))
+        r.counter("bm_device_errors_total", "Frame ERROR tu thiet bi", labels,
+                  fn=lambda: sum(host.device_errors.values()))
+        self.frame_time = r.histogram("bm_frame_handle_seconds",
+                                      help="Thoi gian tach + xu ly trung binh 1 frame trong 1 lan doc (lay mau)",
+                                      labels=labels)
+
+        # Giải mã khối
+        self.decode_time = r.histogram("bm_block_decode_seconds", help="Thoi gian giai ma 1 khoi DATA (lay mau)",
+                                       labels=labels)
+        self.block_frames = r.histogram("bm_block_frames", SIZE_BUCKETS, "So frame moi khoi (lay mau)", labels)
+
+        # Ghi file (luồng ghi đo thời gian qua recorder.write_time)
+        self.write_time = r.histogram("bm_recorder_write_seconds", help="Thoi gian ghi 1 khoi ra file",
+                                      labels=labels)
+        r.gauge("bm_recorder_written_frames", "Frame da ghi (file hien tai)", labels,
+                fn=lambda: host.recorder.written_frames if host.recorder is not None else 0)
+        r.gauge("bm_recorder_queue_depth", "Khoi cho ghi", labels,
+                fn=lambda: host.recorder.queue_depth if host.recorder is not None else 0)
+        r.gauge("bm_recorder_dropped_frames", "Frame bi bo do hang doi ghi day (file hien tai)", labels,
+                fn=lambda: host.recorder.dropped_frames if host.recorder is not None else 0)
+
+        # Lệnh
+        self.command_rtt = r.histogram("bm_command_rtt_seconds", RTT_BUCKETS, "COMMAND -> ACK", labels)
+        r.counter("bm_command_retransmits_total", "Lenh gui lai", labels, fn=lambda: commands.retransmits)
+        r.counter("bm_command_timeouts_total", "Lenh het luot thu", labels, fn=lambda: commands.timeouts)
+        r.gauge("bm_commands_in_flight", "Lenh dang cho ACK", labels, fn=lambda: len(commands))
+
+    # Gọi từ luồng đọc của host
+    def on_read(self, n_bytes):
+        """Đếm 1 lần đọc; True nếu lần đọc này được chọn để đo thời gian."""
+        self.n_reads += 1
+        self.n_bytes += n_bytes
+        self._countdown -= 1
+        if self._countdown:
+            self.sampled = False
+            return False
+        self._countdown = self.sample_every
+        self.sampled = True
+        self.read_size.observe(n_bytes)
+        return True
+
+    def on_decode(self, seconds, n_frames):
+        self.decode_time.observe(seconds)
+        self.block_frames.observe(n_frames)
+
+    def close(self):
+        self.registry.remove(self.labels)
+        for labels in self._type_labels:
+            self.registry.remove(labels)
+
+
+# ==============================================================================
+# XUẤT SỐ LIỆU
+# ==============================================================================
+class MetricsDumper:
+    """Ghi snapshot dạng JSON lines ra file mỗi interval giây (luồng riêng)."""
+
+    def __init__(self, filename, registry=REGISTRY, interval=DUMP_INTERVAL):
+        self.filename = filename
+        self.registry = registry
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.dump()
+
+    def dump(self):
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps({"time": time.time(), "metrics": self.registry.snapshot()}) + "\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.dump()
+            except OSError:
+                pass
+
+
+class MetricsServer:
+    """HTTP cục bộ: GET /metrics (Prometheus text), GET /json (snapshot)."""
+
+    def __init__(self, port, registry=REGISTRY, host=HTTP_HOST):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics"):
+                    body = registry_ref.to_prometheus().encode()
+                    ctype = "text/plain; version=0.0.4"
+                elif self.path.startswith("/json"):
+                    body = json.dumps(registry_ref.snapshot()).encode()
+                    ctype = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    import sys
+    from giao_tiep_protocol import BiomechanicsHost, BAUD_RATE, CMD_GET_STATUS
+
+    if len(sys.argv) < 2:
+        print("Cach dung: python metrics.py <port> [http_port] [dump_file]")
+        sys.exit(1)
+    http_port = int(sys.argv[2]) if len(sys.argv) > 2 else 9108
+    dumper = MetricsDumper(sys.argv[3]) if len(sys.argv) > 3 else None
+    host = BiomechanicsHost(sys.argv[1], BAUD_RATE)
+    host.echo = False
+    if host.connect():
+        host.enable_metrics()
+        server = MetricsServer(http_port).start()
+        if dumper is not None:
+            dumper.start()
+        print(f">> Metrics: http://{HTTP_HOST}:{server.port}/metrics  (Ctrl+C de dung)")
+        host.start_reading()
+        host.send_command(CMD_GET_STATUS)
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            if dumper is not None:
+                dumper.stop()
+            host.disconnect()
@@ -0,0 +1,230 @@
+# ==============================================================================
+# GHI FILE NỀN: LUỒNG GHI RIÊNG + HÀNG ĐỢI CÓ GIỚI HẠN
+# ==============================================================================
+# Luồng đọc chỉ việc recorder.submit(block) (không chặn). Định dạng chuỗi, ghi đĩa,
+# flush đều nằm ở luồng ghi. Hàng đợi đầy => bỏ khối và đếm, không bao giờ làm chậm
+# luồng đọc (tránh tràn bộ đệm serial của hệ điều hành).
+import csv
+import io
+import queue
+import threading
+import time
+from datetime import datetime
+
+QUEUE_MAX_BLOCKS = 1024
+FLUSH_INTERVAL = 1.0          # s
+STOP_POLL_INTERVAL = 0.5      # s, stop() kiểm tra lại luồng ghi khi hàng đợi đầy
+WRITE_BUFFER_SIZE = 1 << 20   # 1 MB
+
+_STOP = object()
+
+
+class _EventItem:
+    """Sự kiện (DeviceError / SampleLoss) đi chung hàng đợi với khối để giữ đúng thứ tự trong luồng."""
+    __slots__ = ("event",)
+
+    def __init__(self, event):
+        self.event = event
+
+
+def csv_header(layout):
+    """Cột CSV theo bố cục kênh; 1 kênh thì giữ nguyên tên cột cũ."""
+    # Không còn cột Status từng dòng: nhấn/nhả chỉ ghi thành sự kiện cạnh trong file .bmevt
+    if layout.n_channels == 1:
+        return ["Timestamp_MCU_ms", "ADC_Raw", "Voltage_V", "PC_Time"]
+    header = ["Timestamp_MCU_ms"]
+    for ch in layout.channels:
+        header += [f"ADC_Raw_CH{ch}", f"Voltage_V_CH{ch}"]
+    header.append("PC_Time")
+    return header
+
+
+def csv_rows(block):
+    """Đổi 1 SampleBlock thành các dòng CSV (chạy trong luồng ghi)."""
+    # pc_time: 1 số cho cả khối (khi đo trực tiếp) hoặc mảng theo từng frame (đọc lại từ file)
+    if hasattr(block.pc_time, 'tolist'):
+        pc_times = [datetime.fromtimestamp(t).strftime("%H:%M:%S.%f")[:-3] for t in block.pc_time.tolist()]
+    else:
+        pc_times = [datetime.fromtimestamp(block.pc_time).strftime("%H:%M:%S.%f")[:-3]] * len(block)
+    rows = []
+    for ts, raw, volts, pc_time in zip(block.timestamps.tolist(), block.raw.tolist(),
+                                       block.volts.tolist(), pc_times):
+        row = [ts]
+        for adc, voltage in zip(raw, volts):
+            row += [adc, f"{voltage:.4f}"]
+        row.append(pc_time)
+        rows.append(row)
+    return rows
+
+
+class CsvSink:
+    """Đích ghi CSV. Mọi đích ghi (CSV, nhị phân...) đều có write_block / flush / close."""
+
+    def __init__(self, filename, layout, buffer_size=WRITE_BUFFER_SIZE):
+        self.filename = filename
+        self.layout = layout
+        # Ghi nhị phân + tự đếm byte: tell() của file text phải flush bộ đệm mỗi lần gọi
+        self._file = open(filename, mode='wb', buffering=buffer_size)
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text)
+        self.records = 0
+        self.bytes = 0
+        self._writer.writerow(csv_header(layout))
+        self._write_text()
+
+    def _write_text(self):
+        data = self._text.getvalue().encode()
+        self._text.seek(0)
+        self._text.truncate()
+        self._file.write(data)
+        self.bytes += len(data)
+
+    def write_block(self, block):
+        self._writer.writerows(csv_rows(block))
+        self._write_text()
+        self.records += len(block)
+
+    def tell(self):
+        """(số record đã ghi, vị trí byte của record kế tiếp) - dùng cho chỉ mục phiên đo."""
+        return self.records, self.bytes
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BlockRecorder:
+    def __init__(self, sink, queue_size=QUEUE_MAX_BLOCKS, flush_interval=FLUSH_INTERVAL):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._closed = False
+
+        # Thống kê
+        self.written_frames = 0
+        self.dropped_blocks = 0
+        self.dropped_frames = 0
+        self.dropped_events = 0
+        self.write_errors = 0
+        # metrics.Histogram thời gian ghi 1 khối (None = không đo)
+        self.write_time = None
+
+    @property
+    def filename(self):
+        return self.sink.filename
+
+    def start(self):
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, block):
+        """Đưa khối vào hàng đợi ghi; trả False nếu hàng đợi đầy (khối bị bỏ)."""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(block)
+            return True
+        except queue.Full:
+            self.dropped_blocks += 1
+            self.dropped_frames += len(block)
+            return False
+
+    def submit_event(self, event):
+        """Đưa sự kiện vào hàng đợi ghi (sink có write_event, vd session_index.IndexedSink)."""
+        if self._closed or not hasattr(self.sink, 'write_event'):
+            return False
+        try:
+            self._queue.put_nowait(_EventItem(event))
+            return True
+        except queue.Full:
+            self.dropped_events += 1
+            return False
+
+    def stop(self):
+        """Ghi nốt mọi khối còn trong hàng đợi, flush và đóng file."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._closed = True
+        # Hàng đợi đầy: chờ luồng ghi rút bớt; luồng ghi đã chết thì không chờ mãi
+        while True:
+            try:
+                self._queue.put(_STOP, timeout=STOP_POLL_INTERVAL)
+                break
+            except queue.Full:
+                if not thread.is_alive():
+                    break
+        thread.join()
+        self._thread = None
+        try:
+            self.sink.close()
+        except Exception:
+            self.write_errors += 1
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "written_frames": self.written_frames,
+            "dropped_blocks": self.dropped_blocks,
+            "dropped_frames": self.dropped_frames,
+            "dropped_events": self.dropped_events,
+            "write_errors": self.write_errors,
+            "queue_depth": self.queue_depth,
+        }
+
+    def _writer_loop(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                # Có thể còn khối lọt vào sau _STOP (submit đua với stop)
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        self._write_block(item)
+                self._flush()
+                return
+            if item is not None:
+                self._write_block(item)
+            now = time.monotonic()
+            if now - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = now
+
+    def _flush(self):
+        # Lỗi flush (vd hết chỗ đĩa) chỉ đếm, không làm chết luồng ghi
+        try:
+            self.sink.flush()
+        except Exception:
+            self.write_errors += 1
+
+    def _write_block(self, block):
+        if block.__class__ is _EventItem:
+            try:
+                self.sink.write_event(block.event)
+            except Exception:
+                self.write_errors += 1
+            return
+        write_time = self.write_time
+        t0 = time.perf_counter() if write_time is not None else 0.0
+        try:
+            self.sink.write_block(block)
+            self.written_frames += len(block)
+        except Exception:
+            self.write_errors += 1
+        if write_time is not None:
+            write_time.observe(time.perf_counter() - t0)
+
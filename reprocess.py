@@ -0,0 +1,314 @@
+# ==============================================================================
+# XỬ LÝ LẠI SONG SONG NHIỀU TIẾN TRÌNH (CAPTURE .bmcap / PHIÊN ĐO .bms)
+# ==============================================================================
+# Bộ nhớ có giới hạn, không nạp cả file:
+# .bmcap -> đọc dần từng chunk, cắt luồng byte thành các đoạn ~TASK_BYTES tại vị trí SOF.
+#           Mỗi tiến trình con tách frame + giải mã DATA bằng đúng FrameParser / DataLayout /
+#           decode_block của host (và định dạng luôn chuỗi CSV nếu ghi ra .csv).
+#           Frame nằm vắt qua ranh giới: tiến trình của đoạn trước đọc lấn sang đoạn sau
+#           tối đa 1 frame và chỉ nhận frame có SOF nằm trong đoạn của mình.
+#           Bố cục kênh đầu mỗi đoạn: tiến trình chính dò STATUS cuối cùng (đúng CRC) của các
+#           đoạn trước (chỉ tìm chuỗi byte, rất nhanh) rồi gửi kèm.
+# .bms    -> cắt theo số record, tiến trình con tự mở file (memmap) và giải mã đoạn của mình.
+# Chỉ giữ tối đa INFLIGHT_PER_WORKER đoạn / tiến trình đang chờ; kết quả về tới đâu ghi ra
+# .bms hoặc .csv tới đó, đúng thứ tự đoạn (= thứ tự thời gian).
+#
+# Dòng lệnh:
+#   python reprocess.py capture.bmcap -o out.bms -j 8
+#   python reprocess.py session.bms -o out.csv
+import argparse
+import csv
+import io
+import os
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import crc16
+from data_layout import DeviceStatus, DataLayout, LEGACY_LAYOUT, get_layout
+from frame_parser import (FrameParser, SOF, PROTOCOL_VER, HEADER_LEN, CRC_LEN, MAX_PAYLOAD_LEN,
+                          TYPE_STATUS, TYPE_DATA)
+from recorder import csv_header, csv_rows
+from sample_block import SampleBlock, decode_block
+from session_file import SessionReader, SessionWriter, SESSION_EXT
+from wire_capture import iter_capture
+
+MAX_FRAME_LEN = HEADER_LEN + max(MAX_PAYLOAD_LEN.values()) + CRC_LEN
+TASK_BYTES = 4 << 20                # cỡ 1 đoạn capture gửi cho tiến trình con
+SESSION_RECORDS_PER_TASK = 100000   # cỡ 1 đoạn .bms
+INFLIGHT_PER_WORKER = 2             # số đoạn tối đa đang chờ / tiến trình
+
+_STATUS_PREFIX = SOF + bytes([PROTOCOL_VER, TYPE_STATUS])
+_LEN_STRUCT = struct.Struct('<H')
+
+
+# ==============================================================================
+# 1. CHIA ĐOẠN
+# ==============================================================================
+def last_status(data, limit):
+    """Payload STATUS hợp lệ (đúng CRC) cuối cùng có SOF nằm trước limit, None nếu không có."""
+    hi = limit + len(_STATUS_PREFIX) - 1
+    while True:
+        pos = data.rfind(_STATUS_PREFIX, 0, hi)
+        if pos == -1:
+            return None
+        hi = pos + len(_STATUS_PREFIX) - 1
+        if pos + HEADER_LEN > len(data):
+            continue
+        length = _LEN_STRUCT.unpack_from(data, pos + 4)[0]
+        end = pos + HEADER_LEN + length
+        if length > MAX_PAYLOAD_LEN[TYPE_STATUS] or end + CRC_LEN > len(data):
+            continue
+        if crc16.calculate_crc16(data[pos + 2:end]) == _LEN_STRUCT.unpack_from(data, end)[0]:
+            return bytes(data[pos + HEADER_LEN:end])
+
+
+def capture_tasks(path, fmt="bin", task_bytes=None):
+    """Đọc dần .bmcap, sinh từng đoạn cho parse_segment (chỉ giữ ~1 đoạn trong bộ nhớ).
+
+    Mỗi đoạn: (data, limit, base, chunk_ends, chunk_times, layout_key, fmt) với
+    data = stream[base : base + limit + MAX_FRAME_LEN].
+    """
+    task_bytes = task_bytes or TASK_BYTES
+    buf = bytearray()
+    base = 0
+    total = 0
+    ends = []           # vị trí kết thúc (toàn cục) + thời điểm nhận của các chunk còn trong buf
+    times = []
+    layout_key = LEGACY_LAYOUT.key()
+
+    def make(limit):
+        return (bytes(buf[:limit + MAX_FRAME_LEN]), limit, base, np.array(ends, dtype=np.int64),
+                np.array(times, dtype=np.float64), layout_key, fmt)
+
+    for pc_time, data in iter_capture(path):
+        if not data:
+            continue
+        buf += data
+        total += len(data)
+        ends.append(total)
+        times.append(pc_time)
+        while len(buf) >= task_bytes + 2 * MAX_FRAME_LEN:
+            limit = buf.find(SOF, task_bytes, len(buf) - MAX_FRAME_LEN)
+            if limit == -1:
+                limit = len(buf) - MAX_FRAME_LEN  # không có SOF: cắt ở đâu cũng được
+            yield make(limit)
+            status = last_status(buf, limit)
+            if status is not None:
+                layout_key = DataLayout.from_status(DeviceStatus.from_payload(status)).key()
+            del buf[:limit]
+            base += limit
+            # Chunk kết thúc trước base không còn frame nào cần tới
+            keep = next((i for i, e in enumerate(ends) if e > base), len(ends))
+            del ends[:keep], times[:keep]
+    if buf:
+        yield make(len(buf))
+
+
+def session_tasks(path, fmt="bin", records=None):
+    records = records or SESSION_RECORDS_PER_TASK
+    with SessionReader(path) as reader:
+        n = len(reader)
+    for i0 in range(0, n, records):
+        yield (path, i0, min(i0 + records, n), fmt)
+
+
+# ==============================================================================
+# 2. VIỆC CỦA TIẾN TRÌNH CON
+# ==============================================================================
+def _pc_times(offsets, chunk_ends, chunk_times):
+    # Frame nhận lúc chunk chứa byte cuối của nó tới
+    idx = np.searchsorted(chunk_ends, offsets, side='right')
+    return chunk_times[np.minimum(idx, len(chunk_times) - 1)]
+
+
+def _block_result(layout, timestamps, raw, pc_time, fmt):
+    """('block', key, timestamps, raw, pc_time) cho .bms, ('csv', key, n, text) cho .csv."""
+    if fmt != "csv":
+        return ('block', layout.key(), timestamps, raw, pc_time)
+    block = SampleBlock.from_raw(layout, timestamps, raw, pc_time)
+    out = io.StringIO()
+    csv.writer(out).writerows(csv_rows(block))
+    return ('csv', layout.key(), len(block), out.getvalue())
+
+
+def parse_segment(data, limit, base, chunk_ends, chunk_times, layout_key=None, fmt="bin"):
+    """Tách + giải mã 1 đoạn. data = stream[base : base + limit + MAX_FRAME_LEN].
+
+    layout_key: bố cục đang dùng ở đầu đoạn (None = bố cục cũ 1 kênh).
+    Trả về (results, stats); results theo thứ tự, mỗi phần tử là 1 kết quả _block_result.
+    """
+    parser = FrameParser()
+    results = []
+    layout = get_layout(layout_key) if layout_key is not None else LEGACY_LAYOUT
+    run = bytearray()
+    run_offsets = []
+    mismatches = 0
+    accepted = 0
+
+    def close_run():
+        if not run_offsets:
+            return
+        pc_time = _pc_times(np.array(run_offsets, dtype=np.int64) + base, chunk_ends, chunk_times)
+        block = decode_block(layout, run)
+        results.append(_block_result(layout, block.timestamps, block.raw, pc_time, fmt))
+        del run[:]
+        run_offsets.clear()
+
+    for msg_type, payload in parser.feed(data):
+        offset = parser.frame_offset
+        if offset >= limit:
+            break  # frame này thuộc đoạn sau
+        accepted += 1
+        if msg_type == TYPE_STATUS:
+            close_run()
+            layout = DataLayout.from_status(DeviceStatus.from_payload(payload))
+        elif msg_type == TYPE_DATA:
+            if len(payload) != layout.payload_len:
+                mismatches += 1
+                continue
+            run += payload
+            run_offsets.append(offset + len(payload) + HEADER_LEN + CRC_LEN - 1)
+    close_run()
+    stats = parser.stats()
+    stats["frames_ok"] = accepted  # parser đã đếm cả frame lấn sang đoạn sau
+    stats["layout_mismatches"] = mismatches
+    return results, stats
+
+
+def parse_session_range(path, i0, i1, fmt="bin"):
+    """Đọc record [i0, i1) của .bms (memmap trong tiến trình con) -> (results, stats)."""
+    with SessionReader(path) as reader:
+        rec = reader.records[i0:i1]
+        timestamps = np.array(rec['ts'])
+        raw = np.array(rec['raw'])
+        pc_time = np.array(rec['pc_time'])
+        del rec
+        layout = reader.layout
+    return [_block_result(layout, timestamps, raw, pc_time, fmt)], {}
+
+
+def _parse_task(args):
+    return parse_segment(*args)
+
+
+def _session_task(args):
+    return parse_session_range(*args)
+
+
+# ==============================================================================
+# 3. GHI KẾT QUẢ (THEO THỨ TỰ, VỀ TỚI ĐÂU GHI TỚI ĐÓ)
+# ==============================================================================
+def _part_name(out_path, part):
+    if part == 1:
+        return out_path
+    root, ext = os.path.splitext(out_path)
+    return f"{root}_part{part}{ext}"
+
+
+class OutputWriter:
+    """Ghi .bms hoặc .csv; mỗi lần đổi bố cục kênh sang file _partN mới."""
+
+    def __init__(self, out_path):
+        self.out_path = out_path
+        self.files = []
+        self.frames = 0
+        self._key = None
+        self._file = None       # SessionWriter (.bms) hoặc file text (.csv)
+
+    def _switch(self, key, start_time=None):
+        if key == self._key:
+            return
+        self.close()
+        name = _part_name(self.out_path, len(self.files) + 1)
+        layout = get_layout(key)
+        if self.out_path.endswith('.csv'):
+            self._file = open(name, 'w', newline='')
+            csv.writer(self._file).writerow(csv_header(layout))
+        else:
+            self._file = SessionWriter(name, layout, start_time=start_time)
+        self.files.append(name)
+        self._key = key
+
+    def write(self, result):
+        kind, key = result[0], result[1]
+        if kind == 'csv':
+            _, _, n, text = result
+            self._switch(key)
+            self._file.write(text)
+        else:
+            _, _, timestamps, raw, pc_time = result
+            n = len(timestamps)
+            if not n:
+                return
+            self._switch(key, start_time=float(np.ravel(pc_time)[0]))
+            # SessionWriter chỉ cần ts / raw / pc_time -> không tính volts
+            self._file.write_block(SampleBlock(get_layout(key), timestamps, raw, None, None, pc_time))
+        self.frames += n
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._key = None
+
+
+def run_tasks(tasks, task_fn, writer, workers=None):
+    """Chạy các đoạn (tối đa workers * INFLIGHT_PER_WORKER đang chờ), ghi kết quả đúng thứ tự."""
+    workers = workers or os.cpu_count() or 1
+    total = {}
+
+    def consume(result):
+        results, stats = result
+        for key, value in stats.items():
+            total[key] = total.get(key, 0) + value
+        for r in results:
+            writer.write(r)
+
+    if workers == 1:
+        for task in tasks:
+            consume(task_fn(task))
+        return total
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(task_fn, task))
+            if len(pending) >= workers * INFLIGHT_PER_WORKER:
+                consume(pending.popleft().result())
+        while pending:
+            consume(pending.popleft().result())
+    return total
+
+
+def reprocess(src, out_path, workers=None):
+    """.bmcap/.bms -> .bms/.csv. Trả về (danh sách file, stats)."""
+    t0 = time.perf_counter()
+    fmt = "csv" if out_path.endswith('.csv') else "bin"
+    if src.endswith(SESSION_EXT):
+        tasks, task_fn = session_tasks(src, fmt), _session_task
+    else:
+        tasks, task_fn = capture_tasks(src, fmt), _parse_task
+    writer = OutputWriter(out_path)
+    try:
+        stats = run_tasks(tasks, task_fn, writer, workers)
+    finally:
+        writer.close()
+    stats["frames"] = writer.frames
+    stats["seconds"] = time.perf_counter() - t0
+    return writer.files, stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Xu ly lai song song file .bmcap / .bms")
+    ap.add_argument("src")
+    ap.add_argument("-o", "--out", required=True, help="file ket qua .bms hoac .csv")
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="so tien trinh (mac dinh = so CPU)")
+    args = ap.parse_args()
+    files, stats = reprocess(args.src, args.out, args.jobs)
+    print(f">> Da tao: {', '.join(files)}")
+    print(f">> {stats}")
+    sys.exit(0)
@@ -0,0 +1,91 @@
+# ==============================================================================
+# GIẢI MÃ DATA THEO LÔ BẰNG NUMPY -> KHỐI MẪU DẠNG CỘT (frames x channels)
+# ==============================================================================
+# Gom N frame DATA liên tiếp cùng bố cục thành 1 vùng byte (mỗi frame = 1 payload dài
+# layout.payload_len), rồi giải mã cả khối một lần bằng np.frombuffer + structured dtype.
+# Quy đổi điện áp và ngưỡng "DA AN" cũng tính trên mảng.
+import numpy as np
+
+from data_layout import ADC_LSB_VOLT
+
+PRESS_THRESHOLD_V = 0.60
+
+_SAMPLE_DTYPES = {1: np.uint8, 2: '<u2', 3: (np.uint8, 3), 4: '<u4'}
+
+_DTYPE_CACHE = {}
+
+
+def layout_dtype(layout):
+    """Structured dtype của 1 payload DATA theo bố cục (cache theo layout.key())."""
+    key = layout.key()
+    dtype = _DTYPE_CACHE.get(key)
+    if dtype is None:
+        fields = [('ts', '<u4')]
+        fields += [(f'ch{ch}', _SAMPLE_DTYPES[n]) for ch, n in zip(layout.channels, layout.sample_bytes)]
+        dtype = _DTYPE_CACHE[key] = np.dtype(fields)
+    return dtype
+
+
+class SampleBlock:
+    """Khối mẫu đã giải mã: timestamps (N,), raw (N, C), volts (N, C), pressed (N, C)."""
+
+    __slots__ = ("layout", "timestamps", "raw", "volts", "pressed", "pc_time")
+
+    def __init__(self, layout, timestamps, raw, volts, pressed, pc_time):
+        self.layout = layout
+        self.timestamps = timestamps
+        self.raw = raw
+        self.volts = volts
+        self.pressed = pressed
+        self.pc_time = pc_time  # giờ host: mảng theo từng frame (ts MCU quy đổi, đã bù trôi) hoặc 1 số cho cả khối
+
+    @classmethod
+    def from_raw(cls, layout, timestamps, raw, pc_time, threshold=PRESS_THRESHOLD_V):
+        """Dựng khối từ timestamps + raw đã có (đọc lại file, ghép kết quả từ tiến trình khác)."""
+        raw = np.asarray(raw, dtype=np.uint32)
+        volts = raw * ADC_LSB_VOLT
+        return cls(layout, np.asarray(timestamps, dtype=np.uint32), raw, volts, volts < threshold, pc_time)
+
+    @property
+    def channels(self):
+        return self.layout.channels
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __repr__(self):
+        return f"SampleBlock(frames={len(self)}, channels={self.layout.channels})"
+
+
+def pc_times(block):
+    """pc_time từng frame (host gán mảng; khối dựng tay có thể chỉ có 1 số)."""
+    pc_time = block.pc_time
+    if isinstance(pc_time, np.ndarray) and pc_time.ndim == 1:
+        return pc_time
+    return np.full(len(block), float(pc_time))
+
+
+def decode_block(layout, buffer, pc_time=0.0, threshold=PRESS_THRESHOLD_V):
+    """Giải mã vùng byte gồm các payload DATA nối liền -> SampleBlock.
+
+    Các mảng trả về đều là bản sao, không giữ tham chiếu tới buffer
+    (nên bytearray gom lô có thể xoá/tái sử dụng ngay sau khi gọi).
+    """
+    n_frames = len(buffer) // layout.payload_len
+    rec = np.frombuffer(buffer, dtype=layout_dtype(layout), count=n_frames)
+    raw = np.empty((n_frames, layout.n_channels), dtype=np.uint32)
+    for col, (ch, bits, nbytes) in enumerate(zip(layout.channels, layout.bits, layout.sample_bytes)):
+        field = rec[f'ch{ch}']
+        if nbytes == 3:
+            field = field.astype(np.uint32)
+            values = field[:, 0] | (field[:, 1] << 8) | (field[:, 2] << 16)
+        else:
+            values = field
+        if bits < nbytes * 8:
+            values = values & ((1 << bits) - 1)
+        raw[:, col] = values
+    timestamps = rec['ts'].copy()
+    del rec
+    volts = raw * ADC_LSB_VOLT
+    pressed = volts < threshold
+    return SampleBlock(layout, timestamps, raw, volts, pressed, pc_time)
@@ -0,0 +1,185 @@
+# ==============================================================================
+# BỘ ĐỆM VÒNG CÁC MẪU GẦN NHẤT (NUMPY, CẤP PHÁT SẴN, KHÔNG KHOÁ)
+# ==============================================================================
+# Luồng đọc ghi từng SampleBlock vào vòng (host.add_block_consumer(ring.write_block)).
+# Người dùng (vẽ đồ thị, phân tích...) ở luồng khác tự lấy dữ liệu, không bao giờ chặn
+# luồng đọc:
+#   - ring.latest(n)       -> Window n mẫu mới nhất
+#   - RingReader.read()    -> Window mọi mẫu kể từ lần đọc trước (con trỏ riêng mỗi reader)
+# Window là view không copy khi vùng dữ liệu liền mạch, chỉ copy khi vắt qua cuối vòng.
+#
+# Đồng bộ kiểu seqlock trên 2 bộ đếm tuyệt đối (số mẫu đã ghi từ đầu):
+#   reserve: writer tăng TRƯỚC khi chép (báo vùng cũ sắp bị đè)
+#   head   : writer tăng SAU khi chép xong (dữ liệu < head đã đọc được)
+# Mẫu [start, end) còn hợp lệ khi reserve - capacity <= start. Reader kiểm tra điều này
+# sau khi dùng xong view (Window.valid()) -> phát hiện bị ghi đè (overrun) thay vì khoá.
+import numpy as np
+
+DEFAULT_CAPACITY = 1 << 16   # mẫu / kênh
+
+
+class Window:
+    __slots__ = ("ring", "generation", "start", "end", "timestamps", "raw", "volts", "pc_time", "copied")
+
+    def __init__(self, ring, start, end):
+        self.ring = ring
+        self.generation = ring.generation
+        self.start = start
+        self.end = end
+        self.timestamps = ring._slice(ring.timestamps, start, end)
+        self.raw = ring._slice(ring.raw, start, end)
+        self.volts = ring._slice(ring.volts, start, end)
+        self.pc_time = ring._slice(ring.pc_time, start, end)
+        self.copied = ring._wraps(start, end)
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def layout(self):
+        return self.ring.layout
+
+    def valid(self):
+        """False nếu writer đã (hoặc đang) ghi đè vùng này -> dữ liệu trong view không tin được."""
+        return self.ring.is_valid(self.start, self.generation)
+
+    def copy(self):
+        """Chép ra mảng riêng (ném RingOverrun nếu trong lúc chép đã bị ghi đè)."""
+        out = (self.timestamps.copy(), self.raw.copy(), self.volts.copy(), self.pc_time.copy())
+        if not self.valid():
+            raise RingOverrun(f"Vung [{self.start}, {self.end}) da bi ghi de")
+        return out
+
+
+class RingOverrun(Exception):
+    pass
+
+
+class SampleRing:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.layout = None
+        self.generation = 0     # tăng mỗi khi bố cục kênh đổi (mảng được cấp phát lại)
+        self.head = 0
+        self.reserve = 0
+        self.timestamps = np.zeros(capacity, dtype=np.uint32)
+        self.pc_time = np.zeros(capacity, dtype=np.float64)
+        self.raw = np.zeros((capacity, 0), dtype=np.uint32)
+        self.volts = np.zeros((capacity, 0), dtype=np.float64)
+
+    def attach(self, host):
+        host.add_block_consumer(self.write_block)
+        return self
+
+    def detach(self, host):
+        host.remove_block_consumer(self.write_block)
+
+    # --- WRITER (chỉ 1 luồng) ---
+    def _reset(self, layout):
+        n_channels = layout.n_channels
+        raw = np.zeros((self.capacity, n_channels), dtype=np.uint32)
+        volts = np.zeros((self.capacity, n_channels), dtype=np.float64)
+        # Thứ tự có chủ ý: mọi view cũ mất hiệu lực trước, generation mới chỉ lộ ra khi
+        # mảng mới và head = 0 đã sẵn sàng
+        self.reserve = self.head + 2 * self.capacity
+        self.raw, self.volts = raw, volts
+        self.layout = layout
+        self.head = 0
+        self.generation += 1
+        self.reserve = 0
+
+    def write_block(self, block):
+        if self.layout is None or block.layout.key() != self.layout.key():
+            self._reset(block.layout)
+        n = len(block)
+        if not n:
+            return
+        cap = self.capacity
+        skip = max(0, n - cap)  # khối dài hơn cả vòng: chỉ giữ phần cuối
+        head = self.head
+        start = head + skip
+        self.reserve = head + n
+        pos = start % cap
+        first = min(n - skip, cap - pos)
+        pc_time = np.broadcast_to(block.pc_time, (n,))
+        for dst, src in ((self.timestamps, block.timestamps), (self.raw, block.raw),
+                         (self.volts, block.volts), (self.pc_time, pc_time)):
+            dst[pos:pos + first] = src[skip:skip + first]
+            if first < n - skip:
+                dst[:n - skip - first] = src[skip + first:]
+        self.head = head + n
+
+    # --- READER (nhiều luồng, không khoá) ---
+    def is_valid(self, start, generation):
+        return generation == self.generation and self.reserve - self.capacity <= start
+
+    def _wraps(self, start, end):
+        return end > start and start // self.capacity != (end - 1) // self.capacity
+
+    def _slice(self, array, start, end):
+        cap = self.capacity
+        pos = start % cap
+        if not self._wraps(start, end):
+            return array[pos:pos + end - start]
+        return np.concatenate((array[pos:], array[:end % cap or cap]))
+
+    @property
+    def oldest(self):
+        """Chỉ số tuyệt đối của mẫu cũ nhất còn an toàn để đọc."""
+        return max(0, self.reserve - self.capacity)
+
+    def latest(self, n):
+        """n mẫu mới nhất (ít hơn nếu chưa đủ)."""
+        end = self.head
+        start = max(end - n, self.oldest)
+        return Window(self, start, max(start, end))
+
+    def __len__(self):
+        return self.head - self.oldest
+
+
+class RingReader:
+    """Con trỏ đọc riêng của 1 consumer. read() trả mọi mẫu mới kể từ lần trước."""
+
+    def __init__(self, ring, from_oldest=False):
+        self.ring = ring
+        self.generation = ring.generation
+        self.cursor = ring.oldest if from_oldest else ring.head
+        self.lost = 0           # tổng số mẫu bị ghi đè trước khi kịp đọc
+        self.overruns = 0       # số lần phát hiện overrun
+        self.resets = 0         # số lần bố cục kênh đổi
+
+    def read(self, max_n=None):
+        """-> Window (có thể rỗng). Mẫu bị đè trước khi đọc được cộng vào self.lost."""
+        ring = self.ring
+        if self.generation != ring.generation:
+            self.generation = ring.generation
+            self.cursor = 0
+            self.resets += 1
+        end = ring.head
+        oldest = ring.oldest
+        if self.cursor < oldest:
+            self.lost += oldest - self.cursor
+            self.overruns += 1
+            self.cursor = oldest
+        if max_n is not None:
+            end = min(end, self.cursor + max_n)
+        window = Window(ring, self.cursor, end)
+        self.cursor = end
+        return window
+
+    def check(self, window):
+        """Gọi sau khi dùng xong window: False (và cộng lost) nếu nó đã bị ghi đè trong lúc dùng."""
+        if window.valid():
+            return True
+        self.lost += len(window)
+        self.overruns += 1
+        return False
+
+    @property
+    def pending(self):
+        return max(0, self.ring.head - max(self.cursor, self.ring.oldest))
+
+    def stats(self):
+        return {"cursor": self.cursor, "pending": self.pending, "lost": self.lost,
+                "overruns": self.overruns, "resets": self.resets}
@@ -0,0 +1,339 @@
+# ==============================================================================
+# KIỂM TRA THỜI GIAN MẪU TỪ TIMESTAMP MCU: MẤT MẪU, TRÙNG, TRÀN 32-BIT, JITTER
+# + ÁNH XẠ TS MCU -> ĐỒNG HỒ HOST CÓ BÙ TRÔI (DRIFT)
+# ==============================================================================
+# - Chu kỳ kỳ vọng lấy từ SampRateMap của STATUS (mục 5): mỗi frame DATA mang 1 mẫu của mọi
+#   kênh bật, nên chu kỳ frame = 1000 / (tần số lớn nhất trong các kênh bật) ms. Firmware cũ
+#   để SampRateMap = 0 -> tự học chu kỳ = trung vị của LEARN_INTERVALS khoảng đầu tiên.
+# - Mỗi SampleBlock được kiểm tra bằng NumPy (không lặp từng frame):
+#     d = ts[i] - ts[i-1] (mod 2^32, có dấu)  -> tự xử lý tràn ts u32
+#     d > chu kỳ * (1 + GAP_TOLERANCE)  -> GAP, thiếu round(d / chu kỳ) - 1 mẫu
+#     d == 0                            -> DUPLICATE
+#     -CLOCK_RESET_BACKSTEP_MS < d < 0  -> REORDER
+#     d <= -CLOCK_RESET_BACKSTEP_MS     -> RESET (MCU khởi động lại: đồng hồ căn lại từ đầu)
+# - Chu kỳ < 1 ms (> 1 kHz): nhiều frame liên tiếp cùng ts nên không xét từng khoảng được;
+#   chỉ so thời gian ts đã trôi với số frame nhận được (tích lũy qua các khối) -> GAP /
+#   DUPLICATE khi lệch quá 1.5 ms, không tính jitter.
+# - Jitter: RMS của (d - chu kỳ) trên các khoảng bình thường, làm trơn hàm mũ theo số frame.
+# - ClockAligner: đường bao dưới của (t_nhận - ts) theo cửa sổ CLOCK_WINDOW_S giây, rồi
+#   khớp đường thẳng qua các điểm cực tiểu -> offset + độ trôi (skew) của clock MCU.
+import math
+from collections import deque
+
+import numpy as np
+
+TS_MODULO = 1 << 32
+GAP_TOLERANCE = 0.5             # khoảng > 1.5 chu kỳ => mất mẫu
+LEARN_INTERVALS = 16
+JITTER_ALPHA = 1.0 / 16         # trọng số mỗi frame trong ước lượng jitter
+PY_CHECK_MAX = 32               # khối <= số frame này kiểm tra bằng vòng Python
+TS_RESOLUTION_MS = 1            # ts DATA có độ phân giải 1 ms
+
+# Độ nới offset (s/s) trước khi đủ điểm để ước lượng trôi: MCU chậm hơn host tới 200 ppm
+CLOCK_RELAX = 200e-6
+# ts MCU lùi hơn mức này => coi như MCU khởi động lại, ước lượng offset lại từ đầu
+CLOCK_RESET_BACKSTEP_MS = 1000
+CLOCK_WINDOW_S = 1.0            # mỗi cửa sổ giữ 1 điểm cực tiểu của (t_nhận - ts)
+CLOCK_FIT_WINDOWS = 64          # số cửa sổ gần nhất dùng để khớp độ trôi
+
+# Tên sự kiện do host phát hiện, hiển thị cạnh tên ERROR của thiết bị (DeviceError.name)
+LOSS_NAMES = {"gap": "SAMPLE_GAP", "duplicate": "SAMPLE_DUPLICATE", "reorder": "SAMPLE_REORDER",
+              "reset": "MCU_RESET"}
+
+
+class ClockAligner:
+    """Ánh xạ ts MCU (ms, đã gỡ tràn) -> giây epoch của host, có bù trôi clock."""
+
+    def __init__(self, relax=CLOCK_RELAX, window=CLOCK_WINDOW_S, n_windows=CLOCK_FIT_WINDOWS):
+        self.relax = relax
+        self.window = window
+        self._minima = deque(maxlen=n_windows)
+        self.reset()
+        self.resets = 0
+
+    def reset(self):
+        self.intercept = None       # t_host = ts_s * (1 + skew) + intercept
+        self.skew = 0.0
+        self._t_last = 0.0
+        self._ts_last = 0.0
+        self._win_start = None
+        self._win_min = None
+        self._minima.clear()
+
+    @property
+    def offset(self):
+        """t_host - ts hiện tại (giây)."""
+        if self.intercept is None:
+            return None
+        return self.intercept + self.skew * self._ts_last
+
+    def update(self, ts_ms, t_arrival):
+        """ts_ms: ts của frame mới nhất trong lần đọc, t_arrival: time.time() lúc đọc."""
+        ts_s = ts_ms * 1e-3
+        sample = t_arrival - ts_s
+        if self.intercept is None:
+            self.intercept = sample
+        elif len(self._minima) < 2:
+            # Trễ truyền chỉ làm t_arrival muộn hơn => lấy đường bao dưới, nới dần theo relax
+            self.intercept = min(self.intercept + self.relax * (t_arrival - self._t_last), sample)
+        else:
+            # Không bao giờ để ts ánh xạ muộn hơn lúc thực sự nhận được
+            self.intercept = min(self.intercept, sample - self.skew * ts_s)
+        self._t_last = t_arrival
+        self._ts_last = ts_s
+
+        if self._win_start is None or t_arrival - self._win_start >= self.window:
+            if self._win_min is not None:
+                self._minima.append(self._win_min)
+                if len(self._minima) >= 2:
+                    self._fit()
+            self._win_start = t_arrival
+            self._win_min = (ts_s, sample)
+        elif sample < self._win_min[1]:
+            self._win_min = (ts_s, sample)
+
+    def _fit(self):
+        x, y = np.array(self._minima).T
+        x0 = x[0]
+        skew = float(np.polyfit(x - x0, y, 1)[0])
+        self.skew = skew
+        self.intercept = float(np.min(y - skew * x))
+        if self._win_min is not None:
+            self.intercept = min(self.intercept, self._win_min[1] - skew * self._win_min[0])
+
+    def to_host(self, timestamps):
+        out = np.multiply(timestamps, 1e-3 * (1.0 + self.skew), dtype=np.float64)
+        out += self.intercept
+        return out
+
+
+class SampleLoss:
+    """Sự kiện bất thường thời gian mẫu do host phát hiện (đi chung luồng với DeviceError)."""
+    __slots__ = ("kind", "ts_ms", "count", "delta_ms")
+
+    def __init__(self, kind, ts_ms, count, delta_ms):
+        self.kind = kind            # "gap" | "duplicate" | "reorder" | "reset"
+        self.ts_ms = ts_ms          # ts MCU của frame NGAY SAU chỗ bất thường
+        self.count = count          # gap: số mẫu thiếu; còn lại: 1
+        self.delta_ms = delta_ms    # ts - ts trước đó
+
+    @property
+    def name(self):
+        return LOSS_NAMES.get(self.kind, self.kind)
+
+    def __repr__(self):
+        return f"SampleLoss({self.name}, ts={self.ts_ms}ms, count={self.count}, delta={self.delta_ms}ms)"
+
+
+def expected_period_ms(status, layout):
+    """Chu kỳ frame DATA (ms) theo SampRateMap, None nếu thiết bị không báo tần số."""
+    if status is None:
+        return None
+    rate = max((status.samp_rate_map[ch] for ch in layout.channels), default=0)
+    return 1000.0 / rate if rate else None
+
+
+class SampleTiming:
+    def __init__(self):
+        self.clock = ClockAligner()
+        self.nominal_period = None      # từ SampRateMap
+        self.period = None              # chu kỳ đang dùng (nominal hoặc tự học)
+        self._learn = []
+        self._last_ts = None            # ts u32 của frame cuối đã kiểm tra
+        self._epoch = 0                 # số lần tràn * 2^32
+        self._credit = 0.0              # chu kỳ < 1 ms: số frame kỳ vọng - số frame đã nhận
+
+        # Thống kê
+        self.frames = 0
+        self.missing = 0
+        self.gaps = 0
+        self.duplicates = 0
+        self.reorders = 0
+        self.wraps = 0
+        self.resets = 0
+        self.jitter_ms = 0.0
+        self.max_jitter_ms = 0.0
+
+    def set_status(self, status, layout):
+        period = expected_period_ms(status, layout)
+        if period != self.nominal_period:
+            self.nominal_period = period
+            self.period = period
+            self._learn = []
+            self._credit = 0.0
+
+    def _learn_period(self, d):
+        need = LEARN_INTERVALS - len(self._learn)
+        self._learn.extend(d[d >= 0][:need].tolist())
+        if len(self._learn) >= LEARN_INTERVALS:
+            learn = self._learn
+            # Có khoảng 0 => nhiều frame / ms: trung vị vô nghĩa, lấy trung bình
+            self.period = float(np.median(learn)) if min(learn) > 0 else max(sum(learn), 1) / len(learn)
+
+    def _update_jitter(self, n, period, sum_sq, lo, hi):
+        weight = 1.0 - (1.0 - JITTER_ALPHA) ** n
+        self.jitter_ms += weight * (math.sqrt(sum_sq / n) - self.jitter_ms)
+        self.max_jitter_ms = max(self.max_jitter_ms, hi - period, period - lo)
+
+    @staticmethod
+    def _normal_intervals(timestamps, last, period):
+        """(tổng bình phương lệch chu kỳ, d min, d max) nếu mọi khoảng đều bình thường, ngược lại None."""
+        limit = period * (1 + GAP_TOLERANCE)
+        if len(timestamps) <= PY_CHECK_MAX:
+            # Khối nhỏ (đọc thường xuyên, ít frame / lần): vòng Python rẻ hơn chục lệnh NumPy
+            sum_sq, lo, hi = 0.0, limit, 0
+            for t in timestamps.tolist():
+                d = t - last
+                if d <= 0 or d > limit:
+                    return None
+                last = t
+                e = d - period
+                sum_sq += e * e
+                if d < lo:
+                    lo = d
+                if d > hi:
+                    hi = d
+            return sum_sq, lo, hi
+        ts = timestamps.astype(np.int64)
+        d = np.empty(len(ts), dtype=np.int64)
+        d[0] = ts[0] - last
+        np.subtract(ts[1:], ts[:-1], out=d[1:])
+        lo, hi = int(d.min()), int(d.max())
+        if lo <= 0 or hi > limit:
+            return None
+        e = d - period
+        return float(e.dot(e)), lo, hi
+
+    def check(self, timestamps, t_arrival):
+        """Kiểm tra ts (u32) của 1 khối -> (danh sách SampleLoss, pc_time f8 theo từng frame)."""
+        n = len(timestamps)
+        if not n:
+            return [], np.empty(0)
+        last, period = self._last_ts, self.period
+        if last is not None and period is not None and period >= TS_RESOLUTION_MS:
+            normal = self._normal_intervals(timestamps, last, period)
+            if normal is not None:
+                # Đường nhanh (gần như mọi khối): không mất, không trùng, không tràn
+                self.frames += n
+                self._update_jitter(n, period, *normal)
+                self._last_ts = int(timestamps[-1])
+                if self._epoch:
+                    timestamps = timestamps.astype(np.int64) + self._epoch * TS_MODULO
+                self.clock.update(int(timestamps[-1]), t_arrival)
+                return [], self.clock.to_host(timestamps)
+        ts = np.asarray(timestamps, dtype=np.int64)
+        prev = ts[0] if self._last_ts is None else self._last_ts
+        prev_ts = np.empty(n, dtype=np.int64)
+        prev_ts[0] = prev
+        prev_ts[1:] = ts[:-1]
+        d = (ts - prev_ts + (TS_MODULO >> 1)) % TS_MODULO - (TS_MODULO >> 1)
+
+        events = []
+        resets = np.flatnonzero(d <= -CLOCK_RESET_BACKSTEP_MS)
+        if len(resets):
+            # MCU khởi động lại: phần trước và sau điểm reset là 2 dòng thời gian riêng
+            i = int(resets[0])
+            pc_head = self._check(ts[:i], d[:i], prev_ts[:i], events, t_arrival)
+            self.resets += 1
+            self.clock.reset()
+            self.clock.resets += 1
+            self._epoch = 0
+            self._learn = []
+            self._credit = 0.0
+            self.period = self.nominal_period
+            events.append(SampleLoss("reset", int(ts[i]), 1, int(d[i])))
+            self._last_ts = None
+            tail_events, pc_tail = self.check(ts[i:], t_arrival)
+            return events + tail_events, np.concatenate((pc_head, pc_tail))
+        return events, self._check(ts, d, prev_ts, events, t_arrival)
+
+    def _check(self, ts, d, prev_ts, events, t_arrival):
+        n = len(ts)
+        if not n:
+            return np.empty(0)
+        self.frames += n
+        if self._last_ts is None:
+            d = d[1:]       # frame đầu tiên không có khoảng trước đó
+            prev_ts, ts_d = prev_ts[1:], ts[1:]
+        else:
+            ts_d = ts
+
+        # Tràn u32: ts giảm nhưng hiệu (mod 2^32) vẫn dương
+        wrapped = (ts_d < prev_ts) & (d > 0)
+        n_wraps = int(np.count_nonzero(wrapped))
+        epochs = np.full(n, self._epoch, dtype=np.int64)
+        if n_wraps:
+            steps = np.zeros(n, dtype=np.int64)
+            steps[n - len(d):] = wrapped
+            epochs += np.cumsum(steps)
+            self.wraps += n_wraps
+            self._epoch += n_wraps
+        unwrapped = ts + epochs * TS_MODULO
+
+        if len(d):
+            if self.period is None:
+                self._learn_period(d)
+            period = self.period
+            if period is not None and period < TS_RESOLUTION_MS:
+                self._check_coarse(ts, d, period, events)
+            else:
+                dup = np.flatnonzero(d == 0)
+                back = np.flatnonzero(d < 0)
+                self.duplicates += len(dup)
+                self.reorders += len(back)
+                offset = n - len(d)
+                for kind, idx in (("duplicate", dup), ("reorder", back)):
+                    events += [SampleLoss(kind, int(ts[i + offset]), 1, int(d[i])) for i in idx.tolist()]
+
+                if period is not None:
+                    gap_idx = np.flatnonzero(d > period * (1 + GAP_TOLERANCE))
+                    if len(gap_idx):
+                        missing = np.maximum(np.rint(d[gap_idx] / period).astype(np.int64) - 1, 1)
+                        self.gaps += len(gap_idx)
+                        self.missing += int(missing.sum())
+                        events += [SampleLoss("gap", int(ts[i + offset]), int(m), int(d[i]))
+                                   for i, m in zip(gap_idx.tolist(), missing.tolist())]
+                    normal = d[(d > 0) & (d <= period * (1 + GAP_TOLERANCE))]
+                    if len(normal):
+                        e = normal - period
+                        self._update_jitter(len(e), period, float(e.dot(e)), int(normal.min()), int(normal.max()))
+
+        self._last_ts = int(ts[-1])
+        self.clock.update(int(unwrapped[-1]), t_arrival)
+        return self.clock.to_host(unwrapped)
+
+    def _check_coarse(self, ts, d, period, events):
+        """Chu kỳ < 1 ms: so tổng thời gian trôi của khối với số khoảng nhận được."""
+        span = int(d.sum())
+        self._credit += span / period - len(d)
+        slack = 1.0 / period                # lượng tử 1 ms của ts, tính bằng số frame
+        limit = slack * (1 + GAP_TOLERANCE)
+        if self._credit > limit:
+            missing = int(self._credit - slack)
+            self._credit -= missing
+            self.gaps += 1
+            self.missing += missing
+            events.append(SampleLoss("gap", int(ts[-1]), missing, span))
+        elif self._credit < -limit:
+            extra = int(-self._credit - slack)
+            self._credit += extra
+            self.duplicates += extra
+            events.append(SampleLoss("duplicate", int(ts[-1]), extra, span))
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "period_ms": self.period,
+            "missing": self.missing,
+            "gaps": self.gaps,
+            "duplicates": self.duplicates,
+            "reorders": self.reorders,
+            "wraps": self.wraps,
+            "resets": self.resets,
+            "jitter_ms": self.jitter_ms,
+            "max_jitter_ms": self.max_jitter_ms,
+            "loss_ratio": self.missing / (self.frames + self.missing) if self.frames else 0.0,
+            "clock_offset": self.clock.offset,
+            "clock_skew_ppm": self.clock.skew * 1e6,
+        }
+
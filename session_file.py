@@ -0,0 +1,283 @@
+# ==============================================================================
+# ĐỊNH DẠNG PHIÊN ĐO NHỊ PHÂN (.bms) + ĐỌC BẰNG numpy.memmap
+# ==============================================================================
+# Bố cục file:
+#   [Header 256 byte]
+#       Magic "BMSESS01" | Version u16 | HeaderSize u16 | RecordSize u32 | StartTime f64
+#       STATUS payload 144 byte (ActiveMap, BitsPerSmpMap, SampRateMap, SensorRoleMap...)
+#       đệm 0 cho đủ 256 byte
+#   [Record cố định độ dài] x N
+#       ts u32 (ms MCU) | pc_time f64 (giây epoch) | raw[C] (u1/u2/u4 theo BitsPerSmp lớn nhất)
+# Đọc: SessionReader mở bằng memmap -> truy cập ngẫu nhiên O(1), cắt theo thời gian
+# không copy (searchsorted trên cột ts hoặc pc_time).
+#
+# Dòng lệnh:
+#   python session_file.py to-bin data_2025-12-25_19-52-03.csv [out.bms]
+#   python session_file.py to-csv session.bms [out.csv]
+#   python session_file.py info session.bms
+import csv
+import os
+import re
+import struct
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from data_layout import DeviceStatus, DataLayout, DEFAULT_BITS, STATUS_PAYLOAD_LEN
+from recorder import WRITE_BUFFER_SIZE, csv_header, csv_rows
+from sample_block import SampleBlock, PRESS_THRESHOLD_V
+
+SESSION_MAGIC = b'BMSESS01'
+SESSION_VERSION = 1
+HEADER_SIZE = 256
+SESSION_EXT = '.bms'
+
+_HEADER_STRUCT = struct.Struct('<8sHHId')
+_STATUS_OFFSET = _HEADER_STRUCT.size
+
+EXPORT_CHUNK_RECORDS = 65536
+
+
+def record_dtype(layout):
+    """dtype của 1 record cố định độ dài theo bố cục kênh."""
+    max_bytes = max(layout.sample_bytes) if layout.sample_bytes else 1
+    sample = {1: np.uint8, 2: '<u2'}.get(max_bytes, '<u4')
+    return np.dtype([('ts', '<u4'), ('pc_time', '<f8'), ('raw', sample, (layout.n_channels,))])
+
+
+def pack_header(layout, status=None, start_time=None):
+    if status is None or status.layout_key() != layout.key():
+        status = DeviceStatus.from_layout(layout)
+    if start_time is None:
+        start_time = time.time()
+    head = _HEADER_STRUCT.pack(SESSION_MAGIC, SESSION_VERSION, HEADER_SIZE,
+                               record_dtype(layout).itemsize, start_time)
+    head += status.to_payload()
+    return head + bytes(HEADER_SIZE - len(head))
+
+
+def unpack_header(head):
+    """-> (status, layout, start_time, header_size, record_size)"""
+    if len(head) < _STATUS_OFFSET + STATUS_PAYLOAD_LEN:
+        raise ValueError("File phien do qua ngan")
+    magic, version, header_size, record_size, start_time = _HEADER_STRUCT.unpack_from(head)
+    if magic != SESSION_MAGIC:
+        raise ValueError(f"Sai magic: {magic!r}")
+    if version > SESSION_VERSION:
+        raise ValueError(f"Phien ban file chua ho tro: {version}")
+    status = DeviceStatus.from_payload(head[_STATUS_OFFSET:_STATUS_OFFSET + STATUS_PAYLOAD_LEN])
+    layout = DataLayout.from_status(status)
+    if record_dtype(layout).itemsize != record_size:
+        raise ValueError("RecordSize khong khop voi STATUS trong header")
+    return status, layout, start_time, header_size, record_size
+
+
+# ==============================================================================
+# 1. GHI (dùng làm sink cho recorder.BlockRecorder)
+# ==============================================================================
+class SessionWriter:
+    def __init__(self, filename, layout, status=None, start_time=None, buffer_size=WRITE_BUFFER_SIZE):
+        self.filename = filename
+        self.layout = layout
+        self.dtype = record_dtype(layout)
+        self.records = 0
+        self._file = open(filename, 'wb', buffering=buffer_size)
+        self._file.write(pack_header(layout, status, start_time))
+
+    def write_block(self, block):
+        if block.layout.key() != self.layout.key():
+            raise ValueError("Khoi mau khac bo cuc cua file phien do")
+        rec = np.empty(len(block), dtype=self.dtype)
+        rec['ts'] = block.timestamps
+        rec['pc_time'] = block.pc_time
+        rec['raw'] = block.raw
+        self._file.write(rec.data)
+        self.records += len(rec)
+
+    def tell(self):
+        """(số record đã ghi, vị trí byte của record kế tiếp) - dùng cho chỉ mục phiên đo."""
+        return self.records, HEADER_SIZE + self.records * self.dtype.itemsize
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# ==============================================================================
+# 2. ĐỌC BẰNG MEMMAP
+# ==============================================================================
+class SessionReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            head = f.read(HEADER_SIZE)
+        (self.status, self.layout, self.start_time,
+         self.header_size, record_size) = unpack_header(head)
+        self.dtype = record_dtype(self.layout)
+        # Bỏ qua record cuối bị ghi dở (nếu chương trình dừng đột ngột)
+        n_records = (os.path.getsize(path) - self.header_size) // record_size
+        if n_records > 0:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r',
+                                     offset=self.header_size, shape=(n_records,))
+        else:
+            self.records = np.empty(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def channels(self):
+        return self.layout.channels
+
+    @property
+    def timestamps(self):
+        return self.records['ts']
+
+    @property
+    def pc_time(self):
+        return self.records['pc_time']
+
+    @property
+    def raw(self):
+        return self.records['raw']
+
+    def index_range(self, t_start, t_end, field='ts'):
+        """Chỉ số [i0, i1) của các record có t_start <= field <= t_end (field tăng dần)."""
+        column = self.records[field]
+        i0 = int(np.searchsorted(column, t_start, side='left'))
+        i1 = int(np.searchsorted(column, t_end, side='right'))
+        return i0, i1
+
+    def time_range(self, t_start, t_end, field='ts'):
+        """Lát cắt memmap (không copy) theo ts (ms MCU) hoặc pc_time (giây epoch)."""
+        i0, i1 = self.index_range(t_start, t_end, field)
+        return self.records[i0:i1]
+
+    def block(self, i0=0, i1=None, threshold=PRESS_THRESHOLD_V):
+        """Đọc record [i0, i1) thành SampleBlock (copy ra RAM, có volts/pressed)."""
+        rec = self.records[i0:i1]
+        return SampleBlock.from_raw(self.layout, np.array(rec['ts']), rec['raw'],
+                                    np.array(rec['pc_time']), threshold)
+
+    def iter_blocks(self, chunk_records=EXPORT_CHUNK_RECORDS):
+        for i0 in range(0, len(self), chunk_records):
+            yield self.block(i0, i0 + chunk_records)
+
+    def close(self):
+        mm = getattr(self.records, '_mmap', None)
+        self.records = np.empty(0, dtype=self.dtype)
+        if mm is not None:
+            try:
+                mm.close()
+            except BufferError:
+                pass  # còn lát cắt đang được dùng; mmap tự đóng khi chúng được giải phóng
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ==============================================================================
+# 3. CHUYỂN ĐỔI CSV <-> NHỊ PHÂN
+# ==============================================================================
+FILENAME_TIME_RE = re.compile(r'(\d{4}-\d{2}-\d{2})_(\d{2})-(\d{2})-(\d{2})')
+
+
+def csv_channels(header):
+    """Header CSV -> (các kênh, vị trí cột ADC tương ứng)."""
+    # Header 1 kênh: "Timestamp,ADC,Volt,Status,Time" (cũ) hoặc "Timestamp_MCU_ms,ADC_Raw,..." (có/không cột Status)
+    if len(header) > 1 and header[1] in ("ADC", "ADC_Raw"):
+        return (0,), [1]
+    channels, columns = [], []
+    for col, name in enumerate(header):
+        m = re.fullmatch(r'ADC_Raw_CH(\d+)', name)
+        if m:
+            channels.append(int(m.group(1)))
+            columns.append(col)
+    if not channels:
+        raise ValueError(f"Khong nhan ra cot ADC trong header: {header}")
+    return tuple(channels), columns
+
+
+def parse_csv_lines(lines, adc_cols, midnight, last_pc):
+    """Dòng CSV (bytes) -> (ts, raw, pc_time, midnight, last_pc); midnight tăng 1 ngày khi qua nửa đêm."""
+    ts, raw, pc_time = [], [], []
+    for row in csv.reader(line.decode() for line in lines):
+        if not row:
+            continue
+        ts.append(int(row[0]))
+        raw += [int(row[c]) for c in adc_cols]
+        h, mi, sec = row[-1].split(':')
+        pc = midnight + int(h) * 3600 + int(mi) * 60 + float(sec)
+        if last_pc is not None and pc < last_pc - 1.0:
+            midnight += 86400.0
+            pc += 86400.0
+        pc_time.append(pc)
+        last_pc = pc
+    return (np.array(ts, dtype=np.uint32), np.array(raw, dtype=np.uint32),
+            np.array(pc_time, dtype=np.float64), midnight, last_pc)
+
+
+def csv_to_session(csv_path, out_path=None, session_date=None):
+    """Đổi CSV do start_recording ghi ra sang file .bms. Trả về đường dẫn file mới.
+
+    CSV chỉ có giờ (HH:MM:SS.mmm) nên ngày lấy từ tên file, không có thì lấy hôm nay.
+    """
+    if out_path is None:
+        out_path = os.path.splitext(csv_path)[0] + SESSION_EXT
+    if session_date is None:
+        m = FILENAME_TIME_RE.search(os.path.basename(csv_path))
+        session_date = datetime.strptime(m.group(1), "%Y-%m-%d").date() if m else datetime.now().date()
+    midnight = datetime.combine(session_date, datetime.min.time()).timestamp()
+
+    with open(csv_path, 'rb') as f:
+        channels, adc_cols = csv_channels(next(csv.reader([f.readline().decode()])))
+        ts, raw, pc_time, _, _ = parse_csv_lines(f.readlines(), adc_cols, midnight, None)
+    raw = raw.reshape(-1, len(channels))
+    max_value = int(raw.max()) if raw.size else 0
+    bits = max(DEFAULT_BITS, max_value.bit_length())
+    layout = DataLayout(channels, (bits,) * len(channels))
+    block = SampleBlock.from_raw(layout, ts, raw, pc_time)
+
+    writer = SessionWriter(out_path, layout, start_time=float(pc_time[0]) if len(pc_time) else None)
+    try:
+        writer.write_block(block)
+    finally:
+        writer.close()
+    return out_path
+
+
+def session_to_csv(session_path, out_path=None):
+    """Xuất file .bms ra CSV cùng định dạng với start_recording."""
+    if out_path is None:
+        out_path = os.path.splitext(session_path)[0] + '.csv'
+    with SessionReader(session_path) as reader, open(out_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(csv_header(reader.layout))
+        for block in reader.iter_blocks():
+            writer.writerows(csv_rows(block))
+    return out_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("to-bin", "to-csv", "info"):
+        print("Cach dung: python session_file.py to-bin|to-csv|info <file> [out]")
+        sys.exit(1)
+    cmd, src = sys.argv[1], sys.argv[2]
+    dst = sys.argv[3] if len(sys.argv) > 3 else None
+    if cmd == "to-bin":
+        print(f">> Da tao: {csv_to_session(src, dst)}")
+    elif cmd == "to-csv":
+        print(f">> Da tao: {session_to_csv(src, dst)}")
+    else:
+        with SessionReader(src) as r:
+            print(f"Kenh: {list(r.channels)} | Bits: {list(r.layout.bits)} | So record: {len(r)}")
+            if len(r):
+                print(f"TS MCU: {int(r.timestamps[0])} -> {int(r.timestamps[-1])} ms")
+                print(f"PC: {datetime.fromtimestamp(r.pc_time[0])} -> {datetime.fromtimestamp(r.pc_time[-1])}")
@@ -0,0 +1,362 @@
+# ==============================================================================
+# CHỈ MỤC THỜI GIAN + CHỈ MỤC SỰ KIỆN CHO PHIÊN ĐO (.csv / .bms) -> SEEK THẲNG, KHÔNG QUÉT FILE
+# ==============================================================================
+# Ghi cạnh file dữ liệu (cùng tên, khác đuôi), cập nhật trong luồng ghi của BlockRecorder:
+#   <tên>.bmidx : chỉ mục thưa, ~mỗi INDEX_EVERY record 1 mục (tại đầu khối)
+#                 record u8 | offset u8 (byte trong file dữ liệu) | ts u4 (ms MCU) | pc_time f8
+#   <tên>.bmevt : chỉ mục sự kiện theo đúng thứ tự trong luồng mẫu
+#                 record u8 | ts u4 | pc_time f8 | kind u1 | channel u1 | code u2 | value f4
+#       PRESS / RELEASE : mẫu vượt ngưỡng "DA AN" (value = điện áp tại mẫu đó)
+#       DEVICE_ERROR    : frame ERROR (code = mã lỗi, value = aux)
+#       SAMPLE_LOSS     : mất mẫu do host phát hiện (code = loại, value = số mẫu)
+#   Header 256 byte: Magic | Version u16 | HeaderSize u16 | RecordSize u32 | Every u32 | STATUS 144 byte
+# Truy vấn (SessionIndex): searchsorted trên chỉ mục thưa -> khoảng record [r0, r1) -> .bms đọc
+# memmap, .csv seek tới offset rồi chỉ parse các dòng trong khoảng đó.
+#
+# Dòng lệnh:
+#   python session_index.py build data.csv            (dựng chỉ mục cho file ghi trước đây)
+#   python session_index.py events data.csv
+#   python session_index.py around data.csv <số thứ tự sự kiện> [giây trước] [giây sau]
+import csv
+import os
+import struct
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from data_layout import DeviceStatus, DataLayout, DeviceError, DEFAULT_BITS, STATUS_PAYLOAD_LEN
+from sample_block import SampleBlock, PRESS_THRESHOLD_V, pc_times
+from sample_timing import SampleLoss
+from session_file import SESSION_EXT, SessionReader, FILENAME_TIME_RE, csv_channels, parse_csv_lines
+
+INDEX_EXT = '.bmidx'
+EVENTS_EXT = '.bmevt'
+INDEX_MAGIC = b'BMIDX001'
+EVENTS_MAGIC = b'BMEVT001'
+INDEX_VERSION = 1
+HEADER_SIZE = 256
+INDEX_EVERY = 1024              # record / mục chỉ mục thưa
+
+_HEADER_STRUCT = struct.Struct('<8sHHII')
+_STATUS_OFFSET = _HEADER_STRUCT.size
+
+INDEX_DTYPE = np.dtype([('record', '<u8'), ('offset', '<u8'), ('ts', '<u4'), ('pc_time', '<f8')])
+EVENT_DTYPE = np.dtype([('record', '<u8'), ('ts', '<u4'), ('pc_time', '<f8'), ('kind', 'u1'),
+                        ('channel', 'u1'), ('code', '<u2'), ('value', '<f4')])
+
+EV_PRESS = 1
+EV_RELEASE = 2
+EV_DEVICE_ERROR = 3
+EV_SAMPLE_LOSS = 4
+EVENT_KIND_NAMES = {EV_PRESS: "DA AN", EV_RELEASE: "THA LONG", EV_DEVICE_ERROR: "DEVICE_ERROR",
+                    EV_SAMPLE_LOSS: "SAMPLE_LOSS"}
+LOSS_CODES = {"gap": 1, "duplicate": 2, "reorder": 3, "reset": 4}
+
+CSV_READ_CHUNK = 1 << 16        # byte / lần đọc khi dựng chỉ mục cho CSV cũ
+
+
+def index_paths(data_filename):
+    root, _ = os.path.splitext(data_filename)
+    return root + INDEX_EXT, root + EVENTS_EXT
+
+
+def _pack_header(magic, dtype, every, layout, status=None):
+    if status is None or status.layout_key() != layout.key():
+        status = DeviceStatus.from_layout(layout)
+    head = _HEADER_STRUCT.pack(magic, INDEX_VERSION, HEADER_SIZE, dtype.itemsize, every)
+    head += status.to_payload()
+    return head + bytes(HEADER_SIZE - len(head))
+
+
+def read_table(path, magic, dtype):
+    """-> (layout, every, mảng record) của 1 file chỉ mục."""
+    with open(path, 'rb') as f:
+        head = f.read(HEADER_SIZE)
+        if len(head) < _STATUS_OFFSET + STATUS_PAYLOAD_LEN:
+            raise ValueError(f"File chi muc qua ngan: {path}")
+        file_magic, version, header_size, record_size, every = _HEADER_STRUCT.unpack_from(head)
+        if file_magic != magic:
+            raise ValueError(f"Sai magic: {file_magic!r}")
+        if version > INDEX_VERSION:
+            raise ValueError(f"Phien ban file chua ho tro: {version}")
+        if record_size != dtype.itemsize:
+            raise ValueError("RecordSize khong khop")
+        status = DeviceStatus.from_payload(head[_STATUS_OFFSET:_STATUS_OFFSET + STATUS_PAYLOAD_LEN])
+        f.seek(header_size)
+        data = f.read()
+    # Bỏ qua record cuối bị ghi dở
+    n = len(data) // record_size
+    return DataLayout.from_status(status), every, np.frombuffer(data, dtype=dtype, count=n)
+
+
+# ==============================================================================
+# 1. GHI CHỈ MỤC (chạy trong luồng ghi, cùng thứ tự với file dữ liệu)
+# ==============================================================================
+class IndexWriter:
+    def __init__(self, data_filename, layout, status=None, every=INDEX_EVERY, pressed=None):
+        self.every = every
+        self.index_path, self.events_path = index_paths(data_filename)
+        self._index = open(self.index_path, 'wb')
+        self._index.write(_pack_header(INDEX_MAGIC, INDEX_DTYPE, every, layout, status))
+        self._events = open(self.events_path, 'wb')
+        self._events.write(_pack_header(EVENTS_MAGIC, EVENT_DTYPE, 0, layout, status))
+        self._next_entry = 0
+        # Trạng thái "DA AN" từng kênh ở mẫu cuối (truyền vào khi nối tiếp file trước, vd segment)
+        self._pressed = pressed
+        self._last = (0, 0.0)           # (ts, pc_time) của mẫu cuối đã ghi
+        self.entries = 0
+        self.events = 0
+
+    def add_block(self, block, record, offset):
+        """Gọi ngay trước khi khối được ghi tại (record, offset) của file dữ liệu."""
+        n = len(block)
+        if not n:
+            return
+        pc_time = pc_times(block)
+        ts = block.timestamps
+        if record >= self._next_entry:
+            entry = np.array([(record, offset, ts[0], pc_time[0])], dtype=INDEX_DTYPE)
+            self._index.write(entry.data)
+            self._next_entry = record + self.every
+            self.entries += 1
+
+        # Vượt ngưỡng (block.pressed): so từng mẫu với mẫu trước (mẫu đầu khối so với cuối khối trước)
+        pressed = block.pressed
+        prev = self._pressed
+        self._pressed = pressed[-1].copy()
+        if prev is None:
+            changed = pressed[1:] != pressed[:-1]
+            base = 1
+        else:
+            changed = np.empty_like(pressed)
+            changed[0] = pressed[0] != prev
+            np.not_equal(pressed[1:], pressed[:-1], out=changed[1:])
+            base = 0
+        rows, cols = np.nonzero(changed)
+        if len(rows):
+            rows = rows + base
+            ev = np.zeros(len(rows), dtype=EVENT_DTYPE)
+            ev['record'] = record + rows
+            ev['ts'] = ts[rows]
+            ev['pc_time'] = pc_time[rows]
+            ev['kind'] = np.where(pressed[rows, cols], EV_PRESS, EV_RELEASE)
+            ev['channel'] = np.asarray(block.layout.channels, dtype=np.uint8)[cols]
+            ev['value'] = block.volts[rows, cols]
+            self._events.write(ev.data)
+            self.events += len(ev)
+        self._last = (int(ts[-1]), float(pc_time[-1]))
+
+    def add_event(self, event, record):
+        """DeviceError / SampleLoss tại vị trí record (= số mẫu đã ghi trước nó)."""
+        ev = np.zeros(1, dtype=EVENT_DTYPE)
+        ev['record'] = record
+        ev['ts'], ev['pc_time'] = self._last
+        if isinstance(event, DeviceError):
+            ev['kind'] = EV_DEVICE_ERROR
+            ev['code'] = event.code
+            ev['value'] = event.aux
+        elif isinstance(event, SampleLoss):
+            ev['kind'] = EV_SAMPLE_LOSS
+            ev['code'] = LOSS_CODES.get(event.kind, 0)
+            ev['value'] = event.count
+            ev['ts'] = event.ts_ms
+        else:
+            return
+        self._events.write(ev.data)
+        self.events += 1
+
+    def flush(self):
+        self._index.flush()
+        self._events.flush()
+
+    def close(self):
+        self._index.close()
+        self._events.close()
+
+
+class IndexedSink:
+    """Bọc 1 sink (CsvSink / SessionWriter, cần tell()) để ghi kèm chỉ mục thời gian + sự kiện."""
+
+    def __init__(self, sink, status=None, every=INDEX_EVERY, pressed=None):
+        self.sink = sink
+        self.index = IndexWriter(sink.filename, sink.layout, status, every, pressed)
+
+    @property
+    def filename(self):
+        return self.sink.filename
+
+    @property
+    def layout(self):
+        return self.sink.layout
+
+    def write_block(self, block):
+        record, offset = self.sink.tell()
+        self.index.add_block(block, record, offset)
+        self.sink.write_block(block)
+
+    def write_event(self, event):
+        self.index.add_event(event, self.sink.tell()[0])
+
+    def flush(self):
+        self.sink.flush()
+        self.index.flush()
+
+    def close(self):
+        self.sink.close()
+        self.index.close()
+
+
+# ==============================================================================
+# 2. TRUY VẤN
+# ==============================================================================
+class SessionIndex:
+    def __init__(self, data_filename):
+        self.data_filename = data_filename
+        self.index_path, self.events_path = index_paths(data_filename)
+        self.layout, self.every, self.entries = read_table(self.index_path, INDEX_MAGIC, INDEX_DTYPE)
+        if os.path.exists(self.events_path):
+            _, _, self.events = read_table(self.events_path, EVENTS_MAGIC, EVENT_DTYPE)
+        else:
+            self.events = np.empty(0, dtype=EVENT_DTYPE)
+        self.is_binary = data_filename.endswith(SESSION_EXT)
+        self._reader = SessionReader(data_filename) if self.is_binary else None
+
+    def record_range(self, t_start, t_end, field='pc_time'):
+        """Khoảng mục chỉ mục bao [t_start, t_end] -> (mục đầu, record kết thúc hoặc None = tới hết file)."""
+        column = self.entries[field]
+        i0 = max(0, int(np.searchsorted(column, t_start, side='right')) - 1)
+        i1 = int(np.searchsorted(column, t_end, side='right'))
+        r_end = int(self.entries['record'][i1]) if i1 < len(self.entries) else None
+        return i0, r_end
+
+    def read(self, t_start, t_end, field='pc_time', threshold=PRESS_THRESHOLD_V):
+        """Các mẫu có t_start <= field <= t_end -> SampleBlock (field: 'pc_time' giây epoch | 'ts' ms MCU)."""
+        if not len(self.entries):
+            return self._empty_block()
+        i0, r_end = self.record_range(t_start, t_end, field)
+        entry = self.entries[i0]
+        r0 = int(entry['record'])
+        if self.is_binary:
+            rec = self._reader.records[r0:r_end]
+            ts, raw, pc_time = np.array(rec['ts']), rec['raw'], np.array(rec['pc_time'])
+        else:
+            n = None if r_end is None else r_end - r0
+            ts, raw, pc_time = self._read_csv(int(entry['offset']), n, float(entry['pc_time']))
+        column = pc_time if field == 'pc_time' else ts
+        keep = (column >= t_start) & (column <= t_end)
+        return SampleBlock.from_raw(self.layout, ts[keep], np.asarray(raw)[keep], pc_time[keep], threshold)
+
+    def _read_csv(self, offset, n_records, base_pc):
+        """Đọc n_records dòng CSV từ byte offset (None = tới hết file)."""
+        # PC_Time trong CSV chỉ có giờ trong ngày: ghép với ngày của mục chỉ mục
+        base = datetime.fromtimestamp(base_pc)
+        midnight = datetime.combine(base.date(), datetime.min.time()).timestamp()
+        with open(self.data_filename, 'rb') as f:
+            # Vị trí cột ADC lấy theo header của chính file (file cũ còn cột Status)
+            channels, adc_cols = csv_channels(next(csv.reader([f.readline().decode()])))
+            f.seek(offset)
+            lines = f.readlines() if n_records is None else [f.readline() for _ in range(n_records)]
+        ts, raw, pc_time, _, _ = parse_csv_lines(lines, adc_cols, midnight, base_pc)
+        return ts, raw.reshape(-1, len(channels)), pc_time
+
+    def _empty_block(self):
+        return SampleBlock.from_raw(self.layout, np.empty(0, dtype=np.uint32),
+                                    np.empty((0, self.layout.n_channels), dtype=np.uint32),
+                                    np.empty(0, dtype=np.float64))
+
+    def find_events(self, kind=None, channel=None, t_start=None, t_end=None):
+        """Lọc chỉ mục sự kiện theo loại / kênh / khoảng pc_time."""
+        ev = self.events
+        mask = np.ones(len(ev), dtype=bool)
+        if kind is not None:
+            mask &= ev['kind'] == kind
+        if channel is not None:
+            mask &= ev['channel'] == channel
+        if t_start is not None:
+            mask &= ev['pc_time'] >= t_start
+        if t_end is not None:
+            mask &= ev['pc_time'] <= t_end
+        return ev[mask]
+
+    def around(self, event, before=15.0, after=15.0):
+        """Các mẫu trong [t - before, t + after] giây quanh 1 sự kiện (hoặc 1 mốc pc_time)."""
+        t = float(event['pc_time']) if isinstance(event, np.void) else float(event)
+        return self.read(t - before, t + after)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ==============================================================================
+# 3. DỰNG CHỈ MỤC CHO FILE ĐÃ GHI (KHÔNG CÓ .bmidx)
+# ==============================================================================
+def build_index(data_filename, every=INDEX_EVERY, threshold=PRESS_THRESHOLD_V):
+    """Quét 1 lần file .csv / .bms và ghi .bmidx + .bmevt (không có ERROR / mất mẫu)."""
+    if data_filename.endswith(SESSION_EXT):
+        with SessionReader(data_filename) as reader:
+            writer = IndexWriter(data_filename, reader.layout, reader.status, every)
+            size = reader.dtype.itemsize
+            record = 0
+            for block in reader.iter_blocks(every):
+                writer.add_block(block, record, reader.header_size + record * size)
+                record += len(block)
+            writer.close()
+        return writer.index_path, writer.events_path
+
+    # CSV chỉ có giờ (HH:MM:SS.mmm): ngày lấy từ tên file như csv_to_session
+    m = FILENAME_TIME_RE.search(os.path.basename(data_filename))
+    day = datetime.strptime(m.group(1), "%Y-%m-%d").date() if m else datetime.now().date()
+    midnight = datetime.combine(day, datetime.min.time()).timestamp()
+    with open(data_filename, 'rb') as f:
+        header_line = f.readline()
+        channels, adc_cols = csv_channels(next(csv.reader([header_line.decode()])))
+        layout = DataLayout(channels, (DEFAULT_BITS,) * len(channels))
+        writer = IndexWriter(data_filename, layout, None, every)
+        offset = len(header_line)
+        record = 0
+        last_pc = None
+        while True:
+            lines = f.readlines(CSV_READ_CHUNK)
+            if not lines:
+                break
+            ts, raw, pc_time, midnight, last_pc = parse_csv_lines(lines, adc_cols, midnight, last_pc)
+            if len(ts):
+                block = SampleBlock.from_raw(layout, ts, raw.reshape(-1, len(channels)), pc_time, threshold)
+                writer.add_block(block, record, offset)
+                record += len(block)
+            offset += sum(map(len, lines))
+        writer.close()
+    return writer.index_path, writer.events_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "events", "around"):
+        print("Cach dung: python session_index.py build|events|around <file> [so thu tu su kien] [truoc] [sau]")
+        sys.exit(1)
+    cmd, src = sys.argv[1], sys.argv[2]
+    if cmd == "build":
+        print(f">> Da tao: {', '.join(build_index(src))}")
+        sys.exit(0)
+    with SessionIndex(src) as index:
+        if cmd == "events":
+            print(f"{len(index.entries)} muc chi muc | {len(index.events)} su kien")
+            for i, ev in enumerate(index.events):
+                print(f"{i:>6} {datetime.fromtimestamp(ev['pc_time'])} TS {ev['ts']}ms "
+                      f"{EVENT_KIND_NAMES.get(int(ev['kind']), ev['kind'])} CH{ev['channel']} "
+                      f"code={ev['code']} value={ev['value']:.4f} @ record {ev['record']}")
+        else:
+            ev = index.events[int(sys.argv[3])]
+            before = float(sys.argv[4]) if len(sys.argv) > 4 else 15.0
+            after = float(sys.argv[5]) if len(sys.argv) > 5 else 15.0
+            block = index.around(ev, before, after)
+            print(f">> {len(block)} mau quanh su kien @ {datetime.fromtimestamp(ev['pc_time'])}")
+            if len(block):
+                print(f"TS MCU: {int(block.timestamps[0])} -> {int(block.timestamps[-1])} ms")
@@ -0,0 +1,535 @@
+# ==============================================================================
+# PHIÊN ĐO CHIA SEGMENT (THEO DUNG LƯỢNG / THỜI GIAN) + MANIFEST + NÉN NỀN
+# ==============================================================================
+# Thay cho 1 file CSV / .bms không giới hạn mỗi lần ghi:
+#   <gốc>.part0001.csv, <gốc>.part0002.csv ...  mỗi segment là 1 file hoàn chỉnh (có header)
+#   <gốc>.partNNNN.bmidx / .bmevt               chỉ mục riêng từng segment (session_index.py)
+#   <gốc>.manifest.json                          danh sách segment + khoảng thời gian của từng cái
+# - Sang segment mới khi segment hiện tại vượt max_bytes hoặc kéo dài quá max_seconds (pc_time),
+#   kiểm tra sau mỗi khối trong luồng ghi của BlockRecorder (khối không bị cắt đôi).
+# - Segment đã đóng được nén (gzip / zstd, mức nén cấu hình được) trong 1 luồng nén riêng:
+#   luồng đọc serial và luồng ghi đều không phải chờ nén. zstd cần gói zstandard (tùy chọn).
+# - Manifest ghi lại (tmp + os.replace) mỗi khi mở / đóng / nén xong 1 segment nên luôn đọc được,
+#   kể cả khi chương trình dừng giữa chừng ("complete": false).
+# - close() không chờ nén: segment cuối vào hàng đợi nén, luồng nén tự đánh dấu "complete": true
+#   khi nén xong (luồng nén không phải daemon -> thoát chương trình vẫn nén nốt).
+# - Đọc: SegmentedSession duyệt lần lượt các segment (giải nén trong suốt), chỉ mở những segment
+#   có khoảng thời gian giao với khoảng cần đọc.
+#
+# Dòng lệnh:
+#   python session_segments.py info sensor_data_2026-01-01_08-00-00.manifest.json
+#   python session_segments.py to-csv <manifest> [out.csv]
+#   python session_segments.py to-bin <manifest> [out.bms]
+import csv
+import gzip
+import io
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from data_layout import DataLayout
+from recorder import CsvSink
+from sample_block import SampleBlock, PRESS_THRESHOLD_V, pc_times
+from session_file import (SESSION_EXT, HEADER_SIZE, SessionWriter, record_dtype, unpack_header,
+                          csv_channels, parse_csv_lines)
+from session_index import EVENTS_MAGIC, EVENT_DTYPE, IndexedSink, SessionIndex, index_paths, read_table
+
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 1
+SEGMENT_MAX_BYTES = 256 << 20           # 256 MB / segment
+SEGMENT_MAX_SECONDS = None              # None = chỉ chia theo dung lượng
+
+# Phương thức nén -> (đuôi file, mức nén mặc định)
+COMPRESSORS = {"gzip": ('.gz', 6), "zstd": ('.zst', 3)}
+COPY_CHUNK = 1 << 20
+READ_CHUNK_RECORDS = 65536              # record .bms / lần đọc khi duyệt segment
+CSV_READ_CHUNK = 1 << 20                # byte CSV / lần đọc khi duyệt segment
+
+_STOP = object()
+
+
+def manifest_path(filename):
+    return os.path.splitext(filename)[0] + MANIFEST_SUFFIX
+
+
+def segment_path(filename, number):
+    root, ext = os.path.splitext(filename)
+    return f"{root}.part{number:04d}{ext}"
+
+
+def _check_method(method):
+    if method not in COMPRESSORS:
+        raise ValueError(f"Phuong thuc nen khong ho tro: {method} (chon {', '.join(COMPRESSORS)})")
+    if method == "zstd" and zstandard is None:
+        raise RuntimeError("Nen zstd can goi zstandard (pip install zstandard)")
+
+
+def open_segment(path):
+    """Mở file segment để đọc nhị phân, tự giải nén theo đuôi .gz / .zst."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        _check_method("zstd")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
+
+
+def compress_file(path, method="gzip", level=None):
+    """Nén path -> path + .gz / .zst rồi xóa file gốc. Trả về đường dẫn file nén."""
+    _check_method(method)
+    ext, default_level = COMPRESSORS[method]
+    level = default_level if level is None else level
+    out_path = path + ext
+    tmp_path = out_path + '.tmp'
+    with open(path, 'rb') as src:
+        if method == "gzip":
+            with open(tmp_path, 'wb') as raw, gzip.GzipFile(os.path.basename(path), 'wb', level, raw) as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+        else:
+            with open(tmp_path, 'wb') as raw:
+                zstandard.ZstdCompressor(level=level).copy_stream(src, raw, read_size=COPY_CHUNK)
+    os.replace(tmp_path, out_path)
+    os.remove(path)
+    return out_path
+
+
+# ==============================================================================
+# 1. LUỒNG NÉN NỀN
+# ==============================================================================
+class Compressor:
+    """Hàng đợi file cần nén + 1 luồng nén; callback(path, out_path) gọi trong luồng nén khi xong."""
+
+    def __init__(self, method="gzip", level=None):
+        _check_method(method)
+        self.method = method
+        self.level = level
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.start()
+
+        # Thống kê
+        self.files = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        self.errors = 0
+
+    def submit(self, path, callback=None):
+        self._queue.put((path, callback))
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self, wait=True, callback=None):
+        """Nén nốt các file đang chờ rồi dừng luồng; callback() gọi trong luồng nén khi xong hết.
+
+        wait=False: trả về ngay (không chặn luồng gọi), luồng nén tự dừng sau file cuối.
+        """
+        if self._thread is None:
+            return
+        self._queue.put((_STOP, callback))
+        if wait:
+            self.join()
+
+    def join(self, timeout=None):
+        """Chờ luồng nén dừng (sau close()). True nếu đã dừng."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                return False
+            self._thread = None
+        return True
+
+    def _loop(self):
+        while True:
+            path, callback = self._queue.get()
+            if path is _STOP:
+                if callback is not None:
+                    self._call(callback)
+                return
+            t0 = time.perf_counter()
+            try:
+                size = os.path.getsize(path)
+                out_path = compress_file(path, self.method, self.level)
+            except Exception:
+                # Nén lỗi thì giữ nguyên file gốc (vẫn đọc được)
+                self.errors += 1
+                continue
+            self.seconds += time.perf_counter() - t0
+            self.files += 1
+            self.bytes_in += size
+            self.bytes_out += os.path.getsize(out_path)
+            if callback is not None:
+                self._call(callback, path, out_path)
+
+    def _call(self, callback, *args):
+        # Lỗi callback (vd ghi manifest) không được làm dừng luồng nén
+        try:
+            callback(*args)
+        except Exception:
+            self.errors += 1
+
+    def stats(self):
+        return {
+            "method": self.method,
+            "files": self.files,
+            "pending": self.pending,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.bytes_in / self.bytes_out if self.bytes_out else 0.0,
+            "seconds": self.seconds,
+            "errors": self.errors,
+        }
+
+
+# ==============================================================================
+# 2. GHI (sink cho recorder.BlockRecorder)
+# ==============================================================================
+class SegmentedSink:
+    def __init__(self, filename, layout, status=None, fmt="csv", max_bytes=SEGMENT_MAX_BYTES,
+                 max_seconds=SEGMENT_MAX_SECONDS, compress=None, level=None, index=True):
+        if fmt not in ("csv", "bin"):
+            raise ValueError("fmt phai la 'csv' hoac 'bin'")
+        self.filename = filename
+        self.manifest_path = manifest_path(filename)
+        self.layout = layout
+        self.status = status
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.index = index
+        self.compressor = Compressor(compress, level) if compress else None
+        self._lock = threading.Lock()   # manifest được cập nhật từ luồng ghi và luồng nén
+        self.start_time = time.time()
+        self.segments = []
+        self.complete = False
+        self._sink = None
+        self._data = None               # CsvSink / SessionWriter bên dưới (có tell())
+        self._segment = None            # mục manifest của segment đang ghi
+        self._pressed = None            # block.pressed mẫu cuối: sự kiện vượt ngưỡng nối qua segment
+        self.records = 0
+        self._open_segment()
+
+    def _open_segment(self):
+        path = segment_path(self.filename, len(self.segments) + 1)
+        if self.fmt == "bin":
+            data = SessionWriter(path, self.layout, self.status)
+        else:
+            data = CsvSink(path, self.layout)
+        self._data = data
+        self._sink = IndexedSink(data, self.status, pressed=self._pressed) if self.index else data
+        self._segment = {
+            "file": os.path.basename(path),     # tên segment chưa nén (chỉ mục cùng tên gốc)
+            "stored": os.path.basename(path),   # tên file thực trên đĩa (.gz / .zst sau khi nén)
+            "records": 0,
+            "first_record": self.records,
+            "ts_first": None, "ts_last": None,
+            "pc_first": None, "pc_last": None,
+            "bytes": 0,
+            "compression": None,
+            "open": True,
+        }
+        self._opened_at = None
+        with self._lock:
+            self.segments.append(self._segment)
+            self._write_manifest()
+
+    def _close_segment(self):
+        if self._sink is None:
+            return
+        self._sink.close()
+        segment = self._segment
+        path = self._data.filename
+        with self._lock:
+            segment["bytes"] = os.path.getsize(path)
+            segment["open"] = False
+            self._write_manifest()
+        self._sink = self._data = self._segment = None
+        if self.compressor is not None and segment["records"]:
+            self.compressor.submit(path, lambda src, dst, seg=segment: self._on_compressed(seg, dst))
+
+    def _on_compressed(self, segment, out_path):
+        with self._lock:
+            segment["stored"] = os.path.basename(out_path)
+            segment["compression"] = self.compressor.method
+            segment["stored_bytes"] = os.path.getsize(out_path)
+            self._write_manifest()
+
+    def _write_manifest(self):
+        # Gọi khi đang giữ self._lock
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "format": self.fmt,
+            "channels": list(self.layout.channels),
+            "bits": list(self.layout.bits),
+            "start_time": self.start_time,
+            "max_bytes": self.max_bytes,
+            "max_seconds": self.max_seconds,
+            "compression": self.compressor.method if self.compressor is not None else None,
+            "complete": self.complete,
+            "segments": self.segments,
+        }
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def write_block(self, block):
+        if not len(block):
+            return
+        if self._sink is None:
+            self._open_segment()
+        self._sink.write_block(block)
+        segment = self._segment
+        ts = block.timestamps
+        pc_time = pc_times(block)
+        if segment["ts_first"] is None:
+            segment["ts_first"] = int(ts[0])
+            segment["pc_first"] = float(pc_time[0])
+        segment["ts_last"] = int(ts[-1])
+        segment["pc_last"] = float(pc_time[-1])
+        segment["records"] += len(block)
+        self.records += len(block)
+        self._pressed = block.pressed[-1].copy()
+        # Kiểm tra sau khi ghi: segment không bao giờ rỗng, khối không bị cắt đôi
+        if (self.max_bytes and self._data.tell()[1] >= self.max_bytes) or \
+                (self.max_seconds and segment["pc_last"] - segment["pc_first"] >= self.max_seconds):
+            self._close_segment()
+
+    def write_event(self, event):
+        if not self.index:
+            return
+        if self._sink is None:
+            self._open_segment()
+        self._sink.write_event(event)
+
+    def tell(self):
+        """(số record đã ghi cả phiên, byte đã ghi ở segment hiện tại)."""
+        return self.records, self._data.tell()[1] if self._data is not None else 0
+
+    def flush(self):
+        if self._sink is not None:
+            self._sink.flush()
+
+    def close(self, wait=False):
+        """Đóng segment cuối; manifest được đánh dấu hoàn tất khi nén xong mọi segment.
+
+        Mặc định không chờ nén (close được gọi từ luồng ghi / luồng đọc khi đổi bố cục).
+        """
+        self._close_segment()
+        if self.compressor is None:
+            self._finish()
+        else:
+            self.compressor.close(wait, self._finish)
+
+    def wait(self, timeout=None):
+        """Chờ nén xong + manifest hoàn tất. True nếu đã xong."""
+        return self.compressor is None or self.compressor.join(timeout)
+
+    def _finish(self):
+        with self._lock:
+            self.complete = True
+            self._write_manifest()
+
+    def stats(self):
+        out = {"segments": len(self.segments), "records": self.records}
+        if self.compressor is not None:
+            out["compression"] = self.compressor.stats()
+        return out
+
+
+# ==============================================================================
+# 3. ĐỌC XUYÊN SEGMENT
+# ==============================================================================
+class SegmentedSession:
+    def __init__(self, path):
+        # Nhận manifest hoặc tên file gốc của phiên
+        if not path.endswith(MANIFEST_SUFFIX):
+            path = manifest_path(path)
+        self.path = path
+        self.directory = os.path.dirname(path)
+        with open(path) as f:
+            self.manifest = json.load(f)
+        self.fmt = self.manifest["format"]
+        self.layout = DataLayout(tuple(self.manifest["channels"]), tuple(self.manifest["bits"]))
+        self.segments = self.manifest["segments"]
+        self.complete = self.manifest["complete"]
+
+    def __len__(self):
+        return sum(seg["records"] for seg in self.segments)
+
+    @property
+    def channels(self):
+        return self.layout.channels
+
+    def segment_path(self, segment):
+        path = os.path.join(self.directory, segment["stored"])
+        if not os.path.exists(path) and segment["compression"] is None:
+            # Nén xong nhưng chưa kịp cập nhật manifest (dừng đột ngột): thử tên đã nén
+            for ext, _ in COMPRESSORS.values():
+                if os.path.exists(path + ext):
+                    return path + ext
+        return path
+
+    def _select(self, t_start, t_end, field):
+        key = "pc" if field == 'pc_time' else "ts"
+        for seg in self.segments:
+            first, last = seg[f"{key}_first"], seg[f"{key}_last"]
+            if first is None:
+                continue
+            if t_start is not None and last < t_start:
+                continue
+            if t_end is not None and first > t_end:
+                continue
+            yield seg
+
+    def iter_blocks(self, t_start=None, t_end=None, field='pc_time', threshold=PRESS_THRESHOLD_V):
+        """SampleBlock theo thứ tự thời gian qua mọi segment (field: 'pc_time' giây epoch | 'ts' ms MCU)."""
+        return self._iter_blocks(self._select(t_start, t_end, field), t_start, t_end, field, threshold)
+
+    def _iter_blocks(self, segments, t_start, t_end, field, threshold):
+        for seg in segments:
+            for ts, raw, pc_time in self._iter_segment(seg):
+                if t_start is not None or t_end is not None:
+                    column = pc_time if field == 'pc_time' else ts
+                    keep = np.ones(len(ts), dtype=bool)
+                    if t_start is not None:
+                        keep &= column >= t_start
+                    if t_end is not None:
+                        keep &= column <= t_end
+                    if not keep.any():
+                        continue
+                    ts, raw, pc_time = ts[keep], raw[keep], pc_time[keep]
+                yield SampleBlock.from_raw(self.layout, ts, raw, pc_time, threshold)
+
+    def read(self, t_start=None, t_end=None, field='pc_time', threshold=PRESS_THRESHOLD_V):
+        """Các mẫu trong [t_start, t_end] thành 1 SampleBlock. Segment chưa nén có chỉ mục -> seek thẳng."""
+        parts = []
+        for seg in self._select(t_start, t_end, field):
+            path = self.segment_path(seg)
+            if t_start is not None and t_end is not None and path.endswith(seg["file"]) \
+                    and os.path.exists(index_paths(path)[0]):
+                with SessionIndex(path) as index:
+                    blocks = [index.read(t_start, t_end, field, threshold)]
+            else:
+                blocks = self._iter_blocks([seg], t_start, t_end, field, threshold)
+            parts += [(block.timestamps, block.raw, block.pc_time) for block in blocks]
+        if not parts:
+            return SampleBlock.from_raw(self.layout, np.empty(0, dtype=np.uint32),
+                                        np.empty((0, self.layout.n_channels), dtype=np.uint32),
+                                        np.empty(0), threshold)
+        ts, raw, pc_time = (np.concatenate(col) for col in zip(*parts))
+        return SampleBlock.from_raw(self.layout, ts, raw, pc_time, threshold)
+
+    def events(self):
+        """Gộp .bmevt của mọi segment; cột record đánh số theo cả phiên."""
+        parts = []
+        for seg in self.segments:
+            events_path = index_paths(os.path.join(self.directory, seg["file"]))[1]
+            if not os.path.exists(events_path):
+                continue
+            _, _, events = read_table(events_path, EVENTS_MAGIC, EVENT_DTYPE)
+            events = events.copy()
+            events['record'] += seg["first_record"]
+            parts.append(events)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=EVENT_DTYPE)
+
+    def _iter_segment(self, segment):
+        """-> (ts, raw, pc_time) theo từng đoạn của 1 segment, giải nén trong suốt."""
+        with open_segment(self.segment_path(segment)) as f:
+            if self.fmt == "bin":
+                yield from self._iter_bin(f)
+            else:
+                yield from self._iter_csv(f, segment)
+
+    def _iter_bin(self, f):
+        head = f.read(HEADER_SIZE)
+        _, layout, _, header_size, record_size = unpack_header(head)
+        f.read(header_size - len(head))
+        dtype = record_dtype(layout)
+        pending = b''
+        while True:
+            data = f.read(READ_CHUNK_RECORDS * record_size)
+            if not data:
+                break
+            data = pending + data
+            n = len(data) // record_size
+            pending = data[n * record_size:]
+            if n:
+                rec = np.frombuffer(data, dtype=dtype, count=n)
+                yield rec['ts'].copy(), rec['raw'].copy(), rec['pc_time'].copy()
+
+    def _iter_csv(self, f, segment):
+        header = next(csv.reader([f.readline().decode()]))
+        channels, adc_cols = csv_channels(header)
+        # PC_Time trong CSV chỉ có giờ trong ngày: ngày lấy từ pc_first của segment trong manifest
+        base_pc = segment["pc_first"]
+        midnight = datetime.combine(datetime.fromtimestamp(base_pc).date(), datetime.min.time()).timestamp()
+        last_pc = base_pc
+        while True:
+            lines = f.readlines(CSV_READ_CHUNK)
+            if not lines:
+                break
+            ts, raw, pc_time, midnight, last_pc = parse_csv_lines(lines, adc_cols, midnight, last_pc)
+            if len(ts):
+                yield ts, raw.reshape(-1, len(channels)), pc_time
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def session_to_file(path, out_path, fmt="csv"):
+    """Ghép mọi segment thành 1 file CSV / .bms duy nhất."""
+    with SegmentedSession(path) as session:
+        if fmt == "bin":
+            writer = SessionWriter(out_path, session.layout,
+                                   start_time=session.manifest["start_time"])
+        else:
+            writer = CsvSink(out_path, session.layout)
+        try:
+            for block in session.iter_blocks():
+                writer.write_block(block)
+        finally:
+            writer.close()
+    return out_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("info", "to-csv", "to-bin"):
+        print("Cach dung: python session_segments.py info|to-csv|to-bin <manifest> [out]")
+        sys.exit(1)
+    cmd, src = sys.argv[1], sys.argv[2]
+    if cmd == "info":
+        with SegmentedSession(src) as s:
+            print(f"Kenh: {list(s.channels)} | Dinh dang: {s.fmt} | {len(s.segments)} segment"
+                  f" | {len(s)} record | {'hoan tat' if s.complete else 'CHUA DONG (dang ghi / dung dot ngot)'}")
+            for seg in s.segments:
+                t0 = datetime.fromtimestamp(seg["pc_first"]) if seg["pc_first"] is not None else "-"
+                t1 = datetime.fromtimestamp(seg["pc_last"]) if seg["pc_last"] is not None else "-"
+                size = seg.get("stored_bytes", seg["bytes"])
+                print(f"  {seg['stored']:<48} {seg['records']:>10} record  {size / 1e6:>8.1f} MB  {t0} -> {t1}")
+    else:
+        root = src[:-len(MANIFEST_SUFFIX)] if src.endswith(MANIFEST_SUFFIX) else os.path.splitext(src)[0]
+        ext = '.csv' if cmd == "to-csv" else SESSION_EXT
+        dst = sys.argv[3] if len(sys.argv) > 3 else root + ext
+        print(f">> Da tao: {session_to_file(src, dst, 'csv' if cmd == 'to-csv' else 'bin')}")
@@ -0,0 +1,259 @@
+# ==============================================================================
+# PHÁT LUỒNG MẪU QUA SHARED MEMORY CHO TIẾN TRÌNH KHÁC (VẼ, ML, GHI LOG...)
+# ==============================================================================
+# Publisher (trong tiến trình đọc serial) chép mỗi SampleBlock vào 1 vùng vòng trên
+# multiprocessing.shared_memory; Subscriber ở tiến trình khác attach theo tên và đọc
+# thẳng trên bộ nhớ chung (view numpy, không qua pipe / pickle).
+#
+# Bố cục vùng nhớ:
+#   [Header 128 byte] magic | version | schema | capacity | head | reserve |
+#                     n_channels | channels[32] | bits[32]
+#   ts u4[cap] | pc_time f8[cap] | raw u4[cap, 32]
+# - schema: tăng mỗi khi STATUS đổi bố cục kênh (channels/bits đọc lại từ header).
+# - head / reserve: đồng bộ kiểu seqlock như sample_ring.py (đếm mẫu tuyệt đối).
+# - raw luôn cấp đủ 32 kênh nên đổi bố cục không phải cấp phát lại vùng nhớ.
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from data_layout import ADC_LSB_VOLT, MAX_SENSORS, get_layout
+from sample_block import SampleBlock
+
+SHM_MAGIC = b'BMSHM001'
+SHM_VERSION = 1
+DEFAULT_CAPACITY = 1 << 16      # mẫu
+POLL_INTERVAL = 0.0005          # s, Subscriber.wait()
+
+_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'), ('version', '<u4'), ('schema', '<u4'), ('capacity', '<u8'),
+    ('head', '<u8'), ('reserve', '<u8'), ('n_channels', '<u4'), ('pad', '<u4'),
+    ('channels', 'u1', (MAX_SENSORS,)), ('bits', 'u1', (MAX_SENSORS,)),
+])
+_HEADER_SIZE = 128
+
+
+def _region_size(capacity):
+    return _HEADER_SIZE + capacity * (4 + 8 + 4 * MAX_SENSORS)
+
+
+def _map_arrays(buf, capacity):
+    header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=buf)
+    offset = _HEADER_SIZE
+    ts = np.ndarray((capacity,), dtype='<u4', buffer=buf, offset=offset)
+    offset += 4 * capacity
+    pc_time = np.ndarray((capacity,), dtype='<f8', buffer=buf, offset=offset)
+    offset += 8 * capacity
+    raw = np.ndarray((capacity, MAX_SENSORS), dtype='<u4', buffer=buf, offset=offset)
+    return header, ts, pc_time, raw
+
+
+class Publisher:
+    def __init__(self, name=None, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=_region_size(capacity))
+        self.name = self.shm.name
+        self.header, self.ts, self.pc_time, self.raw = _map_arrays(self.shm.buf, capacity)
+        self.header['magic'] = SHM_MAGIC
+        self.header['version'] = SHM_VERSION
+        self.header['capacity'] = capacity
+        self._layout_key = None
+        self.blocks = 0
+
+    def attach(self, host):
+        host.add_block_consumer(self.write_block)
+        return self
+
+    def detach(self, host):
+        host.remove_block_consumer(self.write_block)
+
+    def _set_layout(self, layout):
+        h = self.header
+        h['reserve'] = int(h['head']) + 2 * self.capacity   # vô hiệu mọi view cũ
+        h['n_channels'] = layout.n_channels
+        h['channels'][:] = 0
+        h['bits'][:] = 0
+        h['channels'][:layout.n_channels] = layout.channels
+        h['bits'][:layout.n_channels] = layout.bits
+        h['head'] = 0
+        h['schema'] = int(h['schema']) + 1
+        h['reserve'] = 0
+        self._layout_key = layout.key()
+
+    def write_block(self, block):
+        if block.layout.key() != self._layout_key:
+            self._set_layout(block.layout)
+        n = len(block)
+        if not n:
+            return
+        h = self.header
+        cap = self.capacity
+        skip = max(0, n - cap)
+        head = int(h['head'])
+        h['reserve'] = head + n
+        pos = (head + skip) % cap
+        first = min(n - skip, cap - pos)
+        n_ch = block.layout.n_channels
+        pc_time = np.broadcast_to(block.pc_time, (n,))
+        self.ts[pos:pos + first] = block.timestamps[skip:skip + first]
+        self.pc_time[pos:pos + first] = pc_time[skip:skip + first]
+        self.raw[pos:pos + first, :n_ch] = block.raw[skip:skip + first]
+        rest = n - skip - first
+        if rest:
+            self.ts[:rest] = block.timestamps[skip + first:]
+            self.pc_time[:rest] = pc_time[skip + first:]
+            self.raw[:rest, :n_ch] = block.raw[skip + first:]
+        h['head'] = head + n
+        self.blocks += 1
+
+    def close(self):
+        del self.header, self.ts, self.pc_time, self.raw
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _attach_shm(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # Python >= 3.13
+    except TypeError:
+        pass
+    # Python < 3.13 đăng ký cả vùng nhớ chỉ attach với resource_tracker, khiến nó bị unlink
+    # khi tiến trình subscriber thoát. Vùng nhớ thuộc về Publisher nên bỏ qua bước đăng ký.
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class ShmWindow:
+    """Các mẫu [start, end) trên vùng nhớ chung; view khi liền mạch, copy khi vắt qua cuối vòng."""
+    __slots__ = ("sub", "schema", "layout", "start", "end", "timestamps", "raw", "pc_time")
+
+    def __init__(self, sub, schema, layout, start, end):
+        self.sub = sub
+        self.schema = schema
+        self.layout = layout
+        self.start = start
+        self.end = end
+        n_ch = layout.n_channels if layout is not None else 0
+        self.timestamps = sub._slice(sub.ts, start, end)
+        self.pc_time = sub._slice(sub.pc_time, start, end)
+        self.raw = sub._slice(sub.raw, start, end)[:, :n_ch]
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def volts(self):
+        return self.raw * ADC_LSB_VOLT
+
+    def valid(self):
+        return self.sub.is_valid(self.start, self.schema)
+
+    def to_block(self):
+        """Chép thành SampleBlock riêng của tiến trình này (None nếu đã bị ghi đè)."""
+        block = SampleBlock.from_raw(self.layout, self.timestamps.copy(), self.raw.copy(),
+                                     self.pc_time.copy())
+        return block if self.valid() else None
+
+
+class Subscriber:
+    def __init__(self, name, from_oldest=False):
+        self.shm = _attach_shm(name)
+        header = np.ndarray((), dtype=_HEADER_DTYPE, buffer=self.shm.buf)
+        if bytes(header['magic']) != SHM_MAGIC:
+            self.shm.close()
+            raise ValueError(f"{name} khong phai vung nho cua Publisher")
+        self.capacity = int(header['capacity'])
+        del header
+        self.header, self.ts, self.pc_time, self.raw = _map_arrays(self.shm.buf, self.capacity)
+        self.schema = None
+        self.layout = None
+        self.cursor = 0
+        self._sync_schema()
+        if not from_oldest:
+            self.cursor = int(self.header['head'])
+        self.lost = 0
+        self.overruns = 0
+
+    def _sync_schema(self):
+        h = self.header
+        schema = int(h['schema'])
+        if schema != self.schema:
+            n = int(h['n_channels'])
+            key = (tuple(int(c) for c in h['channels'][:n]), tuple(int(b) for b in h['bits'][:n]))
+            self.layout = get_layout(key) if n else None
+            self.schema = schema
+            self.cursor = 0
+            return True
+        return False
+
+    def is_valid(self, start, schema):
+        h = self.header
+        return schema == int(h['schema']) and int(h['reserve']) - self.capacity <= start
+
+    def _slice(self, array, start, end):
+        cap = self.capacity
+        pos = start % cap
+        if end <= start or start // cap == (end - 1) // cap:
+            return array[pos:pos + end - start]
+        return np.concatenate((array[pos:], array[:end % cap or cap]))
+
+    @property
+    def pending(self):
+        return max(0, int(self.header['head']) - self.cursor)
+
+    def read(self, max_n=None):
+        """Mọi mẫu mới kể từ lần đọc trước -> ShmWindow (có thể rỗng)."""
+        self._sync_schema()
+        h = self.header
+        end = int(h['head'])
+        oldest = max(0, int(h['reserve']) - self.capacity)
+        if self.cursor < oldest:
+            self.lost += oldest - self.cursor
+            self.overruns += 1
+            self.cursor = oldest
+        if max_n is not None:
+            end = min(end, self.cursor + max_n)
+        window = ShmWindow(self, self.schema, self.layout, self.cursor, end)
+        self.cursor = end
+        return window
+
+    def check(self, window):
+        if window.valid():
+            return True
+        self.lost += len(window)
+        self.overruns += 1
+        return False
+
+    def wait(self, timeout=None, poll=POLL_INTERVAL):
+        """Chờ (polling) tới khi có mẫu mới. Trả về False nếu hết timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while int(self.header['head']) <= self.cursor and int(self.header['schema']) == self.schema:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    def stats(self):
+        return {"cursor": self.cursor, "pending": self.pending, "lost": self.lost,
+                "overruns": self.overruns, "schema": self.schema}
+
+    def close(self):
+        del self.header, self.ts, self.pc_time, self.raw
+        self.shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,26 @@
+# Các module nằm phẳng ở thư mục gốc repo: cho pytest import được khi chạy từ bất kỳ đâu
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pytest
+
+
+@pytest.fixture
+def host():
+    """Host không cổng serial, tắt echo (test gọi thẳng _handle_bytes / các hàm xử lý)."""
+    from giao_tiep_protocol import BiomechanicsHost
+    host = BiomechanicsHost(None, 0)
+    host.echo = False
+    return host
+
+
+@pytest.fixture
+def fail():
+    """Consumer / subscriber giả luôn ném lỗi."""
+    def _fail(*args):
+        raise RuntimeError("consumer loi")
+    return _fail
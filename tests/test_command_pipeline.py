@@ -0,0 +1,132 @@
+# Bảng lệnh chờ ACK: ghép theo (CmdID, Seq), gửi lại có backoff, BUSY, cửa sổ pipeline, ghi cổng lỗi
+import pytest
+
+from command_pipeline import (PendingCommands, CommandTimeout, ACK_OK, ACK_BUSY, ACK_FAILED,
+                              wait_all)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Port:
+    def __init__(self):
+        self.frames = []
+        self.error = None
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.frames.append(frame)
+
+
+def _commands(**kwargs):
+    clock, port = _Clock(), _Port()
+    kwargs.setdefault("timeout", 0.1)
+    kwargs.setdefault("retries", 2)
+    kwargs.setdefault("backoff", 2.0)
+    return PendingCommands(port.write, clock=clock, **kwargs), clock, port
+
+
+def test_ack_matched_by_cmd_and_seq():
+    commands, clock, port = _commands()
+    f1 = commands.submit(0x10, 1, b'a')
+    f2 = commands.submit(0x10, 2, b'b')
+    assert commands.on_ack(0x10, 3, ACK_OK) is None
+    assert commands.unmatched_acks == 1
+    clock.now = 0.05
+    ack = commands.on_ack(0x10, 2, ACK_FAILED)
+    assert f2.result(0) is ack and ack.result == ACK_FAILED and ack.attempts == 1
+    assert ack.rtt == pytest.approx(0.05)
+    assert not f1.done()
+    assert len(commands) == 1
+
+
+def test_retransmit_with_backoff_then_timeout():
+    commands, clock, port = _commands()
+    future = commands.submit(0x10, 1, b'a')
+    assert commands.poll() == pytest.approx(0.1)
+    clock.now = 0.1
+    assert commands.poll() == pytest.approx(0.1 + 0.2)       # lần 2 chờ gấp đôi
+    clock.now = 0.31
+    assert commands.poll() == pytest.approx(0.31 + 0.4)
+    assert port.frames == [b'a'] * 3
+    clock.now = 0.72
+    assert commands.poll() is None
+    with pytest.raises(CommandTimeout) as info:
+        future.result(0)
+    assert info.value.attempts == 3
+    assert commands.stats()["retransmits"] == 2 and commands.timeouts == 1
+
+
+def test_busy_is_retried_like_lost_ack():
+    commands, clock, port = _commands()
+    future = commands.submit(0x10, 1, b'a')
+    assert commands.on_ack(0x10, 1, ACK_BUSY) is None
+    assert not future.done()
+    clock.now = 0.1
+    commands.poll()
+    assert port.frames == [b'a', b'a']
+    ack = commands.on_ack(0x10, 1, ACK_OK)
+    assert future.result(0).ok and ack.attempts == 2
+
+
+def test_busy_after_last_attempt_resolves_with_busy():
+    commands, clock, port = _commands(retries=0)
+    future = commands.submit(0x10, 1, b'a')
+    commands.on_ack(0x10, 1, ACK_BUSY)
+    assert future.result(0).result == ACK_BUSY
+
+
+def test_window_refilled_on_ack_and_timeout():
+    commands, clock, port = _commands(max_in_flight=2, retries=0)
+    futures = [commands.submit(0x10, seq, bytes([seq])) for seq in range(4)]
+    assert port.frames == [b'\x00', b'\x01']
+    clock.now = 0.05
+    commands.on_ack(0x10, 0, ACK_OK)
+    assert port.frames[-1] == b'\x02'
+    clock.now = 0.1
+    commands.poll()                                         # lệnh 1 hết lượt -> lệnh 3 được gửi
+    assert port.frames[-1] == b'\x03'
+    commands.on_ack(0x10, 2, ACK_OK)
+    commands.on_ack(0x10, 3, ACK_OK)
+    with pytest.raises(CommandTimeout):
+        wait_all(futures, timeout=0)
+    assert [f.result(0).seq for f in (futures[0], futures[2], futures[3])] == [0, 2, 3]
+
+
+def test_write_error_fails_futures_instead_of_raising():
+    commands, clock, port = _commands(max_in_flight=2, retries=1)
+    f1 = commands.submit(0x10, 1, b'a')
+    f2 = commands.submit(0x10, 2, b'b')
+    f3 = commands.submit(0x10, 3, b'c')                     # đang xếp hàng
+    clock.now = 0.1
+    commands.on_ack(0x10, 2, ACK_OK)                        # f3 lên đường truyền
+    port.error = OSError("mat cong")
+    clock.now = 0.25
+    assert commands.poll() is None                          # không ném ra luồng đọc
+    for future in (f1, f3):
+        with pytest.raises(OSError):
+            future.result(0)
+    assert f2.result(0).ok
+    assert len(commands) == 0 and commands.write_errors == 2
+    f4 = commands.submit(0x10, 4, b'd')
+    with pytest.raises(OSError):
+        f4.result(0)
+
+
+def test_timeout_futures_completed_even_if_refill_write_fails():
+    commands, clock, port = _commands(max_in_flight=1, retries=0)
+    f1 = commands.submit(0x10, 1, b'a')
+    f2 = commands.submit(0x10, 2, b'b')
+    port.error = OSError("mat cong")
+    clock.now = 0.1
+    commands.poll()
+    with pytest.raises(CommandTimeout):
+        f1.result(0)
+    with pytest.raises(OSError):
+        f2.result(0)
@@ -0,0 +1,76 @@
+# Luồng đọc không bao giờ ghi terminal: echo=True thì start_reading() tự gắn ConsoleRenderer,
+# mọi thông báo / giá trị mới nhất đi qua luồng hiển thị
+import struct
+import sys
+import threading
+import time
+
+from data_layout import DataLayout, DeviceStatus
+from frame_parser import build_frame, TYPE_ACK, TYPE_DATA, TYPE_STATUS
+from giao_tiep_protocol import BiomechanicsHost
+
+LAYOUT = DataLayout((0, 1), (16, 16))
+
+
+class _Stdout:
+    def __init__(self):
+        self.writers = set()
+        self.text = []
+
+    def write(self, text):
+        self.writers.add(threading.current_thread())
+        self.text.append(text)
+
+    def flush(self):
+        self.writers.add(threading.current_thread())
+
+
+class _FakeSerial:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, n):
+        if not self.chunks:
+            time.sleep(0.002)
+            return b''
+        return self.chunks.pop(0)
+
+    def close(self):
+        self.is_open = False
+
+
+def test_reader_thread_never_writes_stdout(monkeypatch):
+    out = _Stdout()
+    monkeypatch.setattr(sys, "stdout", out)
+    status = build_frame(TYPE_STATUS, DeviceStatus.from_layout(LAYOUT).to_payload())
+    data = b''.join(build_frame(TYPE_DATA, struct.pack('<IHH', i, 1000, 60000)) for i in range(50))
+    host = BiomechanicsHost(None, 0)
+    host.ser = _FakeSerial([status, data, build_frame(TYPE_ACK, bytes([0x10, 1, 0])), bytes(3)])
+    host.start_reading()
+    assert host.console is not None
+    deadline = time.monotonic() + 2.0
+    while host.ser.chunks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    reader = host.read_thread
+    host.disconnect()
+    assert host.console is None
+    assert reader not in out.writers
+    text = "".join(out.text)
+    assert "[STATUS]" in text and "TS: 49ms" in text
+
+
+def test_echo_off_without_console_is_silent(monkeypatch):
+    out = _Stdout()
+    monkeypatch.setattr(sys, "stdout", out)
+    host = BiomechanicsHost(None, 0)
+    host.echo = False
+    host._handle_bytes(build_frame(TYPE_STATUS, DeviceStatus.from_layout(LAYOUT).to_payload()),
+                       time.perf_counter())
+    host._log(">> thong bao")
+    assert out.text == []
@@ -0,0 +1,132 @@
+# Vòng đọc chung: select đã chờ đủ timeout thì không ngủ thêm; chỉ ngủ khi chưa có cổng nào để select
+import time
+import types
+
+import device_manager
+from device_manager import DeviceManager, READ_TIMEOUT
+
+
+class _FakeSelector:
+    def __init__(self, registered, rounds=3):
+        self.registered = registered
+        self.rounds = rounds
+        self.selects = []
+
+    def get_map(self):
+        return {3: object()} if self.registered else {}
+
+    def select(self, timeout):
+        self.selects.append(timeout)
+        return []
+
+    def close(self):
+        pass
+
+
+def _run_loop(monkeypatch, registered):
+    manager = DeviceManager([])
+    selector = manager.selector = _FakeSelector(registered)
+    sleeps = []
+
+    def sleep(dt):
+        sleeps.append(dt)
+
+    def tick():
+        if manager.loop_iterations >= selector.rounds - 1:
+            manager.running = False
+        return time.monotonic()
+
+    monkeypatch.setattr(device_manager, "time", types.SimpleNamespace(sleep=sleep, monotonic=tick))
+    manager.running = True
+    manager._loop()
+    return selector, sleeps
+
+
+def test_no_extra_sleep_after_empty_select(monkeypatch):
+    selector, sleeps = _run_loop(monkeypatch, registered=True)
+    assert selector.selects == [READ_TIMEOUT] * 3
+    assert sleeps == []
+
+
+def test_sleep_when_nothing_to_select(monkeypatch):
+    selector, sleeps = _run_loop(monkeypatch, registered=False)
+    assert selector.selects == []
+    assert sleeps == [READ_TIMEOUT] * 3
+
+
+class _FakeSerial:
+    def __init__(self, data=b'', error=None):
+        self.data = data
+        self.error = error
+        self.closed = False
+
+    @property
+    def in_waiting(self):
+        if self.error is not None:
+            raise self.error
+        return len(self.data)
+
+    def read(self, n):
+        data, self.data = self.data[:n], self.data[n:]
+        return data
+
+    def write(self, frame):
+        return len(frame)
+
+    def close(self):
+        self.closed = True
+
+
+def _boom(*args):
+    raise RuntimeError("loi ngoai du kien")
+
+
+def test_one_failing_device_does_not_stop_others(monkeypatch):
+    manager = DeviceManager(["a", "b", "c"])
+    seen = []
+    for device, ser in zip(manager.devices.values(),
+                           (_FakeSerial(error=RuntimeError("doc loi")), _FakeSerial(b'x' * 10), _FakeSerial())):
+        device.host.ser = ser
+        device.connected = True
+        device.retry_delay = 1e9            # không thử mở lại trong lúc test
+    a, b, c = manager.devices.values()
+    b.host._handle_bytes = lambda data, t: seen.append(data)
+    # c: kiểm tra lệnh chờ ACK lỗi ngoài dự kiến (1 lần)
+    c.host.commands.submit(0x10, 1, b'frame')
+    polls = []
+
+    def poll():
+        polls.append(1)
+        if len(polls) == 1:
+            _boom()
+
+    monkeypatch.setattr(c.host.commands, "poll", poll)
+    manager.selector = _FakeSelector(registered=False)
+    rounds = 3
+
+    def tick():
+        if manager.loop_iterations >= rounds - 1:
+            manager.running = False
+        return time.monotonic()
+
+    monkeypatch.setattr(device_manager, "time", types.SimpleNamespace(
+        sleep=lambda dt: None, monotonic=tick, perf_counter=time.perf_counter))
+    manager.running = True
+    manager._loop()
+    assert manager.loop_iterations == rounds
+    assert seen == [b'x' * 10]
+    assert b.connected
+    assert not a.connected and a.host.process_errors == 1 and a.host.ser.closed
+    assert not c.connected and c.host.process_errors == 1
+    assert len(polls) == rounds     # lệnh chờ vẫn được kiểm tra timeout khi cổng đã ngắt
+
+
+def test_handle_bytes_error_counted_without_dropping(monkeypatch):
+    manager = DeviceManager(["a"])
+    device = manager.devices["a"]
+    device.host.ser = _FakeSerial(b'xyz')
+    device.connected = True
+    device.host._handle_bytes = _boom
+    manager._read(device)
+    assert device.connected
+    assert device.host.process_errors == 1
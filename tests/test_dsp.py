@@ -0,0 +1,95 @@
+# Bộ lọc có trạng thái: xử lý theo nhiều khối phải ra đúng như xử lý 1 lần và như vòng lặp từng mẫu;
+# tháp tóm tắt min/max/mean đúng theo từng cửa sổ thời gian
+import numpy as np
+import pytest
+
+from dsp import FirDecimator, MovingAverage, OnePole, SummaryPyramid, design_lowpass
+
+N = 5000
+
+
+@pytest.fixture
+def signal():
+    rng = np.random.default_rng(3)
+    t = np.arange(N)
+    x = np.stack([np.sin(t / 40.0), np.cos(t / 7.0)], axis=1) + rng.normal(0, 0.2, size=(N, 2))
+    splits = sorted(rng.choice(np.arange(1, N), size=60, replace=False).tolist())
+    return x, splits
+
+
+def _chunks(x, splits):
+    return [x[a:b] for a, b in zip([0] + splits, splits + [len(x)])]
+
+
+def test_moving_average_streamed(signal):
+    x, splits = signal
+    n = 9
+    ma = MovingAverage(n)
+    streamed = np.concatenate([ma.process(c) for c in _chunks(x, splits)])
+    # Chuẩn: đệm đầu bằng mẫu đầu tiên lặp lại rồi trung bình n mẫu gần nhất
+    ext = np.concatenate((np.repeat(x[:1], n - 1, axis=0), x))
+    ref = np.stack([ext[i:i + n].mean(axis=0) for i in range(N)])
+    np.testing.assert_allclose(streamed, ref, atol=1e-9)
+    np.testing.assert_allclose(MovingAverage(n).process(x), ref, atol=1e-9)
+
+
+def test_one_pole_streamed_matches_recursion(signal):
+    x, splits = signal
+    # alpha ~0.47 -> đoạn tính đóng ~1100 mẫu: khối 1 lần phải chia nhiều đoạn
+    f = OnePole(100, 1000)
+    streamed = np.concatenate([f.process(c) for c in _chunks(x, splits)])
+    y = x[0].copy()
+    ref = np.empty_like(x)
+    for i in range(N):
+        y += f.alpha * (x[i] - y)
+        ref[i] = y
+    np.testing.assert_allclose(streamed, ref, atol=1e-9)
+    np.testing.assert_allclose(OnePole(100, 1000).process(x), ref, atol=1e-9)
+
+
+def test_one_pole_cutoff_above_rate_passes_through(signal):
+    x, _ = signal
+    f = OnePole(200000, 1000)
+    np.testing.assert_array_equal(f.process(x[:100]), x[:100])
+    np.testing.assert_array_equal(f.process(x[100:]), x[100:])
+
+
+@pytest.mark.parametrize("factor", [1, 4, 10])
+def test_fir_decimator_streamed(signal, factor):
+    x, splits = signal
+    t = np.arange(N, dtype=np.float64)
+    one = FirDecimator(factor, [0.4 / factor, 0.2 / factor])
+    y_one, (t_one,) = one.process(x, [t])
+    stream = FirDecimator(factor, [0.4 / factor, 0.2 / factor])
+    parts = [stream.process(c, [tc]) for c, tc in zip(_chunks(x, splits), _chunks(t, splits))]
+    np.testing.assert_allclose(np.concatenate([y for y, _ in parts]), y_one, atol=1e-12)
+    np.testing.assert_array_equal(np.concatenate([ts for _, (ts,) in parts]), t_one)
+    # Chuẩn: tích chập đầy đủ trên tín hiệu đệm đầu, giữ 1 / factor mẫu
+    taps = one.taps
+    ext = np.concatenate((np.repeat(x[:1], taps - 1, axis=0), x))
+    ref = np.stack([np.convolve(ext[:, c], design_lowpass(cut, taps)[::-1], mode='valid')
+                    for c, cut in enumerate([0.4 / factor, 0.2 / factor])], axis=1)[::factor]
+    np.testing.assert_allclose(y_one, ref, atol=1e-12)
+    ext_t = np.concatenate((np.full(taps - 1, t[0]), t))
+    np.testing.assert_array_equal(t_one, ext_t[np.arange(0, N, factor) + one.delay])
+
+
+def test_summary_pyramid_windows(signal):
+    x, splits = signal
+    t = 1_700_000_000.0 + np.arange(N) * 0.037          # ~185 s, không khớp ranh giới cửa sổ
+    pyramid = SummaryPyramid(2, levels=(1, 10, 60))
+    closed = [[] for _ in range(3)]
+    for tc, xc in zip(_chunks(t, splits), _chunks(x, splits)):
+        for k, rec in enumerate(pyramid.add_samples(tc, xc)):
+            closed[k].append(rec)
+    for k, rec in enumerate(pyramid.flush()):
+        closed[k].append(rec)
+    for seconds, parts in zip((1, 10, 60), closed):
+        rec = np.concatenate(parts)
+        w = np.floor(t / seconds)
+        ids = np.unique(w)
+        np.testing.assert_array_equal(rec['t0'], ids * seconds)
+        np.testing.assert_array_equal(rec['count'], [np.sum(w == i) for i in ids])
+        for field, fn in (('min', np.min), ('max', np.max), ('mean', np.mean)):
+            ref = np.stack([fn(x[w == i], axis=0) for i in ids])
+            np.testing.assert_allclose(rec[field], ref, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,119 @@
+# Bộ phát hiện sự kiện chạy theo khối bằng NumPy phải cho đúng kết quả như vòng lặp từng mẫu:
+# trễ, chống dội nối qua ranh giới khối, lọc cạnh lên / xuống, held_ms
+import numpy as np
+import pytest
+
+from data_layout import DataLayout, ADC_LSB_VOLT
+from event_detector import ChannelRule, EventDetector
+from sample_block import SampleBlock
+
+LAYOUT = DataLayout((0, 1), (16, 16))
+ONE = DataLayout((0,), (16,))
+
+
+def _raw(volts):
+    return np.round(np.asarray(volts) / ADC_LSB_VOLT).astype(np.uint32)
+
+
+def _block(layout, ts, volts):
+    volts = np.asarray(volts, dtype=float).reshape(len(ts), -1)
+    return SampleBlock.from_raw(layout, ts, _raw(volts), 0.0)
+
+
+def _run(detector, layout, ts, volts, splits):
+    """Chạy detector qua các khối cắt tại splits; trả về (pressed nối lại, danh sách sự kiện)."""
+    pressed, events = [], []
+    for a, b in zip([0] + splits, splits + [len(ts)]):
+        block = _block(layout, ts[a:b], volts[a:b])
+        out = detector.process(block, period_ms=1.0)
+        pressed.append(block.pressed)
+        events += [(int(e['ts']), int(e['channel']), bool(e['active']), bool(e['rising']), int(e['held_ms']))
+                   for e in out]
+    return np.concatenate(pressed), events
+
+
+def _reference(rules, ts, volts):
+    """Vòng lặp từng mẫu (chậm, dễ đọc) làm chuẩn so sánh."""
+    volts = _raw(volts) * ADC_LSB_VOLT
+    pressed = np.zeros(volts.shape, dtype=bool)
+    events = []
+    state, raw = [None] * len(rules), [None] * len(rules)
+    run, last_edge = [0] * len(rules), [None] * len(rules)
+    for i in range(len(ts)):
+        for c, rule in enumerate(rules):
+            sign = -1.0 if rule.active_low else 1.0
+            enter = rule.threshold * sign
+            leave = enter - rule.hysteresis
+            debounce = max(1, int(round(rule.debounce_ms)))
+            x = volts[i, c] * sign
+            if state[c] is None:
+                state[c] = raw[c] = x > enter
+            r = True if x > enter else False if x <= leave else raw[c]
+            run[c] = 1 if r != raw[c] else run[c] + 1
+            raw[c] = r
+            if run[c] >= debounce and r != state[c]:
+                state[c] = r
+                held = 0 if last_edge[c] is None else int(ts[i]) - last_edge[c]
+                last_edge[c] = int(ts[i])
+                rising = r != rule.active_low
+                if rule.edges == "both" or rule.edges == ("rising" if rising else "falling"):
+                    events.append((int(ts[i]), c, r, rising, held))
+            pressed[i, c] = state[c]
+    return pressed, events
+
+
+@pytest.mark.parametrize("rules", [
+    (ChannelRule(), ChannelRule(threshold=1.0, active_low=False)),
+    (ChannelRule(hysteresis=0.1), ChannelRule(threshold=1.0, hysteresis=0.2, active_low=False)),
+    (ChannelRule(debounce_ms=4), ChannelRule(threshold=1.0, active_low=False, debounce_ms=7)),
+    (ChannelRule(hysteresis=0.1, debounce_ms=3, edges="rising"),
+     ChannelRule(threshold=1.0, hysteresis=0.15, active_low=False, debounce_ms=5, edges="falling")),
+])
+def test_matches_per_sample_reference(rules):
+    rng = np.random.default_rng(7)
+    n = 4000
+    ts = np.arange(n, dtype=np.uint32) + 10
+    # Sóng chậm quanh ngưỡng + nhiễu -> nhiều lần dội, nhiều mẫu nằm trong vùng trễ
+    wave = 0.3 * np.sin(2 * np.pi * np.arange(n) / np.array([[200.0], [330.0]])).T
+    volts = np.clip(np.array([0.6, 1.0]) + wave + rng.normal(0, 0.05, size=(n, 2)), 0.0, 2.0)
+    splits = sorted(rng.choice(np.arange(1, n), size=150, replace=False).tolist())
+    detector = EventDetector(rules={0: rules[0], 1: rules[1]})
+    pressed, events = _run(detector, LAYOUT, ts, volts, splits)
+    ref_pressed, ref_events = _reference(rules, ts, volts)
+    assert len(ref_events) > 20
+    np.testing.assert_array_equal(pressed, ref_pressed)
+    assert events == ref_events
+
+
+def test_debounce_run_spans_block_boundary():
+    detector = EventDetector(default=ChannelRule(debounce_ms=3))
+    ts = np.arange(8, dtype=np.uint32)
+    # Đoạn thấp dài 3 mẫu (ts 2..4) bị cắt ngang ở 2 ranh giới khối; đoạn thấp dài 1 mẫu (ts 6) bị bỏ
+    volts = [1.0, 1.0, 0.2, 0.2, 0.2, 1.0, 0.2, 1.0]
+    pressed, events = _run(detector, ONE, ts, volts, [3, 4])
+    assert events == [(4, 0, True, False, 0)]
+    assert pressed[:, 0].tolist() == [False] * 4 + [True] * 4
+
+
+def test_hysteresis_ignores_noise_inside_band():
+    detector = EventDetector(default=ChannelRule(threshold=0.6, hysteresis=0.1))
+    ts = np.arange(7, dtype=np.uint32)
+    # active_low: vào khi < 0.6 V, chỉ rời khi >= 0.7 V
+    volts = [1.0, 0.55, 0.65, 0.58, 0.69, 0.7, 0.65]
+    pressed, events = _run(detector, ONE, ts, volts, [2])
+    assert [e[:3] for e in events] == [(1, 0, True), (5, 0, False)]
+    assert pressed[:, 0].tolist() == [False, True, True, True, True, False, False]
+
+
+@pytest.mark.parametrize("edges, expected", [
+    ("both", [(2, True, False, 0), (5, False, True, 3), (9, True, False, 4)]),
+    ("rising", [(5, False, True, 3)]),
+    ("falling", [(2, True, False, 0), (9, True, False, 4)]),
+])
+def test_edge_filter_and_held_ms(edges, expected):
+    detector = EventDetector(default=ChannelRule(edges=edges))
+    ts = np.arange(10, dtype=np.uint32)
+    volts = [1.0, 1.0, 0.2, 0.2, 0.2, 1.0, 1.0, 1.0, 1.0, 0.2]
+    _, events = _run(detector, ONE, ts, volts, [3, 6])
+    # held_ms tính từ cạnh trước kể cả khi cạnh đó bị lọc khỏi kết quả
+    assert [(t, active, rising, held) for t, _, active, rising, held in events] == expected
@@ -0,0 +1,58 @@
+# Bảng điều phối: subscriber lỗi không làm mất frame của subscriber khác; loại frame tự khai báo
+# không được vượt sức chứa bộ đệm parser (nếu không feed() kẹt mãi ở frame không bao giờ đủ)
+import time
+
+import pytest
+
+from data_layout import DataLayout, DeviceStatus
+from frame_dispatch import FrameDispatcher
+from frame_parser import FrameParser, build_frame, TYPE_STATUS, HEADER_LEN, CRC_LEN
+
+TYPE_CUSTOM = 0x40
+
+
+@pytest.mark.parametrize("decode", [None, bytes])
+@pytest.mark.parametrize("timing", [False, True])
+def test_failing_subscriber_isolated(decode, timing, fail):
+    dispatcher = FrameDispatcher()
+    dispatcher.register(TYPE_CUSTOM, "CUSTOM", decode)
+    seen = []
+    dispatcher.subscribe(TYPE_CUSTOM, fail)
+    dispatcher.subscribe(TYPE_CUSTOM, seen.append)
+    dispatcher.set_timing(timing)
+    with pytest.raises(RuntimeError):
+        dispatcher.dispatch(TYPE_CUSTOM, b'abc')
+    assert seen == [b'abc']
+    assert dispatcher.stats()["CUSTOM"]["errors"] == 1
+
+
+def test_host_status_subscriber_error_keeps_internal_handler(host, fail):
+    host.subscribe_frame(TYPE_STATUS, fail)
+    layout = DataLayout((0, 1), (16, 16))
+    host._handle_bytes(build_frame(TYPE_STATUS, DeviceStatus.from_layout(layout).to_payload()),
+                       time.perf_counter())
+    assert host.layout.key() == layout.key()
+    assert host.process_errors == 1
+
+
+def test_register_frame_type_rejects_oversize_len(host):
+    limit = host.parser.payload_capacity
+    with pytest.raises(ValueError):
+        host.register_frame_type(TYPE_CUSTOM, "CUSTOM", limit + 1)
+    with pytest.raises(ValueError):
+        host.register_frame_type(TYPE_CUSTOM, "CUSTOM", 0x10000)
+    with pytest.raises(ValueError):
+        host.register_frame_type(0x100, "CUSTOM", 16)
+    assert TYPE_CUSTOM not in host.parser.max_payload_len
+
+
+def test_register_frame_type_at_capacity_parses(host):
+    host.parser = FrameParser(capacity=HEADER_LEN + 300 + CRC_LEN)
+    limit = host.parser.payload_capacity
+    assert limit == 300
+    host.register_frame_type(TYPE_CUSTOM, "CUSTOM", limit)
+    seen = []
+    host.subscribe_frame(TYPE_CUSTOM, lambda payload: seen.append(bytes(payload)))
+    payload = bytes(range(256)) + bytes(44)
+    host._handle_bytes(build_frame(TYPE_CUSTOM, payload) * 2, time.perf_counter())
+    assert seen == [payload, payload]
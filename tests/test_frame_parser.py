@@ -0,0 +1,89 @@
+# Kiểm thử FrameParser: tách frame qua nhiều lần feed, dò lại SOF, bỏ frame sai CRC / Len
+import struct
+
+from frame_parser import (FrameParser, build_frame, HEADER_LEN, CRC_LEN,
+                          TYPE_ACK, TYPE_DATA, TYPE_ERROR, TYPE_STATUS)
+
+
+def _collect(parser, chunks):
+    return [(t, bytes(p)) for chunk in chunks for t, p in parser.feed(chunk)]
+
+
+def _frames():
+    return [
+        (TYPE_DATA, struct.pack('<IH', 1000, 1234)),
+        (TYPE_ACK, bytes([0x10, 7, 0])),
+        (TYPE_STATUS, bytes(range(144))),
+        (TYPE_ERROR, bytes(7)),
+        (TYPE_DATA, struct.pack('<IH', 1001, 4321)),
+    ]
+
+
+def test_whole_stream():
+    frames = _frames()
+    stream = b''.join(build_frame(t, p) for t, p in frames)
+    parser = FrameParser()
+    assert _collect(parser, [stream]) == frames
+    assert parser.frames_ok == len(frames)
+    assert parser.crc_errors == parser.resync_bytes == 0
+
+
+def test_byte_by_byte_and_partial_frames():
+    frames = _frames()
+    stream = b''.join(build_frame(t, p) for t, p in frames)
+    parser = FrameParser()
+    assert _collect(parser, [stream[i:i + 1] for i in range(len(stream))]) == frames
+    # Cắt ở vị trí lẻ: frame dở dang phải chờ đủ byte
+    parser = FrameParser()
+    assert _collect(parser, [stream[:5], stream[5:13], stream[13:200], stream[200:]]) == frames
+    assert parser.backlog == 0
+
+
+def test_garbage_before_and_between_frames():
+    frame = build_frame(TYPE_ACK, bytes([1, 2, 0]))
+    parser = FrameParser()
+    out = _collect(parser, [b'\x00\x11\xA5' + frame + b'\xFF\xA5\x5A' + frame])
+    assert out == [(TYPE_ACK, bytes([1, 2, 0]))] * 2
+    assert parser.resync_bytes > 0
+
+
+def test_crc_error_drops_only_that_frame():
+    good = build_frame(TYPE_ACK, bytes([1, 1, 0]))
+    bad = bytearray(build_frame(TYPE_ACK, bytes([2, 2, 0])))
+    bad[-1] ^= 0xFF
+    parser = FrameParser()
+    out = _collect(parser, [good + bytes(bad) + good])
+    assert out == [(TYPE_ACK, bytes([1, 1, 0]))] * 2
+    assert parser.crc_errors == 1
+
+
+def test_oversize_len_is_resynced_not_waited_for():
+    # SOF giả với Len vượt mức của loại frame: không được chờ đủ 64 KB
+    fake = b'\xA5\x5A\x01' + bytes([TYPE_ACK]) + struct.pack('<H', 5000)
+    good = build_frame(TYPE_ACK, bytes([3, 3, 0]))
+    parser = FrameParser()
+    assert _collect(parser, [fake + good]) == [(TYPE_ACK, bytes([3, 3, 0]))]
+    assert parser.oversize_frames == 1
+
+
+def test_compaction_keeps_partial_frame():
+    # Bộ đệm nhỏ buộc phải dồn dữ liệu về đầu nhiều lần
+    frame = build_frame(TYPE_DATA, struct.pack('<I', 5) + bytes(128))
+    parser = FrameParser(capacity=HEADER_LEN + 144 + CRC_LEN + 20)
+    stream = frame * 50
+    out = _collect(parser, [stream[i:i + 97] for i in range(0, len(stream), 97)])
+    assert len(out) == 50
+    assert parser.crc_errors == 0
+
+
+def test_frame_offset_and_reset():
+    frame = build_frame(TYPE_ACK, bytes([1, 1, 0]))
+    parser = FrameParser()
+    offsets = []
+    for _ in parser.feed(b'\x00\x00' + frame + frame):
+        offsets.append(parser.frame_offset)
+    assert offsets == [2, 2 + len(frame)]
+    parser.reset()
+    assert _collect(parser, [frame[:4]]) == []
+    parser.reset()
+    assert _collect(parser, [frame]) == [(TYPE_ACK, bytes([1, 1, 0]))]
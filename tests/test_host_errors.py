@@ -0,0 +1,97 @@
+# Luồng đọc phải sống sót khi consumer / bộ phát hiện / giải mã lỗi (lỗi được đếm vào process_errors)
+import struct
+import time
+
+import giao_tiep_protocol
+from data_layout import DataLayout, DeviceStatus
+from frame_parser import build_frame, TYPE_DATA, TYPE_ERROR, TYPE_STATUS
+
+LAYOUT = DataLayout((0, 1), (16, 16))
+
+
+def _data(n_frames, ts0=0):
+    return b''.join(build_frame(TYPE_DATA, struct.pack('<IHH', ts0 + i, 1000, 60000)) for i in range(n_frames))
+
+
+def _stream(n_frames):
+    return build_frame(TYPE_STATUS, DeviceStatus.from_layout(LAYOUT).to_payload()) + _data(n_frames)
+
+
+def test_block_consumer_error_isolated(host, fail):
+    seen = []
+    host.add_block_consumer(fail)
+    host.add_block_consumer(lambda block: seen.append(len(block)))
+    host._handle_bytes(_stream(10), time.perf_counter())
+    host._handle_bytes(_data(5, ts0=10), time.perf_counter())
+    assert sum(seen) == 15
+    assert host.process_errors == 2
+
+
+def test_detector_error_does_not_block_consumers(host, fail):
+    seen = []
+    host.detector.process = fail
+    host.add_block_consumer(lambda block: seen.append(len(block)))
+    host._handle_bytes(_stream(8), time.perf_counter())
+    assert seen == [8]
+    assert host.process_errors == 1
+
+
+def test_decode_error_discards_batch(monkeypatch, host, fail):
+    seen = []
+    host.add_block_consumer(lambda block: seen.append(len(block)))
+    decode_block = giao_tiep_protocol.decode_block
+    monkeypatch.setattr(giao_tiep_protocol, "decode_block", fail)
+    host._handle_bytes(_stream(4), time.perf_counter())
+    assert host.process_errors == 1
+    assert host._batch_frames == 0 and not host._batch
+    monkeypatch.setattr(giao_tiep_protocol, "decode_block", decode_block)
+    host._handle_bytes(_data(3, ts0=4), time.perf_counter())
+    assert seen == [3]
+
+
+def test_event_consumer_error_isolated(host, fail):
+    seen = []
+    host.add_event_consumer(fail)
+    host.add_event_consumer(seen.append)
+    host._handle_bytes(_stream(2) + build_frame(TYPE_ERROR, bytes(7)), time.perf_counter())
+    assert host.process_errors == 1
+    assert len(seen) == 1 and host.device_errors
+
+
+class _BrokenCapture:
+    def write(self, data, t):
+        raise OSError("dia day")
+
+
+def test_capture_error_does_not_stop_parsing(host):
+    host.capture = _BrokenCapture()
+    seen = []
+    host.add_block_consumer(lambda block: seen.append(len(block)))
+    host._handle_bytes(_stream(4), time.perf_counter())
+    assert seen == [4]
+    assert host.process_errors == 1
+
+
+class _FakeSerial:
+    """Trả về 3 lần đọc rồi dừng vòng đọc của host."""
+
+    def __init__(self, host):
+        self.host = host
+        self.reads = 0
+        self.in_waiting = 1
+
+    def read(self, n):
+        self.reads += 1
+        if self.reads >= 3:
+            self.host.running = False
+        return b'\x00'
+
+
+def test_reader_loop_survives_unexpected_error(host, fail):
+    host._log = lambda msg: None
+    host.ser = _FakeSerial(host)
+    host._handle_bytes = fail
+    host.running = True
+    host._reader_loop()
+    assert host.ser.reads == 3
+    assert host.process_errors == 3
@@ -0,0 +1,66 @@
+# Luồng ghi nền: lỗi flush chỉ đếm (không làm chết luồng ghi), stop() không treo khi hàng đợi đầy
+import threading
+import time
+
+import recorder
+from recorder import BlockRecorder
+
+
+class _Sink:
+    filename = "mem"
+
+    def __init__(self, flush_error=None, delay=0.0):
+        self.flush_error = flush_error
+        self.delay = delay
+        self.blocks = []
+        self.closed = False
+
+    def write_block(self, block):
+        time.sleep(self.delay)
+        self.blocks.append(block)
+
+    def flush(self):
+        if self.flush_error is not None:
+            raise self.flush_error
+
+    def close(self):
+        self.closed = True
+
+
+def test_flush_error_counted_and_writer_keeps_running():
+    sink = _Sink(flush_error=OSError(28, "No space left on device"))
+    rec = BlockRecorder(sink, flush_interval=0.01).start()
+    rec.submit([1, 2])
+    time.sleep(0.05)
+    assert rec._thread.is_alive()
+    rec.submit([3])
+    rec.stop()
+    assert sink.blocks == [[1, 2], [3]]
+    assert rec.written_frames == 3
+    assert rec.write_errors >= 2
+    assert sink.closed
+
+
+def test_stop_with_full_queue_waits_for_writer():
+    sink = _Sink(delay=0.01)
+    rec = BlockRecorder(sink, queue_size=4).start()
+    accepted = sum(rec.submit([k]) for k in range(20))
+    rec.stop()
+    assert len(sink.blocks) == accepted
+    assert rec.dropped_blocks == 20 - accepted
+
+
+def test_stop_with_full_queue_and_dead_writer_returns(monkeypatch):
+    monkeypatch.setattr(recorder, "STOP_POLL_INTERVAL", 0.01)
+    sink = _Sink()
+    rec = BlockRecorder(sink, queue_size=2)
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    rec._thread = dead          # luồng ghi đã chết ngoài dự kiến
+    rec.submit([1])
+    rec.submit([2])
+    t0 = time.perf_counter()
+    rec.stop()
+    assert time.perf_counter() - t0 < 1.0
+    assert sink.closed
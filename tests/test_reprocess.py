@@ -0,0 +1,91 @@
+# Xử lý lại theo đoạn nhỏ phải cho đúng kết quả như tách tuần tự cả luồng (frame vắt qua ranh giới,
+# STATUS đổi bố cục giữa chừng, rác xen giữa), với 1 hoặc nhiều tiến trình
+import csv
+import struct
+
+import numpy as np
+import pytest
+
+import reprocess
+from data_layout import DataLayout, DeviceStatus
+from frame_parser import build_frame, TYPE_DATA, TYPE_STATUS
+from session_file import SessionReader
+from wire_capture import CaptureWriter
+
+LAYOUT = DataLayout((0, 1), (16, 16))
+N_LEGACY = 300
+N_MULTI = 700
+
+
+def _stream():
+    legacy = b''.join(build_frame(TYPE_DATA, struct.pack('<IH', i, i * 7 % 65536))
+                      for i in range(N_LEGACY))
+    status = build_frame(TYPE_STATUS, DeviceStatus.from_layout(LAYOUT).to_payload())
+    multi = [build_frame(TYPE_DATA, struct.pack('<IHH', 1000 + i, i, 65535 - i)) for i in range(N_MULTI)]
+    multi.insert(200, b'\xA5\x5A\x01\xFF garbage')
+    return legacy + status + b''.join(multi)
+
+
+def _write_capture(path, stream, chunk=97):
+    writer = CaptureWriter(str(path), start_time=100.0)
+    for k, i in enumerate(range(0, len(stream), chunk)):
+        writer.write(stream[i:i + chunk], 100.0 + k * 0.001)
+    writer.close()
+
+
+@pytest.fixture
+def capture(tmp_path, monkeypatch):
+    # Đoạn rất nhỏ -> nhiều ranh giới cắt ngang frame / STATUS
+    monkeypatch.setattr(reprocess, "TASK_BYTES", 1000)
+    monkeypatch.setattr(reprocess, "SESSION_RECORDS_PER_TASK", 128)
+    path = tmp_path / "cap.bmcap"
+    _write_capture(path, _stream())
+    return path
+
+
+def test_last_status_needs_valid_crc():
+    status = build_frame(TYPE_STATUS, DeviceStatus.from_layout(LAYOUT).to_payload())
+    broken = bytearray(status)
+    broken[-1] ^= 0xFF
+    data = status + bytes(broken)
+    assert reprocess.last_status(data, len(data)) == status[6:-2]
+    assert reprocess.last_status(bytes(broken), len(broken)) is None
+    assert reprocess.last_status(data, 0) is None
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_capture_to_session_parts(capture, tmp_path, workers):
+    files, stats = reprocess.reprocess(str(capture), str(tmp_path / "out.bms"), workers)
+    assert [f.rsplit('/', 1)[-1] for f in files] == ["out.bms", "out_part2.bms"]
+    assert stats["frames"] == N_LEGACY + N_MULTI
+    assert stats["layout_mismatches"] == 0
+    with SessionReader(files[0]) as reader:
+        assert reader.layout.n_channels == 1
+        np.testing.assert_array_equal(reader.timestamps, np.arange(N_LEGACY))
+        np.testing.assert_array_equal(reader.raw[:, 0], np.arange(N_LEGACY) * 7 % 65536)
+        assert np.all(np.diff(reader.pc_time) >= 0)
+    with SessionReader(files[1]) as reader:
+        assert reader.layout.key() == LAYOUT.key()
+        np.testing.assert_array_equal(reader.timestamps, 1000 + np.arange(N_MULTI))
+        np.testing.assert_array_equal(reader.raw[:, 1], 65535 - np.arange(N_MULTI))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_capture_to_csv_matches_session(capture, tmp_path, workers):
+    files, _ = reprocess.reprocess(str(capture), str(tmp_path / "out.csv"), workers)
+    assert len(files) == 2
+    with open(files[1], newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0][:2] == ["Timestamp_MCU_ms", "ADC_Raw_CH0"]
+    assert len(rows) == N_MULTI + 1
+    assert [int(r[0]) for r in rows[1:]] == list(range(1000, 1000 + N_MULTI))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_session_to_csv_in_workers(capture, tmp_path, workers):
+    files, _ = reprocess.reprocess(str(capture), str(tmp_path / "out.bms"), 1)
+    out, stats = reprocess.reprocess(files[1], str(tmp_path / "again.csv"), workers)
+    assert stats["frames"] == N_MULTI
+    with open(out[0], newline='') as f:
+        rows = list(csv.reader(f))
+    assert [int(r[1]) for r in rows[1:]] == list(range(N_MULTI))
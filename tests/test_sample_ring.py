@@ -0,0 +1,123 @@
+# Bộ đệm vòng seqlock: latest / RingReader.read đúng mẫu khi vắt qua cuối vòng, view không copy khi
+# liền mạch và copy khi vắt qua, phát hiện ghi đè (overrun) thay vì trả dữ liệu hỏng
+import numpy as np
+import pytest
+
+from data_layout import DataLayout
+from sample_block import SampleBlock
+from sample_ring import RingOverrun, RingReader, SampleRing
+
+LAYOUT = DataLayout((0, 1), (16, 16))
+CAP = 16
+
+
+class _Feed:
+    """Sinh khối liên tiếp: ts = số thứ tự mẫu, raw = (ts, 2 * ts), pc_time = ts / 1000."""
+
+    def __init__(self, ring, layout=LAYOUT):
+        self.ring = ring
+        self.layout = layout
+        self.next = 0
+
+    def write(self, n):
+        ts = np.arange(self.next, self.next + n)
+        raw = np.stack([ts, 2 * ts], axis=1)[:, :self.layout.n_channels]
+        self.ring.write_block(SampleBlock.from_raw(self.layout, ts, raw, ts / 1000.0))
+        self.next += n
+
+
+def _check(window, first, last):
+    expected = np.arange(first, last)
+    np.testing.assert_array_equal(window.timestamps, expected)
+    np.testing.assert_array_equal(window.raw[:, 0], expected)
+    np.testing.assert_allclose(window.pc_time, expected / 1000.0)
+
+
+def test_latest_view_and_copy_on_wrap():
+    ring = SampleRing(CAP)
+    feed = _Feed(ring)
+    feed.write(10)
+    window = ring.latest(4)
+    _check(window, 6, 10)
+    assert not window.copied and np.shares_memory(window.timestamps, ring.timestamps)
+    feed.write(27)                          # head = 37: 16 mẫu cuối nằm ở [5:16] + [0:5]
+    window = ring.latest(12)
+    _check(window, 25, 37)
+    assert window.copied and not np.shares_memory(window.timestamps, ring.timestamps)
+    assert window.valid()
+    _check(ring.latest(100), 37 - CAP, 37)
+    assert len(ring) == CAP
+
+
+def test_block_longer_than_ring_keeps_tail():
+    ring = SampleRing(CAP)
+    feed = _Feed(ring)
+    feed.write(5)
+    feed.write(3 * CAP + 7)
+    _check(ring.latest(CAP), feed.next - CAP, feed.next)
+
+
+def test_reader_follows_across_wraparound():
+    ring = SampleRing(CAP)
+    feed = _Feed(ring)
+    reader = RingReader(ring)
+    got = []
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        feed.write(int(rng.integers(1, CAP)))
+        window = reader.read()
+        got.append(window.copy()[0])
+        assert reader.check(window)
+    np.testing.assert_array_equal(np.concatenate(got), np.arange(feed.next))
+    assert reader.lost == 0 and reader.overruns == 0 and reader.pending == 0
+
+
+def test_reader_max_n_resumes_at_cursor():
+    ring = SampleRing(CAP)
+    feed = _Feed(ring)
+    reader = RingReader(ring, from_oldest=True)
+    feed.write(12)
+    _check(reader.read(5), 0, 5)
+    assert reader.pending == 7
+    feed.write(6)                           # ghi đè 0..1, cursor 5 vẫn còn
+    _check(reader.read(), 5, 18)
+    assert reader.lost == 0
+
+
+def test_overrun_before_read_counts_lost_samples():
+    ring = SampleRing(CAP)
+    feed = _Feed(ring)
+    reader = RingReader(ring)
+    feed.write(40)                          # reader ở 0, vòng chỉ còn 24..39
+    window = reader.read()
+    _check(window, 40 - CAP, 40)
+    assert reader.lost == 40 - CAP and reader.overruns == 1
+
+
+def test_overwrite_while_in_use_is_detected():
+    ring = SampleRing(CAP)
+    feed = _Feed(ring)
+    reader = RingReader(ring)
+    feed.write(10)
+    window = reader.read()
+    assert window.valid()
+    feed.write(8)                           # reserve = 18 > start + CAP -> mẫu 0..1 đã bị đè
+    assert not window.valid()
+    with pytest.raises(RingOverrun):
+        window.copy()
+    assert not reader.check(window)
+    assert reader.lost == 10 and reader.overruns == 1
+
+
+def test_layout_change_resets_reader():
+    ring = SampleRing(CAP)
+    feed = _Feed(ring)
+    feed.write(10)
+    reader = RingReader(ring, from_oldest=True)
+    old = reader.read()
+    one = _Feed(ring, DataLayout((3,), (16,)))
+    one.write(4)
+    assert not old.valid()
+    window = reader.read()
+    assert reader.resets == 1 and window.layout.channels == (3,)
+    _check(window, 0, 4)
@@ -0,0 +1,102 @@
+# Phát hiện mất / trùng / đảo / tràn 32-bit / MCU khởi động lại từ ts MCU, cả khối lớn (NumPy)
+# lẫn khối nhỏ (vòng Python) và chu kỳ < 1 ms
+import types
+
+import numpy as np
+import pytest
+
+from data_layout import LEGACY_LAYOUT
+from sample_timing import SampleTiming, TS_MODULO
+
+
+def _timing(rate_hz=1000):
+    timing = SampleTiming()
+    status = types.SimpleNamespace(samp_rate_map=[rate_hz] * 16)
+    timing.set_status(status, LEGACY_LAYOUT)
+    return timing
+
+
+def _ts(values):
+    return np.array(values, dtype=np.uint32)
+
+
+def _kinds(events):
+    return [(e.kind, e.ts_ms, e.count, e.delta_ms) for e in events]
+
+
+@pytest.mark.parametrize("n", [8, 100])
+def test_clean_stream_has_no_events(n):
+    timing = _timing()
+    for k in range(5):
+        events, pc_time = timing.check(_ts(np.arange(k * n, (k + 1) * n)), 100.0 + k)
+        assert events == []
+        assert len(pc_time) == n
+    assert timing.frames == 5 * n
+    assert timing.missing == timing.gaps == timing.duplicates == 0
+
+
+@pytest.mark.parametrize("n", [8, 100])
+def test_gap_counts_missing_samples(n):
+    timing = _timing()
+    timing.check(_ts(np.arange(n)), 100.0)
+    ts = np.arange(n, 2 * n)
+    ts[n // 2:] += 3          # thiếu 3 mẫu ở giữa khối
+    events, _ = timing.check(_ts(ts), 101.0)
+    assert _kinds(events) == [("gap", int(ts[n // 2]), 3, 4)]
+    assert timing.gaps == 1 and timing.missing == 3
+    # Khoảng giữa 2 khối cũng được kiểm tra
+    events, _ = timing.check(_ts([ts[-1] + 2]), 102.0)
+    assert _kinds(events) == [("gap", int(ts[-1] + 2), 1, 2)]
+
+
+def test_duplicate_and_reorder():
+    timing = _timing()
+    events, _ = timing.check(_ts([0, 1, 2, 2, 3, 5, 4, 6]), 100.0)
+    kinds = sorted(_kinds(events))
+    assert ("duplicate", 2, 1, 0) in kinds
+    assert ("reorder", 4, 1, -1) in kinds
+    assert timing.duplicates == 1 and timing.reorders == 1
+
+
+def test_u32_wrap_is_not_a_loss():
+    timing = _timing()
+    start = TS_MODULO - 50
+    ts = (np.arange(start, start + 100) % TS_MODULO)
+    events, pc_time = timing.check(_ts(ts[:40]), 100.0)
+    events2, pc_time2 = timing.check(_ts(ts[40:]), 100.1)
+    assert events == [] and events2 == []
+    assert timing.wraps == 1
+    # ts đã gỡ tràn: pc_time tiếp tục tăng đều trong từng khối, không nhảy lùi 2^32 ms
+    np.testing.assert_allclose(np.diff(pc_time2), 1e-3, rtol=1e-6)
+    assert 0 < pc_time2[0] - pc_time[-1] < 2e-3
+
+
+def test_mcu_reset_restarts_clock():
+    timing = _timing()
+    timing.check(_ts(np.arange(5000, 5050)), 100.0)
+    events, pc_time = timing.check(_ts(np.r_[5050:5060, 0:20]), 100.1)
+    assert _kinds(events)[0] == ("reset", 0, 1, -5059)
+    assert [e.name for e in events] == ["MCU_RESET"]
+    assert timing.resets == 1 and timing.clock.resets == 1
+    assert len(pc_time) == 30
+    # Sau reset tiếp tục kiểm tra bình thường trên dòng thời gian mới
+    events, _ = timing.check(_ts([25]), 100.2)
+    assert _kinds(events) == [("gap", 25, 5, 6)]
+
+
+def test_period_learned_without_samp_rate():
+    timing = _timing(rate_hz=0)
+    timing.check(_ts(np.arange(0, 40, 2)), 100.0)
+    assert timing.period == 2.0
+    events, _ = timing.check(_ts([40, 48]), 100.1)
+    assert _kinds(events) == [("gap", 48, 3, 8)]
+
+
+def test_sub_millisecond_period_counts_frames():
+    timing = _timing(rate_hz=4000)     # 4 frame / ms
+    ts = np.repeat(np.arange(100), 4)
+    events, _ = timing.check(_ts(ts), 100.0)
+    assert events == []
+    events, _ = timing.check(_ts(np.repeat(np.arange(100, 200), 2)), 100.1)   # mất 1/2 số frame
+    assert [e.kind for e in events] == ["gap"]
+    assert timing.missing >= 190
@@ -0,0 +1,113 @@
+# Chỉ mục thưa + chỉ mục sự kiện: offset trỏ đúng đầu dòng / record, sự kiện đúng record, đọc lại theo
+# khoảng thời gian cho đúng các mẫu (CSV và .bms)
+import numpy as np
+import pytest
+
+from data_layout import DataLayout, DeviceError
+from recorder import CsvSink
+from sample_block import SampleBlock, ADC_LSB_VOLT
+from session_file import SessionWriter
+from session_index import IndexedSink, SessionIndex, build_index, EV_PRESS, EV_RELEASE, EV_DEVICE_ERROR
+
+LAYOUT = DataLayout((0, 1), (16, 16))
+BLOCK = 300
+N_BLOCKS = 6
+EVERY = 256
+T0 = 1_700_000_000.0
+LOW, HIGH = 1000, 60000          # LOW < ngưỡng (DA AN), HIGH > ngưỡng
+
+
+def _blocks():
+    blocks = []
+    for k in range(N_BLOCKS):
+        ts = np.arange(k * BLOCK, (k + 1) * BLOCK)
+        raw = np.full((BLOCK, 2), HIGH)
+        raw[(ts // 100) % 2 == 1, 0] = LOW      # kênh 0: ấn / thả mỗi 100 mẫu
+        blocks.append(SampleBlock.from_raw(LAYOUT, ts, raw, T0 + ts * 1e-3))
+    return blocks
+
+
+@pytest.fixture(params=[".csv", ".bms"])
+def session(request, tmp_path):
+    path = str(tmp_path / ("data" + request.param))
+    sink = CsvSink(path, LAYOUT) if request.param == ".csv" else SessionWriter(path, LAYOUT)
+    indexed = IndexedSink(sink, every=EVERY)
+    for k, block in enumerate(_blocks()):
+        indexed.write_block(block)
+        if k == 2:
+            indexed.write_event(DeviceError(0, 7, 3))
+    indexed.close()
+    return path
+
+
+def test_csv_offsets_point_at_record_lines(tmp_path):
+    path = str(tmp_path / "data.csv")
+    indexed = IndexedSink(CsvSink(path, LAYOUT), every=EVERY)
+    for block in _blocks():
+        indexed.write_block(block)
+    indexed.close()
+    with open(path, 'rb') as f:
+        data = f.read()
+    with SessionIndex(path) as index:
+        entries = index.entries
+    assert len(entries) == N_BLOCKS
+    for entry in entries:
+        offset = int(entry['offset'])
+        assert data[offset - 1:offset] == b'\n'
+        line = data[offset:data.index(b'\n', offset)]
+        assert int(line.split(b',')[0]) == entry['ts'] == entry['record']
+
+
+def test_sink_tell_matches_file_size(tmp_path):
+    path = str(tmp_path / "data.csv")
+    sink = CsvSink(path, LAYOUT)
+    for block in _blocks()[:2]:
+        sink.write_block(block)
+    records, offset = sink.tell()
+    sink.close()
+    with open(path, 'rb') as f:
+        assert offset == len(f.read())
+    assert records == 2 * BLOCK
+
+
+def test_events_recorded_at_sample_records(session):
+    with SessionIndex(session) as index:
+        ev = index.events
+    press = ev[ev['kind'] == EV_PRESS]
+    release = ev[ev['kind'] == EV_RELEASE]
+    np.testing.assert_array_equal(press['record'], np.arange(100, N_BLOCKS * BLOCK, 200))
+    np.testing.assert_array_equal(release['record'], np.arange(200, N_BLOCKS * BLOCK, 200))
+    assert np.all(press['channel'] == 0)
+    np.testing.assert_allclose(press['value'], LOW * ADC_LSB_VOLT, rtol=1e-6)
+    error = ev[ev['kind'] == EV_DEVICE_ERROR]
+    assert len(error) == 1
+    assert error['record'][0] == 3 * BLOCK and error['code'][0] == 7
+    assert error['ts'][0] == 3 * BLOCK - 1
+
+
+def test_read_time_range(session):
+    with SessionIndex(session) as index:
+        block = index.read(T0 + 0.5005, T0 + 1.2)
+        np.testing.assert_array_equal(block.timestamps, np.arange(501, 1201))
+        assert block.raw[block.timestamps == 750, 0][0] == LOW
+        by_ts = index.read(250, 260, field='ts')
+        np.testing.assert_array_equal(by_ts.timestamps, np.arange(250, 261))
+        tail = index.read(T0 + 1.79, T0 + 10)
+        assert tail.timestamps[-1] == N_BLOCKS * BLOCK - 1
+
+
+def test_legacy_csv_with_status_columns(tmp_path):
+    # File CSV cũ còn cột Status_CHn: vị trí cột ADC lấy theo header của file, không theo csv_header()
+    path = str(tmp_path / "data_2025-12-25_19-52-03.csv")
+    with open(path, 'w', newline='') as f:
+        f.write("Timestamp_MCU_ms,ADC_Raw_CH0,Voltage_V_CH0,Status_CH0,"
+                "ADC_Raw_CH1,Voltage_V_CH1,Status_CH1,PC_Time\r\n")
+        for ts in range(600):
+            low = (ts // 100) % 2 == 1
+            f.write(f"{ts},{LOW if low else HIGH},0,{'DA AN' if low else 'THA LONG'},{ts + 7},0,THA LONG,"
+                    f"19:52:{3 + ts * 1e-3:06.3f}\r\n")
+    build_index(path, every=EVERY)
+    with SessionIndex(path) as index:
+        block = index.read(250, 260, field='ts')
+        np.testing.assert_array_equal(block.raw[:, 1], np.arange(257, 268))
+        assert len(index.find_events(EV_PRESS, channel=0)) == 3
@@ -0,0 +1,149 @@
+# Phiên chia segment: sang segment mới theo dung lượng, nén nền không chặn close(), manifest hoàn tất
+# khi nén xong, đọc lại xuyên segment (kể cả phiên ghi qua host từ thiết bị giả lập)
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import session_segments
+from data_layout import DataLayout
+from sample_block import SampleBlock
+from session_segments import SegmentedSink, SegmentedSession, manifest_path
+
+LAYOUT = DataLayout((0, 1), (16, 16))
+BLOCK = 200
+N_BLOCKS = 10
+T0 = 1_700_000_000.0
+
+
+def _blocks():
+    for k in range(N_BLOCKS):
+        ts = np.arange(k * BLOCK, (k + 1) * BLOCK)
+        raw = np.stack([50000 + ts % 4096, 60000 - ts % 100], axis=1)
+        raw[(ts // 150) % 2 == 1, 0] = 1000     # kênh 0 ấn / thả mỗi 150 mẫu (vắt qua segment)
+        yield SampleBlock.from_raw(LAYOUT, ts, raw, T0 + ts * 1e-3)
+
+
+def _manifest(sink):
+    with open(sink.manifest_path) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "bin"])
+@pytest.mark.parametrize("compress", [None, "gzip"])
+def test_rotation_and_readback(tmp_path, fmt, compress):
+    name = str(tmp_path / ("s.bms" if fmt == "bin" else "s.csv"))
+    sink = SegmentedSink(name, LAYOUT, fmt=fmt, max_bytes=8000, compress=compress)
+    for block in _blocks():
+        sink.write_block(block)
+    sink.close()
+    assert sink.wait(10)
+    manifest = _manifest(sink)
+    assert manifest["complete"]
+    segments = manifest["segments"]
+    assert len(segments) > 2
+    assert sum(seg["records"] for seg in segments) == N_BLOCKS * BLOCK
+    assert [seg["first_record"] for seg in segments] == \
+        list(np.cumsum([0] + [seg["records"] for seg in segments[:-1]]))
+    for seg in segments:
+        assert not seg["open"]
+        assert seg["compression"] == compress
+        assert os.path.exists(tmp_path / seg["stored"])
+
+    with SegmentedSession(name) as session:
+        assert len(session) == N_BLOCKS * BLOCK
+        block = session.read()
+        np.testing.assert_array_equal(block.timestamps, np.arange(N_BLOCKS * BLOCK))
+        np.testing.assert_array_equal(block.raw[:, 1], 60000 - block.timestamps % 100)
+        part = session.read(T0 + 0.4995, T0 + 1.2005)
+        np.testing.assert_array_equal(part.timestamps, np.arange(500, 1201))
+        # Cạnh ấn / thả được giữ nguyên qua ranh giới segment
+        events = session.events()
+        np.testing.assert_array_equal(np.sort(events['record']), np.arange(150, N_BLOCKS * BLOCK, 150))
+
+
+def test_close_does_not_wait_for_compression(tmp_path, monkeypatch):
+    release = threading.Event()
+    compress_file = session_segments.compress_file
+
+    def slow_compress(path, method="gzip", level=None):
+        release.wait(10)
+        return compress_file(path, method, level)
+
+    monkeypatch.setattr(session_segments, "compress_file", slow_compress)
+    sink = SegmentedSink(str(tmp_path / "s.csv"), LAYOUT, max_bytes=8000, compress="gzip")
+    for block in _blocks():
+        sink.write_block(block)
+    t0 = time.perf_counter()
+    sink.close()
+    assert time.perf_counter() - t0 < 1.0
+    assert not _manifest(sink)["complete"]
+    assert not sink.wait(0.05)
+    release.set()
+    assert sink.wait(10)
+    manifest = _manifest(sink)
+    assert manifest["complete"]
+    assert all(seg["compression"] == "gzip" for seg in manifest["segments"])
+
+
+def test_host_session_from_simulated_device(tmp_path, monkeypatch):
+    device_sim = pytest.importorskip("device_sim")
+    if not hasattr(os, "openpty"):
+        pytest.skip("can pty")
+    from giao_tiep_protocol import BiomechanicsHost
+
+    monkeypatch.chdir(tmp_path)
+    device = device_sim.SimulatedDevice(n_channels=4, rates=2000, bits=16)
+    host = BiomechanicsHost(device.port, 0)
+    host.echo = False
+    host.enable_segments(max_bytes=20000)
+    try:
+        with device._lock:
+            device._start_measure()
+        fd = device.slave
+        deadline = time.monotonic() + 0.6
+        started = False
+        while time.monotonic() < deadline:
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                data = b''
+            if data:
+                host._handle_bytes(data, time.perf_counter())
+            if not started and host.status is not None:
+                host.start_recording()
+                started = host.is_recording
+            time.sleep(0.005)
+        recorder = host.recorder
+        sink = recorder.sink
+        host.stop_recording()
+    finally:
+        device.close()
+    assert started
+    assert sink.wait(10)
+    stats = recorder.stats()
+    with SegmentedSession(manifest_path(sink.filename)) as session:
+        assert session.complete
+        assert len(session.segments) > 1
+        block = session.read()
+    assert len(block) == len(session) == stats["written_frames"] > 0
+    assert block.layout.n_channels == 4
+    # ts MCU tăng dần qua mọi segment
+    assert np.all(np.diff(block.timestamps.astype(np.int64)) >= 0)
+
+
+def test_host_records_single_file_by_default(tmp_path, monkeypatch):
+    from giao_tiep_protocol import BiomechanicsHost
+
+    monkeypatch.chdir(tmp_path)
+    host = BiomechanicsHost(None, 0)
+    host.echo = False
+    host.layout = LAYOUT
+    host.start_recording("bin")
+    recorder = host.recorder
+    host.stop_recording()
+    assert not isinstance(recorder.sink, SegmentedSink)
+    assert os.path.exists(host.filename) and not os.path.exists(manifest_path(host.filename))
@@ -0,0 +1,203 @@
+# ==============================================================================
+# GHI LẠI BYTE THÔ TỪ CỔNG COM (CAPTURE) VÀ PHÁT LẠI (REPLAY) KHÔNG CẦN PHẦN CỨNG
+# ==============================================================================
+# File capture (.bmcap):
+#   Header: Magic "BMCAP001" | StartTime f64
+#   Chunk : PC_Time f64 (giây epoch, lúc host nhận) | Len u32 | <Len byte thô>
+# ReplaySerial giả lập đủ các thuộc tính/hàm mà BiomechanicsHost dùng ở serial.Serial
+# (read, in_waiting, write, is_open, close...), nên cắm thẳng vào host.ser hoặc mở bằng
+# port "replay:<file>" / "replay-rt:<file>" (phát đúng nhịp thời gian gốc).
+#
+# Dòng lệnh (đo tốc độ xử lý offline):
+#   python wire_capture.py capture.bmcap
+import os
+import struct
+import sys
+import time
+
+CAPTURE_MAGIC = b'BMCAP001'
+CAPTURE_EXT = '.bmcap'
+_FILE_HEADER = struct.Struct('<8sd')
+_CHUNK_HEADER = struct.Struct('<dI')
+
+CAPTURE_BUFFER_SIZE = 1 << 20
+
+REPLAY_PREFIX = "replay:"
+REPLAY_REALTIME_PREFIX = "replay-rt:"
+
+
+class CaptureWriter:
+    """Ghi từng đoạn byte nhận được kèm thời điểm nhận (bộ đệm 1 MB, ghi đĩa rất thưa)."""
+
+    def __init__(self, filename, start_time=None):
+        self.filename = filename
+        self.chunks = 0
+        self.bytes = 0
+        self._file = open(filename, 'wb', buffering=CAPTURE_BUFFER_SIZE)
+        self._file.write(_FILE_HEADER.pack(CAPTURE_MAGIC, time.time() if start_time is None else start_time))
+
+    def write(self, data, pc_time):
+        self._file.write(_CHUNK_HEADER.pack(pc_time, len(data)))
+        self._file.write(data)
+        self.chunks += 1
+        self.bytes += len(data)
+
+    def close(self):
+        self._file.close()
+
+
+def read_capture(path):
+    """Đọc toàn bộ file capture -> (start_time, [(pc_time, memoryview)])."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    magic, start_time = _FILE_HEADER.unpack_from(content)
+    if magic != CAPTURE_MAGIC:
+        raise ValueError(f"Khong phai file capture: {magic!r}")
+    view = memoryview(content)
+    chunks = []
+    pos = _FILE_HEADER.size
+    total = len(content)
+    while pos + _CHUNK_HEADER.size <= total:
+        pc_time, length = _CHUNK_HEADER.unpack_from(content, pos)
+        pos += _CHUNK_HEADER.size
+        if pos + length > total:
+            break  # chunk cuối ghi dở
+        chunks.append((pc_time, view[pos:pos + length]))
+        pos += length
+    return start_time, chunks
+
+
+def iter_capture(path, buffer_size=CAPTURE_BUFFER_SIZE):
+    """Đọc dần file capture (không nạp cả file) -> sinh (pc_time, bytes) từng chunk."""
+    with open(path, 'rb', buffering=buffer_size) as f:
+        head = f.read(_FILE_HEADER.size)
+        if len(head) < _FILE_HEADER.size or _FILE_HEADER.unpack(head)[0] != CAPTURE_MAGIC:
+            raise ValueError(f"Khong phai file capture: {head[:8]!r}")
+        while True:
+            head = f.read(_CHUNK_HEADER.size)
+            if len(head) < _CHUNK_HEADER.size:
+                return
+            pc_time, length = _CHUNK_HEADER.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return  # chunk cuối ghi dở
+            yield pc_time, data
+
+
+def capture_stream(path):
+    """Nối toàn bộ byte thô trong file capture thành 1 bytes (bỏ mốc thời gian)."""
+    _, chunks = read_capture(path)
+    return b''.join(data for _, data in chunks)
+
+
+# ==============================================================================
+# REPLAY: GIẢ LẬP serial.Serial
+# ==============================================================================
+class ReplaySerial:
+    def __init__(self, path, realtime=False, speed=1.0, timeout=0.05):
+        self.port = path
+        self.baudrate = 0
+        self.timeout = timeout
+        self.realtime = realtime
+        self.speed = speed
+        self.start_time, self._chunks = read_capture(path)
+        self._index = 0
+        self._pending = memoryview(b'')
+        self._t0_wall = None
+        self._t0_capture = self._chunks[0][0] if self._chunks else 0.0
+        self.is_open = True
+        self.bytes_written = 0
+
+    @property
+    def eof(self):
+        return self._index >= len(self._chunks) and not self._pending
+
+    def _due(self, pc_time):
+        """Thời điểm (perf_counter) chunk được phép 'tới' khi phát đúng nhịp."""
+        return self._t0_wall + (pc_time - self._t0_capture) / self.speed
+
+    def _next_chunk(self, block):
+        if self._index >= len(self._chunks):
+            return False
+        pc_time, data = self._chunks[self._index]
+        if self.realtime:
+            if self._t0_wall is None:
+                self._t0_wall = time.perf_counter()
+            wait = self._due(pc_time) - time.perf_counter()
+            if wait > 0:
+                if not block:
+                    return False
+                time.sleep(min(wait, self.timeout) if self.timeout is not None else wait)
+                if self._due(pc_time) > time.perf_counter():
+                    return False
+        self._pending = data
+        self._index += 1
+        return True
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise OSError("Replay da dong")
+        if not self._pending:
+            self._next_chunk(block=False)
+        return len(self._pending)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise OSError("Replay da dong")
+        if not self._pending and not self._next_chunk(block=True):
+            if self.eof and self.timeout:
+                time.sleep(self.timeout)  # giống cổng thật: hết dữ liệu thì chờ hết timeout
+            return b''
+        out = self._pending[:size]
+        self._pending = self._pending[size:]
+        return bytes(out)
+
+    def write(self, data):
+        # Lệnh gửi xuống thiết bị khi replay chỉ được đếm, không có ai trả lời
+        self.bytes_written += len(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        self._pending = memoryview(b'')
+
+    def close(self):
+        self.is_open = False
+
+
+def open_replay_port(port):
+    """'replay:<file>' -> phát nhanh nhất có thể, 'replay-rt:<file>' -> đúng nhịp gốc."""
+    if port.startswith(REPLAY_REALTIME_PREFIX):
+        return ReplaySerial(port[len(REPLAY_REALTIME_PREFIX):], realtime=True)
+    if port.startswith(REPLAY_PREFIX):
+        return ReplaySerial(port[len(REPLAY_PREFIX):])
+    return None
+
+
+def replay_through(path, handle_bytes):
+    """Đẩy toàn bộ capture vào handle_bytes(data, t) nhanh nhất có thể. Trả về (bytes, giây)."""
+    _, chunks = read_capture(path)
+    perf_counter = time.perf_counter
+    total = 0
+    t0 = perf_counter()
+    for _, data in chunks:
+        handle_bytes(data, perf_counter())
+        total += len(data)
+    return total, perf_counter() - t0
+
+
+if __name__ == "__main__":
+    from giao_tiep_protocol import BiomechanicsHost
+
+    if len(sys.argv) < 2:
+        print("Cach dung: python wire_capture.py <file.bmcap>")
+        sys.exit(1)
+    host = BiomechanicsHost(REPLAY_PREFIX + sys.argv[1], 0)
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            n_bytes, elapsed = replay_through(sys.argv[1], host._handle_bytes)
+        finally:
+            sys.stdout = stdout
+    print(f"{n_bytes} byte trong {elapsed:.3f} s -> {n_bytes / elapsed / 1e6:.2f} MB/s | {host.get_link_stats()}")